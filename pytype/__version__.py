@@ -0,0 +1,2 @@
+# pylint: skip-file
+__version__ = "0.2"
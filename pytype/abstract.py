@@ -158,6 +158,7 @@ class AtomicAbstractValue(object):
     self.official_name = None
     self.template = ()
     self.late_annotations = {}
+    self._cached_fullhash = None
 
   @property
   def full_name(self):
@@ -176,9 +177,19 @@ class AtomicAbstractValue(object):
         [[self]] + [list(base.mro) for base in bases] + [list(bases)]))
 
   def get_fullhash(self):
-    """Hash this value and all of its children."""
+    """Hash this value and all of its children.
+
+    The hash is cached, and recomputed only after one of the dictionaries
+    reachable from this value has changed.
+
+    Returns:
+      A digest, as a str.
+    """
+    if self._cached_fullhash is not None:
+      return self._cached_fullhash
     m = hashlib.md5()
     seen_ids = set()
+    stamps = []
     stack = [self]
     while stack:
       data = stack.pop()
@@ -188,9 +199,20 @@ class AtomicAbstractValue(object):
       seen_ids.add(data_id)
       m.update(str(data_id))
       for mapping in data.get_children_maps():
+        stamps.append((mapping, mapping.changestamp))
         m.update(str(mapping.changestamp))
         stack.extend(mapping.data)
-    return m.digest()
+    fullhash = m.digest()
+    # Resolving lazy entries while walking the children can change a mapping
+    # we already hashed, in which case the result is stale right away.
+    if all(mapping.changestamp == stamp for mapping, stamp in stamps):
+      for mapping, _ in stamps:
+        mapping.watch(id(self), self._invalidate_fullhash)
+      self._cached_fullhash = fullhash
+    return fullhash
+
+  def _invalidate_fullhash(self):
+    self._cached_fullhash = None
 
   def get_children_maps(self):
     """Get this value's dictionaries of children.
@@ -684,6 +706,7 @@ class SimpleAbstractValue(AtomicAbstractValue):
     """Initialize the named type parameters to nothing (empty)."""
     self.type_parameters = utils.LazyAliasingMonitorDict(
         (name, self.vm.program.NewVariable()) for name in names)
+    self._invalidate_fullhash()
 
   def load_lazy_attribute(self, name):
     """Load the named attribute into self.members."""
@@ -1581,6 +1604,43 @@ class PyTDSignature(object):
         var = self.vm.convert.create_new_unsolvable(node)
         arg_dict[p.name] = var.bindings[0]
 
+  def accepts_arg_count(self, num_args):
+    """Can this signature be called with num_args positional arguments only?
+
+    Used by PyTDFunction to prune signatures that would raise WrongArgCount or
+    MissingParameter.
+
+    Args:
+      num_args: The number of positional arguments.
+
+    Returns:
+      True if the call doesn't fail because of the number of arguments.
+    """
+    param_names = self.signature.param_names
+    if num_args > len(param_names) and not self.pytd_sig.starargs:
+      return False
+    passed = set(param_names[:num_args])
+    return all(p.optional or p.name in passed for p in self.pytd_sig.params)
+
+  def may_accept_instance_of(self, position, classes):
+    """Can an instance of one of the classes be passed at this position?
+
+    Used by PyTDFunction to prune signatures before matching all arguments.
+
+    Args:
+      position: The index of a positional argument.
+      classes: A sequence of abstract.Class, the classes of the argument.
+
+    Returns:
+      False if matching the argument would certainly fail, True otherwise.
+    """
+    param_names = self.signature.param_names
+    if position >= len(param_names):
+      return True
+    formal = self.signature.annotations[param_names[position]]
+    return any(self.vm.matcher.may_match_instance_of(cls, formal)
+               for cls in classes)
+
   def match_args(self, node, args, view):
     """Match arguments against this signature. Used by PyTDFunction."""
     formal_args, arg_dict = self._map_args(args, view)
@@ -1795,6 +1855,11 @@ class PyTDFunction(Function):
     self.bound_class = BoundPyTDFunction
     self.signatures = signatures
     self._signature_cache = {}
+    # (number of positional args, classes of the dispatch argument) ->
+    # (signatures that might match, MROs of the classes).
+    # See _candidate_signatures.
+    self._dispatch_index = {}
+    self._dispatch_position = self._get_dispatch_position()
     self._return_types = {sig.pytd_sig.return_type for sig in signatures}
     self._has_mutable = any(param.mutated_type is not None
                             for sig in signatures
@@ -1942,21 +2007,89 @@ class PyTDFunction(Function):
                        result)
     return node, result, mutations
 
+  def _get_dispatch_position(self):
+    """The first positional argument whose annotation differs between sigs."""
+    num_params = max(len(sig.signature.param_names) for sig in self.signatures)
+    for i in range(num_params):
+      annotations = [sig.signature.annotations[sig.signature.param_names[i]]
+                     for sig in self.signatures
+                     if i < len(sig.signature.param_names)]
+      if any(a is not annotations[0] for a in annotations):
+        return i
+    return None
+
+  def _candidate_signatures(self, args, view):
+    """The signatures that might match the arguments, in order.
+
+    For calls with only positional arguments, this prunes the signatures that
+    take a different number of arguments, and the ones that don't accept the
+    classes of the argument at self._dispatch_position. The result is stored
+    in an index, so every combination is only checked once.
+
+    Args:
+      args: The passed arguments.
+      view: A variable->binding dictionary.
+
+    Returns:
+      A sequence of PyTDSignature.
+    """
+    if (len(self.signatures) == 1 or args.namedargs or args.starargs or
+        args.starstarargs):
+      return self.signatures
+    num_args = len(args.posargs)
+    classes = ()
+    position = self._dispatch_position
+    if position is not None and position < num_args:
+      data = view[args.posargs[position]].data
+      # Modules are instances too, but are matched by name.
+      if isinstance(data, Instance) and not isinstance(data, Module):
+        classes = tuple(data.get_class().data)
+        if not all(isinstance(cls, Class) and
+                   not isinstance(cls, ParameterizedClass) for cls in classes):
+          classes = ()
+    key = (num_args, classes)
+    entry = self._dispatch_index.get(key)
+    if entry is not None and all(
+        cls.mro is mro for cls, mro in zip(classes, entry[1])):
+      return entry[0]
+    candidates = tuple(
+        sig for sig in self.signatures
+        if sig.accepts_arg_count(num_args) and (
+            not classes or sig.may_accept_instance_of(position, classes)))
+    self._dispatch_index[key] = (candidates, tuple(cls.mro for cls in classes))
+    return candidates
+
   def _yield_matching_signatures(self, node, args, view):
     """Try, in order, all pytd signatures, yielding matches."""
-    error = None
+    candidates = self._candidate_signatures(args, view)
+    errors = {}
     matched = False
-    for sig in self.signatures:
+    for sig in candidates:
       try:
         arg_dict, subst = sig.match_args(node, args, view)
       except FailedFunctionCall as e:
-        if e > error:
-          error = e
+        errors[sig] = e
       else:
         matched = True
         yield sig, arg_dict, subst
     if not matched:
-      raise error  # pylint: disable=raising-bad-type
+      # Match the pruned signatures too, so that we report the same error as
+      # if we had tried all of them.
+      error = None
+      for sig in self.signatures:
+        if sig not in errors:
+          try:
+            arg_dict, subst = sig.match_args(node, args, view)
+          except FailedFunctionCall as e:
+            errors[sig] = e
+          else:
+            matched = True
+            yield sig, arg_dict, subst
+            continue
+        if errors[sig] > error:
+          error = errors[sig]
+      if not matched:
+        raise error  # pylint: disable=raising-bad-type
 
   def set_function_defaults(self, defaults_var):
     """Attempts to set default arguments for a function's signatures.
@@ -2000,6 +2133,7 @@ class PyTDFunction(Function):
           d = d[1:]
         new_sigs.append(sig.set_defaults(d))
     self.signatures = new_sigs
+    self._dispatch_index = {}
     # Update our parent's AST too, if we have a parent.
     # 'parent' is set by PyTDClass._convert_member
     if hasattr(self, "parent"):
@@ -2339,10 +2473,9 @@ class PyTDClass(SimpleAbstractValue, Class):
 
   def __init__(self, name, pytd_cls, vm):
     super(PyTDClass, self).__init__(name, vm)
-    mm = {}
-    for val in pytd_cls.constants + pytd_cls.methods:
-      mm[val.name] = val
-    self._member_map = mm
+    template = self.vm.convert.get_class_template(pytd_cls)
+    # set_function_defaults updates the member map, so make a copy.
+    self._member_map = dict(template.member_map)
     if pytd_cls.metaclass is None:
       metaclass = None
     else:
@@ -2353,9 +2486,7 @@ class PyTDClass(SimpleAbstractValue, Class):
     self.official_name = self.name
     self.template = self.pytd_cls.template
     Class.init_mixin(self, metaclass)
-    self.abstract_methods.extend(
-        name for name, member in self._member_map.items()
-        if isinstance(member, pytd.Function) and member.is_abstract)
+    self.abstract_methods.extend(template.abstract_methods)
     if len(self.mro) > 1 and isinstance(self.mro[1], Class):
       for name in self.mro[1].abstract_methods:
         try:
@@ -2609,8 +2740,6 @@ class InterpreterFunction(Function):
     vm: TypegraphVirtualMachine instance.
   """
 
-  _function_cache = {}
-
   @staticmethod
   def make_function(name, code, f_locals, f_globals, defaults, kw_defaults,
                     closure, annotations, late_annotations, vm):
@@ -2647,11 +2776,11 @@ class InterpreterFunction(Function):
                  for key, value in annotations.items()}, None),
                (dict(enumerate(defaults)), None),
                (dict(enumerate(closure or ())), None)))
-    if key not in InterpreterFunction._function_cache:
-      InterpreterFunction._function_cache[key] = InterpreterFunction(
+    if key not in vm.function_cache:
+      vm.function_cache[key] = InterpreterFunction(
           name, code, f_locals, f_globals, defaults, kw_defaults,
           closure, annotations, late_annotations, vm)
-    return InterpreterFunction._function_cache[key]
+    return vm.function_cache[key]
 
   @staticmethod
   def get_arg_count(code):
@@ -2924,6 +3053,7 @@ class InterpreterFunction(Function):
                  "record remaining_depth = %d",
                  self.name, self.vm.remaining_depth(), old_remaining_depth)
       else:
+        self.vm.trace_call_cache_hit(self)
         ret = self.vm.program.NewVariable(old_ret.data, [], node)
         if self._store_call_records:
           # Even if the call is cached, we might not have been recording it.
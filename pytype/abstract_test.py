@@ -79,6 +79,19 @@ class InstanceTest(AbstractTestBase):
     self.assertIs(True, i.compatible_with(True))
     self.assertIs(True, i.compatible_with(False))
 
+  def test_fullhash_cache(self):
+    i = abstract.Instance(self._vm.convert.object_type, self._vm)
+    child = abstract.Instance(self._vm.convert.object_type, self._vm)
+    i.members["x"] = child.to_variable(self._node)
+    fullhash = i.get_fullhash()
+    self.assertEqual(fullhash, i.get_fullhash())
+    # Modifying a child invalidates the hash of its parent.
+    child.members["y"] = self._vm.convert.none.to_variable(self._node)
+    new_fullhash = i.get_fullhash()
+    self.assertNotEqual(fullhash, new_fullhash)
+    i.members["x"].AddBinding(self._vm.convert.none, [], self._node)
+    self.assertNotEqual(new_fullhash, i.get_fullhash())
+
   def test_compatible_with_none(self):
     # This test is specifically for abstract.Instance, so we don't use
     # self._vm.convert.none, which is an AbstractOrConcreteValue.
@@ -434,7 +447,7 @@ class PyTDTest(AbstractTestBase):
 # TODO(rechen): Test InterpreterFunction.
 class FunctionTest(AbstractTestBase):
 
-  def _make_pytd_function(self, params):
+  def _make_pytd_signature(self, params):
     pytd_params = []
     for i, p in enumerate(params):
       p_type = pytd.ClassType(p.name)
@@ -443,7 +456,10 @@ class FunctionTest(AbstractTestBase):
           pytd.Parameter(function.argname(i), p_type, False, False, None))
     pytd_sig = pytd.Signature(
         tuple(pytd_params), None, None, pytd.AnythingType(), (), ())
-    sig = abstract.PyTDSignature("f", pytd_sig, self._vm)
+    return abstract.PyTDSignature("f", pytd_sig, self._vm)
+
+  def _make_pytd_function(self, params):
+    sig = self._make_pytd_signature(params)
     return abstract.PyTDFunction("f", (sig,), pytd.METHOD, self._vm)
 
   def _call_pytd_function(self, f, args):
@@ -496,6 +512,39 @@ class FunctionTest(AbstractTestBase):
     self.assertIs(node, self._vm.root_cfg_node)
     self.assertFalse(ret.bindings)
 
+  def test_dispatch_index(self):
+    str_cls = self._vm.lookup_builtin("__builtin__.str")
+    int_cls = self._vm.lookup_builtin("__builtin__.int")
+    sigs = (self._make_pytd_signature((str_cls,)),
+            self._make_pytd_signature((int_cls,)),
+            self._make_pytd_signature((str_cls, int_cls)))
+    f = abstract.PyTDFunction("f", sigs, pytd.METHOD, self._vm)
+    def candidates(*values):
+      args = tuple(v.to_variable(self._vm.root_cfg_node) for v in values)
+      view = {arg: arg.bindings[0] for arg in args}
+      return f._candidate_signatures(abstract.FunctionArgs(args), view)
+    str_instance = self._vm.convert.primitive_class_instances[str]
+    int_instance = self._vm.convert.primitive_class_instances[int]
+    self.assertSequenceEqual(candidates(str_instance), sigs[:1])
+    self.assertSequenceEqual(candidates(int_instance), sigs[1:2])
+    self.assertSequenceEqual(candidates(str_instance, int_instance), sigs[2:])
+    self.assertSequenceEqual(
+        candidates(self._vm.convert.unsolvable), sigs[:2])
+    node, _ = self._call_pytd_function(
+        f, (int_instance.to_variable(self._vm.root_cfg_node),))
+    self.assertIs(node, self._vm.root_cfg_node)
+
+  def test_dispatch_index_bad_arg(self):
+    str_cls = self._vm.lookup_builtin("__builtin__.str")
+    int_cls = self._vm.lookup_builtin("__builtin__.int")
+    sigs = (self._make_pytd_signature((str_cls,)),
+            self._make_pytd_signature((int_cls,)))
+    f = abstract.PyTDFunction("f", sigs, pytd.METHOD, self._vm)
+    arg = self._vm.convert.primitive_class_instances[float].to_variable(
+        self._vm.root_cfg_node)
+    self.assertRaises(
+        abstract.WrongArgTypes, self._call_pytd_function, f, (arg,))
+
   def test_signature_from_pytd(self):
     # def f(self: Any, *args: Any)
     self_param = pytd.Parameter("self", pytd.AnythingType(), False, False, None)
@@ -4,18 +4,30 @@ import logging
 
 from pytype import abstract
 from pytype import annotations_util
+from pytype import metrics
 from pytype import overlay
 from pytype import special_builtins
 from pytype.pytd import cfg as typegraph
 
 log = logging.getLogger(__name__)
 
+_mro_cache_metric = metrics.MapCounter("attribute_mro_cache")
+
 
 class AbstractAttributeHandler(object):
   """Handler for abstract attributes."""
 
   def __init__(self, vm):
     self.vm = vm
+    # Where names resolve in the MROs of PyTD classes. Keyed by object ids,
+    # since ParameterizedClass hashes its (possibly lazy) type parameters. The
+    # entries hold on to the objects, so the ids can't be reused.
+    # (id(cls), name, id(skip), valself is None) ->
+    #   (cls, cls.mro, defining base or None, raw member or None).
+    # See _find_in_mro.
+    self._mro_cache = {}
+    # The ids of the classes whose members the entries depend on.
+    self._mro_cache_classes = set()
 
   def get_attribute_generic(self, node, obj, name, val):
     if isinstance(obj, abstract.ParameterizedClass):
@@ -336,6 +348,53 @@ class AbstractAttributeHandler(object):
       variablecls = valcls.AssignToNewVariable(node)
       add_origins.append(valcls)
 
+    node, base, var = self._find_in_mro(node, obj, name, valself, skip)
+    if var is None:
+      return ret
+    for varval in var.bindings:
+      value = varval.data
+      if variableself or variablecls:
+        # Check if we got a PyTDFunction from an InterpreterClass. If so,
+        # then we must have aliased an imported function inside a class, so
+        # we shouldn't bind the function to the class.
+        if (not isinstance(value, abstract.PyTDFunction) or
+            not isinstance(base, abstract.InterpreterClass)):
+          value = value.property_get(variableself, variablecls)
+      ret.AddBinding(value, [varval] + add_origins, node)
+    return ret
+
+  def _find_in_mro(self, node, obj, name, valself, skip):
+    """Find the first class in the MRO that has the attribute.
+
+    Where a name resolves only depends on the members of the classes in the
+    MRO, so for PyTD classes, whose members are defined at the root node, the
+    result is cached until one of them gets a member set.
+
+    Args:
+      node: The current node.
+      obj: The class.
+      name: The name of the attribute.
+      valself: The object binding, or None.
+      skip: A class to skip in the MRO, for super(), or None.
+
+    Returns:
+      A tuple of the node, the class in the MRO that has the attribute, and the
+      attribute, filtered by the node. The last two are None if the attribute
+      was not found.
+    """
+    key = (id(obj), name, id(skip), valself is None)
+    entry = self._mro_cache.get(key)
+    if entry is not None and entry[1] is obj.mro:
+      _, _, base, raw = entry
+      if base is None:
+        _mro_cache_metric.inc("hit")
+        return node, None, None
+      if raw.Bindings(node):
+        _mro_cache_metric.inc("hit")
+        return node, base, self._filter_and_merge_candidates(node, [raw])
+    _mro_cache_metric.inc("miss")
+    cacheable = True
+    contributors = []
     for base in obj.mro:
       # Potentially skip start of MRO, for super()
       if base is skip:
@@ -346,20 +405,35 @@ class AbstractAttributeHandler(object):
       var = base.get_special_attribute(node, name, valself)
       if var is None:
         node, var = self._get_attribute_flat(node, base, name)
+        member_cls = self._get_pytd_member_class(base)
+        if member_cls is None:
+          cacheable = False
+        else:
+          contributors.append(member_cls)
+      else:
+        cacheable = False
       if var is None or not var.bindings:
+        if cacheable and name in contributors[-1].members:
+          # The attribute exists, but isn't visible at this node.
+          cacheable = False
         continue
-      for varval in var.bindings:
-        value = varval.data
-        if variableself or variablecls:
-          # Check if we got a PyTDFunction from an InterpreterClass. If so,
-          # then we must have aliased an imported function inside a class, so
-          # we shouldn't bind the function to the class.
-          if (not isinstance(value, abstract.PyTDFunction) or
-              not isinstance(base, abstract.InterpreterClass)):
-            value = value.property_get(variableself, variablecls)
-        ret.AddBinding(value, [varval] + add_origins, node)
-      break  # we found a class which has this attribute
-    return ret
+      if cacheable:
+        self._add_to_mro_cache(key, obj, base,
+                               contributors[-1].members[name], contributors)
+      return node, base, var
+    if cacheable:
+      self._add_to_mro_cache(key, obj, None, None, contributors)
+    return node, None, None
+
+  def _get_pytd_member_class(self, base):
+    """Get the PyTDClass that _get_attribute_flat takes the members of."""
+    if isinstance(base, abstract.ParameterizedClass):
+      base = base.base_cls
+    return base if isinstance(base, abstract.PyTDClass) else None
+
+  def _add_to_mro_cache(self, key, obj, base, raw, contributors):
+    self._mro_cache[key] = (obj, obj.mro, base, raw)
+    self._mro_cache_classes.update(id(cls) for cls in contributors)
 
   def _get_attribute_flat(self, node, obj, name):
     if isinstance(obj, abstract.ParameterizedClass):
@@ -462,6 +536,11 @@ class AbstractAttributeHandler(object):
       obj.set_function_defaults(var)
       return node
 
+    if id(obj) in self._mro_cache_classes:
+      # Lookups along the MROs that contain obj may now resolve differently.
+      self._mro_cache.clear()
+      self._mro_cache_classes.clear()
+
     if isinstance(obj, abstract.Instance) and name not in obj.members:
       # The previous value needs to be loaded at the root node so that
       # (1) it is overwritten by the current value and (2) it is still
@@ -2,9 +2,11 @@
 
 
 from pytype import abstract
+from pytype import attribute
 from pytype import config
 from pytype import errors
 from pytype import load_pytd
+from pytype import metrics
 from pytype import vm
 
 import unittest
@@ -49,6 +51,49 @@ class AttributeTest(unittest.TestCase):
     attr, = var.data
     self.assertIs(attr, self._vm.convert.primitive_class_instances[int])
 
+  def test_mro_cache(self):
+    metrics._prepare_for_test()
+    self.addCleanup(metrics._prepare_for_test, False)
+    counts = attribute._mro_cache_metric._counts
+    node = self._vm.root_cfg_node
+    handler = self._vm.attribute_handler
+    bool_type = self._vm.convert.primitive_classes[bool]
+    def lookup():
+      _, var = handler.get_attribute(node, bool_type, "real")
+      self.assertEqual(len(var.data), 1)
+      _, var = handler.get_attribute(node, bool_type, "rumpelstiltskin")
+      self.assertIsNone(var)
+    lookup()
+    hits, misses = counts.get("hit", 0), counts.get("miss", 0)
+    lookup()
+    self.assertGreater(counts.get("hit", 0), hits)
+    self.assertEqual(misses, counts.get("miss", 0))
+
+  def test_mro_cache_set_attribute(self):
+    node = self._vm.root_cfg_node
+    handler = self._vm.attribute_handler
+    bool_type = self._vm.convert.primitive_classes[bool]
+    _, var = handler.get_attribute(node, bool_type, "rumpelstiltskin")
+    self.assertIsNone(var)
+    value = self._vm.convert.none.to_variable(node)
+    handler.set_attribute(node, self._vm.convert.int_type, "rumpelstiltskin",
+                          value)
+    _, var = handler.get_attribute(node, bool_type, "rumpelstiltskin")
+    self.assertEqual(var.data, [self._vm.convert.none])
+
+  def test_mro_cache_visibility(self):
+    node1 = self._vm.root_cfg_node.ConnectNew("n1")
+    node2 = node1.ConnectNew("n2")
+    handler = self._vm.attribute_handler
+    bool_type = self._vm.convert.primitive_classes[bool]
+    value = self._vm.convert.none.to_variable(node2)
+    handler.set_attribute(node2, self._vm.convert.int_type, "rumpelstiltskin",
+                          value)
+    _, var = handler.get_attribute(node2, bool_type, "rumpelstiltskin")
+    self.assertEqual(var.data, [self._vm.convert.none])
+    _, var = handler.get_attribute(node1, bool_type, "rumpelstiltskin")
+    self.assertIsNone(var)
+
 
 if __name__ == "__main__":
   unittest.main()
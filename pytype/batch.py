@@ -0,0 +1,536 @@
+"""Run pytype over many files, in the order of their imports.
+
+Running pytype once per file means that every process parses builtins, typing
+and typeshed again. In batch mode, we instead keep a pool of worker processes
+alive for the whole run, and hand them files in topological order of their
+imports, so that the .pyi of a module is available by the time its dependents
+are analyzed.
+"""
+
+import copy
+import heapq
+import logging
+import multiprocessing
+import multiprocessing.queues
+import os
+import time
+import traceback
+
+from pytype import imports_map_loader
+from pytype import infer
+from pytype import metrics
+from pytype.pyc import opcodes
+from pytype.pyc import pyc
+from pytype.pytd.parse import builtins
+
+
+log = logging.getLogger(__name__)
+
+
+class Task(object):
+  """A module to process.
+
+  Attributes:
+    module_name: The name of the module, e.g. "foo.bar" or "foo.__init__".
+    input_filename: The .py file.
+    output_filename: The .pyi file to generate.
+    pickle_filename: The pickled .pyi to generate, or None.
+    deps: Tasks for the modules this module imports. After cycles have been
+      broken up, so following deps never leads back to the same task.
+    dependents: Tasks that have this task in their deps.
+    exit_code: The exit code of process_one_file, after the task has run.
+    error: A traceback, if processing the file raised an exception.
+    start: The time at which processing started.
+    end: The time at which processing finished.
+  """
+
+  def __init__(self, module_name, input_filename, output_filename,
+               pickle_filename=None):
+    self.module_name = module_name
+    self.input_filename = input_filename
+    self.output_filename = output_filename
+    self.pickle_filename = pickle_filename
+    self.deps = []
+    self.dependents = []
+    self.exit_code = None
+    self.error = None
+    self.start = None
+    self.end = None
+
+  @property
+  def short_path(self):
+    """The key of this module in an imports map."""
+    return os.path.join(*self.module_name.split("."))
+
+  @property
+  def duration(self):
+    return self.end - self.start
+
+  def __repr__(self):
+    return "Task(%r)" % self.module_name
+
+
+def _package_name(module_name):
+  if module_name.endswith(".__init__"):
+    return module_name[:-len(".__init__")]
+  return module_name.rpartition(".")[0]
+
+
+def _get_imports(code):
+  """Find all imports in a code object and the code objects nested in it.
+
+  Args:
+    code: An instance of loadmarshal.CodeType.
+
+  Yields:
+    Tuples (name, level, fromlist), with the arguments of the IMPORT_NAME
+    opcodes in the code.
+  """
+  stack = [code]
+  while stack:
+    code = stack.pop()
+    ops = opcodes.dis_code(code)
+    for i, op in enumerate(ops):
+      # The compiler always generates LOAD_CONST level, LOAD_CONST fromlist,
+      # IMPORT_NAME name.
+      if (isinstance(op, opcodes.IMPORT_NAME) and i >= 2 and
+          isinstance(ops[i - 2], opcodes.LOAD_CONST) and
+          isinstance(ops[i - 1], opcodes.LOAD_CONST)):
+        yield (code.co_names[op.arg], code.co_consts[ops[i - 2].arg],
+               code.co_consts[ops[i - 1].arg])
+    stack.extend(c for c in code.co_consts if hasattr(c, "co_consts"))
+
+
+def _imported_modules(module_name, name, level, fromlist):
+  """Yield the names of all modules an import statement might load.
+
+  This overapproximates, since we don't know whether the names in fromlist
+  are modules or members.
+
+  Args:
+    module_name: The name of the importing module.
+    name: The name being imported, e.g. "foo.bar".
+    level: The import level. -1 for Python 2 style implicit relative imports,
+      0 for absolute imports, 1 for "from . import ...", etc.
+    fromlist: The names in "from ... import <fromlist>", or None.
+  """
+  package = _package_name(module_name)
+  bases = []  # (package the import is relative to, or "", for absolute)
+  if level > 0:
+    parts = package.split(".") if package else []
+    if level - 1 > len(parts):
+      return
+    bases.append(".".join(parts[:len(parts) - (level - 1)]))
+  else:
+    bases.append("")
+    if level == -1 and package:
+      bases.append(package)
+  for base in bases:
+    prefix = base + "." if base else ""
+    if not name:
+      # "from . import x" also loads the package itself.
+      yield base
+    parts = name.split(".") if name else []
+    for i in range(1, len(parts) + 1):
+      yield prefix + ".".join(parts[:i])
+    full_name = prefix + name if name else base
+    for item in fromlist or ():
+      if item != "*":
+        yield full_name + "." + item
+
+
+def _find_deps(task, tasks_by_name, options):
+  """Return the tasks for all modules the given task imports."""
+  try:
+    with open(task.input_filename, "r") as fi:
+      src = fi.read()
+    code = pyc.compile_src(src, options.python_version, options.python_exe,
+                           task.input_filename)
+  except (IOError, pyc.CompileError) as e:
+    # We'll report this when we process the file.
+    log.info("Couldn't scan %s for imports: %s", task.input_filename, e)
+    return []
+  deps = []
+  for name, level, fromlist in _get_imports(code):
+    for module_name in _imported_modules(
+        task.module_name, name, level, fromlist):
+      dep = tasks_by_name.get(module_name)
+      if dep is not None and dep is not task and dep not in deps:
+        deps.append(dep)
+  return deps
+
+
+def _break_cycles(tasks):
+  """Drop import edges that close a cycle, using a depth-first search."""
+  state = {}  # task -> "visiting" or "done"
+  for root in tasks:
+    if root in state:
+      continue
+    state[root] = "visiting"
+    stack = [(root, iter(list(root.deps)))]
+    while stack:
+      task, deps = stack[-1]
+      for dep in deps:
+        if state.get(dep) == "visiting":
+          log.warning("Import cycle: Processing %s before %s",
+                      task.module_name, dep.module_name)
+          task.deps.remove(dep)
+        elif dep not in state:
+          state[dep] = "visiting"
+          stack.append((dep, iter(list(dep.deps))))
+          break
+      else:
+        state[task] = "done"
+        stack.pop()
+  for task in tasks:
+    for dep in task.deps:
+      dep.dependents.append(task)
+
+
+def _module_name(filename, options):
+  module_name = infer.get_module_name(filename, options)
+  if not module_name:
+    raise ValueError("Can't determine the module name of %r" % filename)
+  return module_name
+
+
+def create_tasks(filenames, options):
+  """Create the tasks for a batch, connected by their imports.
+
+  Args:
+    filenames: A list of .py files.
+    options: config.Options object. options.output is the output directory.
+
+  Returns:
+    A list of Task instances, in the same order as filenames.
+  """
+  tasks = []
+  for filename in filenames:
+    module_name = _module_name(filename, options)
+    output = os.path.join(options.output, *module_name.split(".")) + ".pyi"
+    if not os.path.isdir(os.path.dirname(output)):
+      os.makedirs(os.path.dirname(output))
+    pickle_filename = output + ".pickled" if options.use_pickled_files else None
+    tasks.append(Task(module_name, filename, output, pickle_filename))
+  tasks_by_name = {}
+  for task in tasks:
+    if task.module_name.endswith(".__init__"):
+      tasks_by_name[_package_name(task.module_name)] = task
+    tasks_by_name[task.module_name] = task
+  for task in tasks:
+    task.deps = _find_deps(task, tasks_by_name, options)
+  _break_cycles(tasks)
+  return tasks
+
+
+def _task_options(task, imports_map, options):
+  """Create the options for processing a single module.
+
+  Args:
+    task: The Task to process.
+    imports_map: The imports map with the outputs of the finished tasks, or
+      None to look them up in options.output instead.
+    options: config.Options object.
+
+  Returns:
+    A config.Options object.
+  """
+  task_options = copy.copy(options)
+  task_options.tweak(input=task.input_filename,
+                     output=task.output_filename,
+                     output_pickled=task.pickle_filename,
+                     module_name=task.module_name,
+                     batch=False)
+  if imports_map is not None:
+    task_options.tweak(imports_map=imports_map)
+  else:
+    task_options.tweak(pythonpath=[options.output] + options.pythonpath)
+  return task_options
+
+
+def _remove_outputs(task):
+  for filename in (task.output_filename, task.pickle_filename):
+    if filename and os.path.exists(filename):
+      os.unlink(filename)
+
+
+def _add_output(imports_map, task):
+  """Add the output of a finished task to an imports map.
+
+  Like imports_map_loader.add_init_files, this maps the __init__ of every
+  package above the module to an empty file, unless it has its own output.
+
+  Args:
+    imports_map: A dict of short_path to .pyi path, modified in place.
+    task: The finished Task.
+  """
+  imports_map[task.short_path] = task.pickle_filename or task.output_filename
+  pieces = task.short_path.split(os.sep)
+  for i in range(1, len(pieces)):
+    imports_map.setdefault(os.path.join(*(pieces[:i] + ["__init__"])),
+                           os.devnull)
+
+
+def _run_task(process_file, task_options):
+  """Process a single file.
+
+  Args:
+    process_file: See run().
+    task_options: The options for this file, from _task_options.
+
+  Returns:
+    A tuple (exit code, traceback, start, end, trace events). The trace events
+    are the ones recorded while processing the file, see metrics.span.
+  """
+  start = time.time()
+  error = None
+  try:
+    with metrics.span("process_file", module=task_options.module_name):
+      exit_code = process_file(task_options.input, task_options.output,
+                               task_options)
+  except Exception:  # pylint: disable=broad-except
+    exit_code = 1
+    error = traceback.format_exc()
+  return exit_code, error, start, time.time(), metrics.pop_trace_events()
+
+
+_worker_process_file = None  # The process_file function, in a worker.
+_worker_started = None  # A queue for (task index, pid), in a worker.
+
+
+def _init_worker(process_file, started):
+  global _worker_process_file, _worker_started
+  _worker_process_file = process_file
+  _worker_started = started
+  # Don't send back the events the parent recorded before forking.
+  metrics.pop_trace_events()
+
+
+def _run_task_in_worker(index, task_options):
+  # Tell the parent which process runs this task, so that it notices if the
+  # process dies. SimpleQueue writes synchronously, so the message isn't lost
+  # if it dies right away.
+  _worker_started.put((index, os.getpid()))
+  return _run_task(_worker_process_file, task_options)
+
+
+# Seconds to wait for any running task, before checking for dead workers.
+_POLL_INTERVAL = 0.1
+
+
+def _failed_result(start, error):
+  return 1, error, start, time.time(), []
+
+
+class _WorkerPool(object):
+  """Runs tasks in a multiprocessing.Pool, and notices lost ones.
+
+  Pool.apply_async never calls back for a task whose worker died (killed, or
+  by a SystemExit or a segfault), so this keeps the AsyncResult of every task,
+  polls them, and reports a task as failed if its worker is gone.
+  """
+
+  def __init__(self, jobs, process_file):
+    self._started = multiprocessing.queues.SimpleQueue()
+    self._pool = multiprocessing.Pool(jobs, _init_worker,
+                                      (process_file, self._started))
+    self._tasks = []  # task index -> task
+    self._running = {}  # task -> (AsyncResult, start time)
+    self._pids = {}  # pid -> task it last started
+
+  def __len__(self):
+    return len(self._running)
+
+  def start(self, task, task_options):
+    index = len(self._tasks)
+    self._tasks.append(task)
+    self._running[task] = (
+        self._pool.apply_async(_run_task_in_worker, (index, task_options)),
+        time.time())
+
+  def wait(self):
+    """Wait for at least one task to finish.
+
+    Returns:
+      A list of (task, result) tuples, with results like _run_task's.
+    """
+    while True:
+      finished = [(task, self._result(task)) for task, (result, _)
+                  in self._running.items() if result.ready()]
+      finished.extend((task, _failed_result(
+          self._running[task][1],
+          "Worker process for %s died" % task.input_filename))
+                      for task in self._lost_tasks())
+      if finished:
+        for task, _ in finished:
+          del self._running[task]
+        return finished
+      next(iter(self._running.values()))[0].wait(_POLL_INTERVAL)
+
+  def _result(self, task):
+    result, start = self._running[task]
+    try:
+      return result.get()
+    except Exception:  # pylint: disable=broad-except
+      # E.g., the task or its result couldn't be pickled.
+      return _failed_result(start, traceback.format_exc())
+
+  def _lost_tasks(self):
+    """The running tasks whose worker process is gone."""
+    while not self._started.empty():
+      index, pid = self._started.get()
+      self._pids[pid] = self._tasks[index]
+    workers = self._pool._pool  # pylint: disable=protected-access
+    alive = {p.pid for p in workers if p.exitcode is None}
+    lost = []
+    for pid, task in self._pids.items():
+      if pid not in alive:
+        del self._pids[pid]
+        result, _ = self._running.get(task, (None, None))
+        # The task might have finished just before its worker died.
+        if result and not result.ready():
+          result.wait(_POLL_INTERVAL)
+          if not result.ready():
+            lost.append(task)
+    return lost
+
+  def close(self):
+    self._pool.terminate()
+    self._pool.join()
+
+
+def _compute_heights(tasks):
+  """Length of the longest chain of dependents, for every task."""
+  heights = {}
+  for task in reversed(_topological_order(tasks)):
+    heights[task] = 1 + max([heights[t] for t in task.dependents] or [0])
+  return heights
+
+
+def _topological_order(tasks):
+  order = []
+  remaining = {task: len(task.deps) for task in tasks}
+  ready = [task for task in tasks if not task.deps]
+  while ready:
+    task = ready.pop()
+    order.append(task)
+    for dependent in task.dependents:
+      remaining[dependent] -= 1
+      if not remaining[dependent]:
+        ready.append(dependent)
+  assert len(order) == len(tasks), "Cycle in import graph"
+  return order
+
+
+def run(tasks, options, process_file, jobs=None):
+  """Process the given tasks, each one after all of its dependencies.
+
+  Tasks that are ready to run are started in order of the length of the chain
+  of modules waiting for them, longest first.
+
+  Args:
+    tasks: A list of Task instances, as returned by create_tasks.
+    options: config.Options object.
+    process_file: A function (input_filename, output_filename, options) ->
+      exit code, usually process_one_file. Called in a worker process, unless
+      jobs is 1.
+    jobs: The number of worker processes. Defaults to the number of CPUs.
+
+  Returns:
+    The highest exit code of any task.
+  """
+  jobs = jobs or multiprocessing.cpu_count()
+  heights = _compute_heights(tasks)
+  order = {task: i for i, task in enumerate(tasks)}
+  remaining = {task: len(task.deps) for task in tasks}
+  ready = []
+  if options.imports_map is not None:
+    imports_map = imports_map_loader.add_init_files(options.imports_map)
+  else:
+    imports_map = None
+  # Outputs left over from an earlier run must not be mistaken for the results
+  # of tasks that fail in this one.
+  for task in tasks:
+    _remove_outputs(task)
+
+  def push(task):
+    heapq.heappush(ready, (-heights[task], order[task], task))
+
+  def finish(task, result):
+    task.exit_code, task.error, task.start, task.end, events = result
+    metrics.add_trace_events(events)
+    if task.error:
+      log.error("Error processing %s:\n%s", task.input_filename, task.error)
+      # Don't let dependents see a partial output.
+      _remove_outputs(task)
+    elif imports_map is not None and os.path.exists(
+        task.pickle_filename or task.output_filename):
+      # A task that only reported errors (exit code 1) still wrote its output.
+      _add_output(imports_map, task)
+    for dependent in task.dependents:
+      remaining[dependent] -= 1
+      if not remaining[dependent]:
+        push(dependent)
+
+  for task in tasks:
+    if not task.deps:
+      push(task)
+  if jobs == 1:
+    while ready:
+      _, _, task = heapq.heappop(ready)
+      finish(task, _run_task(process_file,
+                             _task_options(task, imports_map, options)))
+  else:
+    # Load builtins before forking, so the workers don't have to.
+    with metrics.span("load_builtins"):
+      builtins.GetBuiltinsAndTyping()
+    pool = _WorkerPool(jobs, process_file)
+    try:
+      while ready or len(pool):
+        while ready and len(pool) < jobs:
+          _, _, task = heapq.heappop(ready)
+          pool.start(task, _task_options(task, imports_map, options))
+        for task, result in pool.wait():
+          finish(task, result)
+    finally:
+      pool.close()
+  return max([task.exit_code for task in tasks] or [0])
+
+
+def critical_path(tasks):
+  """The chain of dependencies with the highest total processing time.
+
+  Args:
+    tasks: A list of Task instances that have been run.
+
+  Returns:
+    A list of tasks, starting with a module that has no dependencies.
+  """
+  best = {}  # task -> (total time, previous task)
+  for task in _topological_order(tasks):
+    prev = max(task.deps, key=lambda t: best[t][0]) if task.deps else None
+    best[task] = (task.duration + (best[prev][0] if prev else 0), prev)
+  if not best:
+    return []
+  task = max(tasks, key=lambda t: best[t][0])
+  path = []
+  while task:
+    path.append(task)
+    task = best[task][1]
+  return path[::-1]
+
+
+def format_report(tasks):
+  """Format per-file timings and the critical path, for printing."""
+  lines = ["Processed %d files in %.2fs:" % (
+      len(tasks),
+      (max(t.end for t in tasks) - min(t.start for t in tasks)
+       if tasks else 0))]
+  for task in sorted(tasks, key=lambda t: -t.duration):
+    lines.append("  %8.2fs  %s%s" % (task.duration, task.input_filename,
+                                     "" if not task.exit_code else " (failed)"))
+  path = critical_path(tasks)
+  lines.append("Critical path (%.2fs):" % sum(t.duration for t in path))
+  for task in path:
+    lines.append("  %8.2fs  %s" % (task.duration, task.module_name))
+  return "\n".join(lines)
@@ -0,0 +1,214 @@
+"""Tests for batch.py."""
+
+import os
+import sys
+
+from pytype import batch
+from pytype import config
+from pytype import metrics
+from pytype import utils
+import unittest
+
+
+def _write_module_name(input_filename, output_filename, options):
+  """A stand-in for process_one_file."""
+  del input_filename
+  with open(output_filename, "w") as fi:
+    fi.write(options.module_name)
+  return 0
+
+
+def _exit_in_worker(input_filename, output_filename, options):
+  """A process_file that kills its worker, for all modules but "a"."""
+  if options.module_name == "b":
+    os._exit(1)  # pylint: disable=protected-access
+  elif options.module_name == "c":
+    sys.exit(1)
+  return _write_module_name(input_filename, output_filename, options)
+
+
+class BatchTest(unittest.TestCase):
+  """Tests for scheduling files in dependency order."""
+
+  def _create_tasks(self, d, files):
+    filenames = []
+    for filename, src in files:
+      d.create_file(filename, src)
+      filenames.append(os.path.join(d.path, filename))
+    options = config.Options.create(output=os.path.join(d.path, "out"),
+                                    pythonpath=[d.path])
+    return batch.create_tasks(filenames, options), options
+
+  def _deps(self, tasks):
+    return {task.module_name: sorted(dep.module_name for dep in task.deps)
+            for task in tasks}
+
+  def test_imported_modules(self):
+    def imported(module_name, name, level, fromlist=None):
+      return sorted(set(batch._imported_modules(  # pylint: disable=protected-access
+          module_name, name, level, fromlist)))
+    self.assertEqual(["a", "a.b"], imported("x", "a.b", 0))
+    self.assertEqual(["a", "a.b", "a.b.c"], imported("x", "a.b", 0, ("c",)))
+    self.assertEqual(["p.q.a"], imported("p.q.x", "a", 1))
+    self.assertEqual(["p", "p.a"], imported("p.q.__init__", "", 2, ("a",)))
+    self.assertEqual(["a", "p.a"], imported("p.x", "a", -1))
+    self.assertEqual([], imported("x", "a", 2))
+
+  def test_create_tasks(self):
+    with utils.Tempdir() as d:
+      tasks, _ = self._create_tasks(d, [
+          ("app.py", "import pkg.mod\nfrom pkg import util"),
+          ("pkg/__init__.py", ""),
+          ("pkg/mod.py", "from . import util"),
+          ("pkg/util.py", "def f():\n  import os"),
+      ])
+      self.assertEqual({"app": ["pkg.__init__", "pkg.mod", "pkg.util"],
+                        "pkg.__init__": [],
+                        "pkg.mod": ["pkg.__init__", "pkg.util"],
+                        "pkg.util": []}, self._deps(tasks))
+      self.assertEqual(os.path.join(d.path, "out", "pkg", "mod.pyi"),
+                       tasks[2].output_filename)
+
+  def test_break_cycles(self):
+    with utils.Tempdir() as d:
+      tasks, _ = self._create_tasks(d, [
+          ("a.py", "import b"),
+          ("b.py", "import c"),
+          ("c.py", "import a"),
+      ])
+      self.assertEqual({"a": ["b"], "b": ["c"], "c": []}, self._deps(tasks))
+
+  def test_run(self):
+    with utils.Tempdir() as d:
+      tasks, options = self._create_tasks(d, [
+          ("a.py", "import b\nimport c"),
+          ("b.py", "import c"),
+          ("c.py", ""),
+      ])
+      calls = []
+      def process_file(input_filename, output_filename, task_options):
+        calls.append((task_options.module_name, task_options.pythonpath))
+        return _write_module_name(input_filename, output_filename,
+                                  task_options)
+      self.assertEqual(0, batch.run(tasks, options, process_file, jobs=1))
+      out = os.path.join(d.path, "out")
+      self.assertEqual([("c", [out, d.path]), ("b", [out, d.path]),
+                        ("a", [out, d.path])], calls)
+      self.assertEqual(["c", "b", "a"],
+                       [t.module_name for t in batch.critical_path(tasks)])
+
+  def test_run_in_workers(self):
+    with utils.Tempdir() as d:
+      tasks, options = self._create_tasks(d, [
+          ("a.py", "import b"),
+          ("b.py", ""),
+          ("c.py", ""),
+      ])
+      self.assertEqual(0, batch.run(tasks, options, _write_module_name,
+                                    jobs=2))
+      for task in tasks:
+        with open(task.output_filename) as fi:
+          self.assertEqual(task.module_name, fi.read())
+      a, b, _ = tasks
+      self.assertGreaterEqual(a.start, b.end)
+
+  def test_trace(self):
+    with utils.Tempdir() as d:
+      tasks, options = self._create_tasks(d, [("a.py", "import b"),
+                                              ("b.py", ""),
+                                              ("c.py", "")])
+      with metrics.TraceContext(os.path.join(d.path, "trace.json")):
+        self.assertEqual(0, batch.run(tasks, options, _write_module_name,
+                                      jobs=2))
+        events = metrics.pop_trace_events()
+      self.assertItemsEqual(
+          [{"module": "a"}, {"module": "b"}, {"module": "c"}],
+          [e["args"] for e in events if e["name"] == "process_file"])
+      self.assertTrue(all(e["pid"] != os.getpid() for e in events
+                          if e["name"] == "process_file"))
+
+  def test_error(self):
+    with utils.Tempdir() as d:
+      tasks, options = self._create_tasks(d, [("a.py", "import b"),
+                                              ("b.py", "")])
+      def process_file(input_filename, output_filename, task_options):
+        if task_options.module_name == "b":
+          raise ValueError()
+        return _write_module_name(input_filename, output_filename,
+                                  task_options)
+      self.assertEqual(1, batch.run(tasks, options, process_file, jobs=1))
+      a, b = tasks
+      self.assertEqual(0, a.exit_code)
+      self.assertIn("ValueError", b.error)
+      self.assertIn("(failed)", batch.format_report(tasks))
+
+  def test_lost_worker(self):
+    with utils.Tempdir() as d:
+      tasks, options = self._create_tasks(d, [("a.py", ""),
+                                              ("b.py", ""),
+                                              ("c.py", "")])
+      self.assertEqual(1, batch.run(tasks, options, _exit_in_worker, jobs=2))
+      a, b, c = tasks
+      self.assertEqual(0, a.exit_code)
+      self.assertEqual(1, b.exit_code)
+      self.assertIn("died", b.error)
+      self.assertEqual(1, c.exit_code)
+      self.assertIn("died", c.error)
+
+  def test_imports_map(self):
+    with utils.Tempdir() as d:
+      tasks, options = self._create_tasks(d, [("a.py", "import pkg.b"),
+                                              ("pkg/b.py", "")])
+      options.tweak(pythonpath=[""], imports_map={})
+      maps = []
+      def process_file(input_filename, output_filename, task_options):
+        maps.append(dict(task_options.imports_map))
+        return _write_module_name(input_filename, output_filename,
+                                  task_options)
+      batch.run(tasks, options, process_file, jobs=1)
+      self.assertEqual([{}, {"pkg/b": tasks[1].output_filename,
+                             "pkg/__init__": os.devnull}], maps)
+
+
+  def test_failed_dependency(self):
+    with utils.Tempdir() as d:
+      tasks, options = self._create_tasks(d, [("a.py", "import b\nimport c"),
+                                              ("b.py", ""),
+                                              ("c.py", "")])
+      # Leftovers from an earlier run.
+      d.create_file("out/b.pyi", "x = ...  # type: int")
+      d.create_file("out/c.pyi", "x = ...  # type: int")
+      def process_file(input_filename, output_filename, task_options):
+        if task_options.module_name == "a":
+          self.assertFalse(os.path.exists(tasks[1].output_filename))
+          self.assertTrue(os.path.exists(tasks[2].output_filename))
+        _write_module_name(input_filename, output_filename, task_options)
+        if task_options.module_name == "b":
+          raise ValueError()
+        # Reporting errors doesn't make the output unusable.
+        return 1 if task_options.module_name == "c" else 0
+      self.assertEqual(1, batch.run(tasks, options, process_file, jobs=1))
+      a, b, c = tasks
+      self.assertEqual(0, a.exit_code)
+      self.assertIn("ValueError", b.error)
+      self.assertEqual(1, c.exit_code)
+
+  def test_failed_dependency_imports_map(self):
+    with utils.Tempdir() as d:
+      tasks, options = self._create_tasks(d, [("a.py", "import b\nimport c"),
+                                              ("b.py", ""),
+                                              ("c.py", "")])
+      options.tweak(pythonpath=[""], imports_map={})
+      maps = {}
+      def process_file(input_filename, output_filename, task_options):
+        maps[task_options.module_name] = dict(task_options.imports_map)
+        _write_module_name(input_filename, output_filename, task_options)
+        if task_options.module_name == "b":
+          raise ValueError()
+        return 0
+      self.assertEqual(1, batch.run(tasks, options, process_file, jobs=1))
+      self.assertEqual({"c": tasks[2].output_filename}, maps["a"])
+
+
+if __name__ == "__main__":
+  unittest.main()
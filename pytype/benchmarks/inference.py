@@ -0,0 +1,268 @@
+"""Regression benchmark for end-to-end type inference.
+
+Runs infer.infer_types and infer.check_types over a fixed corpus: the files in
+pytype/test_data, plus generated modules that stress particular parts of the
+analysis (deep call chains, wide unions, large class hierarchies, big dict
+literals, and operators on builtin types, which have many overloads). Every
+case runs in a fresh process, and reports
+  - the best wall time out of --repeat runs,
+  - the peak RSS of the process,
+  - the number of CFG nodes and variables the analysis created, and
+  - the hit rate of the cfg.Solver state cache.
+The last two are collected in one additional run with metrics enabled, so they
+don't slow down the timed runs.
+
+Save the results with --save, and compare a later run against them with
+--baseline. Cases that got slower, bigger or more complex by more than
+--tolerance are reported as regressions, and make the exit code 1.
+
+Usage:
+  python -m pytype.benchmarks.inference [--repeat=N] [--scale=N]
+      [--compact_typegraph] [--save=FILE] [--baseline=FILE]
+      [--tolerance=FRACTION] [cases...]
+"""
+
+import glob
+import json
+import multiprocessing
+import optparse
+import os
+import resource
+import sys
+import time
+import tokenize
+
+from pytype import config
+from pytype import errors
+from pytype import infer
+from pytype import load_pytd
+from pytype import metrics
+from pytype import utils
+from pytype.pyc import pyc
+
+
+# The measurements that are compared against a baseline, with their units.
+_COMPARED = (("wall", "s"), ("rss", "K"), ("cfg_nodes", ""), ("variables", ""))
+
+
+def _deep_calls(n):
+  """A chain of n functions, each calling the next one."""
+  lines = []
+  for i in range(n):
+    lines.append("def f%d(x, y):\n  return f%d(y, x) + 1\n" % (i, i + 1))
+  lines.append("def f%d(x, y):\n  return x\n" % n)
+  lines.append("z = f0(1, 2)\n")
+  return "\n".join(lines)
+
+
+def _wide_unions(n):
+  """A function returning an instance of any one of n classes."""
+  lines = []
+  for i in range(n):
+    lines.append("class C%d(object):\n  def get(self):\n    return %r\n" % (
+        i, [i, str(i), float(i), None][i % 4]))
+  lines.append("def pick(i):")
+  for i in range(n):
+    lines.append("  %s i == %d:\n    x = C%d()" % ("if" if i == 0 else "elif",
+                                                  i, i))
+  lines.append("  else:\n    x = None\n  return x\n")
+  lines.append("def use(i):\n  x = pick(i)\n  if x:\n    return x.get()\n")
+  lines.append("values = [pick(i) for i in range(%d)]\n" % n)
+  return "\n".join(lines)
+
+
+def _class_hierarchy(n):
+  """A chain of n classes, each calling a method of its base class."""
+  lines = ["class B0(object):\n  def m0(self):\n    return 0\n"]
+  for i in range(1, n):
+    lines.append("class B%d(B%d):\n  def m%d(self):\n    return self.m%d()\n" %
+                 (i, i - 1, i, i - 1))
+  lines.append("x = B%d().m%d()\n" % (n - 1, n - 1))
+  return "\n".join(lines)
+
+
+def _big_dict(n):
+  """A dict literal with n entries of different types."""
+  values = ["%d", "'%d'", "%d.0", "None", "[%d]", "(%d, '%d')"]
+  lines = ["D = {"]
+  for i in range(n):
+    value = values[i % len(values)]
+    lines.append("    'k%d': %s," % (i, value.replace("%d", str(i))))
+  lines.append("}\n")
+  lines.append("def get(k):\n  return D[k]\n")
+  lines.append("def keys():\n  return [k for k in D if D[k]]\n")
+  return "\n".join(lines)
+
+
+def _operators(n):
+  """n functions full of arithmetic, comparisons and subscripts."""
+  lines = []
+  for i in range(n):
+    lines.append(
+        "def op%d(a, b, s, xs, d):\n"
+        "  x = a * b + a / b - a %% %d + (a ** 2) // (b or 1)\n"
+        "  y = (b - a) * 1.5 + abs(-a) + (a << 1) + (a & %d) + (a | %d)\n"
+        "  t = s + str(x) + s[1:] + s * 2 + s[0] + '%%d' %% a\n"
+        "  u = xs + [x, y] + xs[1:] + xs * 2\n"
+        "  v = d[s] + d.get(t, 0) + len(u) + xs[0]\n"
+        "  return x < y and y >= v and t != s and u == xs or x in xs\n" %
+        (i, i + 2, i + 1, i))
+    lines.append("op%d(%d, %d.5, 'x', [1, 2.0], {'x': 1})\n" % (i, i, i))
+  return "\n".join(lines)
+
+
+# Generated modules, with their size for --scale=1.
+_SYNTHETIC = (
+    ("deep_calls", _deep_calls, 40),
+    ("wide_unions", _wide_unions, 30),
+    ("class_hierarchy", _class_hierarchy, 50),
+    ("operators", _operators, 40),
+    # Every entry adds a CFG node, and the solver recurses over them, so much
+    # bigger dicts exceed the recursion limit.
+    ("big_dict", _big_dict, 200),
+)
+
+
+def _corpus(scale):
+  """Yield (name, filename, source) for all modules to analyze."""
+  test_data = os.path.join(os.path.dirname(utils.__file__), "test_data")
+  for filename in sorted(glob.glob(os.path.join(test_data, "*.py"))):
+    with open(filename, "rb") as fi:
+      yield os.path.basename(filename)[:-3], filename, fi.read()
+  for name, generate, size in _SYNTHETIC:
+    yield name, name + ".py", generate(size * scale)
+
+
+def _analyze(mode, filename, src, options):
+  loader = load_pytd.Loader(infer.get_module_name(filename, options), options)
+  errorlog = errors.ErrorLog()
+  if mode == "infer":
+    infer.infer_types(src, errorlog, options, loader, filename=filename,
+                      maximum_depth=3)
+  else:
+    infer.check_types(src, filename, errorlog, options, loader)
+
+
+def _best_time(f, repeat):
+  best = None
+  for _ in range(repeat):
+    start = time.time()
+    f()
+    elapsed = time.time() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+def _measure(mode, filename, src, options, repeat):
+  """Benchmark one case. Runs in a process of its own."""
+  wall = _best_time(lambda: _analyze(mode, filename, src, options), repeat)
+  # pylint: disable=protected-access
+  with metrics.MetricsContext(os.devnull):
+    _analyze(mode, filename, src, options)
+    cfg_nodes = metrics.get_metric("program_cfg_nodes", metrics.Counter)._total
+    variables = metrics.get_metric("program_variables", metrics.Counter)._total
+    cache = metrics.get_metric("cfg_solver_cache", metrics.MapCounter)._counts
+  hits, misses = cache.get("hit", 0), cache.get("miss", 0)
+  return {"wall": wall,
+          "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+          "cfg_nodes": cfg_nodes,
+          "variables": variables,
+          "solver_hits": hits,
+          "solver_misses": misses}
+
+
+def _compare(results, baseline, tolerance):
+  """Return a list of messages for every measurement that got worse."""
+  regressions = []
+  for case in sorted(results):
+    if case not in baseline:
+      continue
+    for key, unit in _COMPARED:
+      old, new = baseline[case][key], results[case][key]
+      if new > old * (1 + tolerance):
+        regressions.append("%s: %s went from %s%s to %s%s (%+.0f%%)" % (
+            case, key, _format(old), unit, _format(new), unit,
+            100.0 * (new - old) / max(old, 1e-9)))
+  return regressions
+
+
+def _format(value):
+  return "%.3f" % value if isinstance(value, float) else str(value)
+
+
+def main(argv):
+  parser = optparse.OptionParser(usage="%prog [options] [cases...]")
+  parser.add_option("--repeat", type="int", default=3,
+                    help="Number of timed runs per case; the best one is "
+                    "reported.")
+  parser.add_option("--scale", type="int", default=1,
+                    help="Multiplier for the size of the generated modules.")
+  parser.add_option("-V", "--python_version", default="2.7",
+                    help="Python version to analyze the files as.")
+  parser.add_option("--compact_typegraph", action="store_true", default=False,
+                    help="Analyze with cfg.CompactProgram.")
+  parser.add_option("--save", help="Write the results to this JSON file.")
+  parser.add_option("--baseline",
+                    help="Compare the results with this file, written by an "
+                    "earlier run with --save.")
+  parser.add_option("--tolerance", type="float", default=0.1,
+                    help="Relative increase of a measurement that counts as a "
+                    "regression.")
+  opts, selected = parser.parse_args(argv[1:])
+  options = config.Options.create(
+      python_version=tuple(map(int, opts.python_version.split("."))),
+      compact_typegraph=opts.compact_typegraph)
+  baseline = {}
+  if opts.baseline:
+    with open(opts.baseline, "r") as fi:
+      baseline = json.load(fi)
+  print "%-22s %9s %9s %9s %9s %7s %8s" % (
+      "case", "wall", "rss", "nodes", "variables", "solver", "vs base")
+  results = {}
+  for name, filename, src in _corpus(opts.scale):
+    if selected and name not in selected:
+      continue
+    for mode in ("infer", "check"):
+      case = "%s:%s" % (name, mode)
+      # A fresh process for every case, so that the peak RSS is its own.
+      pool = multiprocessing.Pool(1)
+      try:
+        stats = pool.apply(_measure,
+                           (mode, filename, src, options, opts.repeat))
+      except (pyc.CompileError, IndentationError, tokenize.TokenError):
+        print "%-22s (doesn't compile as %s, skipped)" % (
+            case, opts.python_version)
+        continue
+      except Exception as e:  # pylint: disable=broad-except
+        print "%-22s (failed: %s: %s)" % (case, type(e).__name__, e)
+        continue
+      finally:
+        pool.terminate()
+        pool.join()
+      results[case] = stats
+      lookups = stats["solver_hits"] + stats["solver_misses"]
+      if case in baseline:
+        change = "%+7.1f%%" % (
+            100.0 * (stats["wall"] - baseline[case]["wall"]) /
+            max(baseline[case]["wall"], 1e-9))
+      else:
+        change = "-"
+      print "%-22s %8.3fs %8dK %9d %9d %6.1f%% %8s" % (
+          case, stats["wall"], stats["rss"], stats["cfg_nodes"],
+          stats["variables"], 100.0 * stats["solver_hits"] / max(lookups, 1),
+          change)
+  if opts.save:
+    with open(opts.save, "w") as fi:
+      json.dump(results, fi, indent=2, sort_keys=True)
+  if baseline:
+    regressions = _compare(results, baseline, opts.tolerance)
+    if regressions:
+      print "\nRegressions:"
+      for message in regressions:
+        print "  " + message
+      return 1
+    print "\nNo regressions."
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv) or 0)
@@ -0,0 +1,125 @@
+"""Microbenchmark for opcode dispatch in VirtualMachine.run_instruction.
+
+Runs the analysis of every file in pytype/test_data twice: once with the
+table-driven dispatch of VirtualMachine, and once emulating the old dispatch
+(a getattr(self, "byte_" + op.name) per instruction, plus the per-opcode
+metric and logging checks). Reports instructions per second for both.
+
+Usage:
+  python -m pytype.benchmarks.opcode_dispatch [--repeat=N] [files...]
+"""
+
+import glob
+import optparse
+import os
+import sys
+import time
+import tokenize
+
+from pytype import config
+from pytype import errors
+from pytype import infer
+from pytype import load_pytd
+from pytype import utils
+from pytype.pyc import pyc
+
+
+class _CountingTracer(infer.CallTracer):
+  """CallTracer that counts the instructions it runs."""
+
+  def __init__(self, *args, **kwargs):
+    super(_CountingTracer, self).__init__(*args, **kwargs)
+    self.instructions = 0
+
+  def run_instruction(self, op, state):
+    self.instructions += 1
+    return super(_CountingTracer, self).run_instruction(op, state)
+
+
+class _GetattrDispatch(object):
+  """Stand-in for _dispatch_table that looks up byte_* methods every time."""
+
+  def __init__(self, cls):
+    self._cls = cls
+
+  def get(self, opcode_class):
+    method = getattr(self._cls, "byte_%s" % opcode_class.__name__, None)
+    return method and method.__func__
+
+
+class _LegacyTracer(_CountingTracer):
+  """_CountingTracer with the dispatch overhead of the old run_instruction."""
+
+  def __init__(self, *args, **kwargs):
+    super(_LegacyTracer, self).__init__(*args, **kwargs)
+    self._dispatch_table = _GetattrDispatch(self.__class__)
+
+  def run_instruction(self, op, state):
+    self._instrument_opcodes = True
+    return super(_LegacyTracer, self).run_instruction(op, state)
+
+
+def _run(tracer_class, filename, src, options):
+  """Analyze one file. Returns (instructions, seconds)."""
+  loader = load_pytd.Loader(
+      infer.get_module_name(filename, options), options)
+  tracer = tracer_class(errorlog=errors.ErrorLog(), options=options,
+                        module_name=infer.get_module_name(filename, options),
+                        analyze_annotated=True, loader=loader)
+  start = time.time()
+  loc, defs = tracer.run_program(src, filename, infer.INIT_MAXIMUM_DEPTH,
+                                 run_builtins=True)
+  tracer.analyze(loc, defs, maximum_depth=None)
+  return tracer.instructions, time.time() - start
+
+
+def _best_rate(tracer_class, filename, src, options, repeat):
+  best = None
+  for _ in range(repeat):
+    instructions, seconds = _run(tracer_class, filename, src, options)
+    rate = instructions / max(seconds, 1e-9)
+    best = max(best, (rate, instructions))
+  return best
+
+
+def main(argv):
+  parser = optparse.OptionParser(usage="%prog [options] [files...]")
+  parser.add_option("--repeat", type="int", default=3,
+                    help="Number of runs per file; the best one is reported.")
+  parser.add_option("-V", "--python_version", default="2.7",
+                    help="Python version to analyze the files as.")
+  opts, files = parser.parse_args(argv[1:])
+  if not files:
+    test_data = os.path.join(os.path.dirname(utils.__file__), "test_data")
+    files = sorted(glob.glob(os.path.join(test_data, "*.py")))
+  options = config.Options.create(
+      python_version=tuple(map(int, opts.python_version.split("."))))
+  print "%-20s %8s %12s %12s %8s" % ("file", "ops", "before/s", "after/s",
+                                     "speedup")
+  total = {"before": [0, 0.0], "after": [0, 0.0]}
+  for filename in files:
+    with open(filename, "rb") as fi:
+      src = fi.read()
+    try:
+      before, ops = _best_rate(_LegacyTracer, filename, src, options,
+                               opts.repeat)
+      after, _ = _best_rate(_CountingTracer, filename, src, options,
+                            opts.repeat)
+    except (pyc.CompileError, IndentationError, tokenize.TokenError):
+      print "%-20s (doesn't compile as %s, skipped)" % (
+          os.path.basename(filename), opts.python_version)
+      continue
+    for key, rate in (("before", before), ("after", after)):
+      total[key][0] += ops
+      total[key][1] += ops / rate
+    print "%-20s %8d %12.0f %12.0f %7.2fx" % (
+        os.path.basename(filename), ops, before, after, after / before)
+  if total["before"][0]:
+    before = total["before"][0] / total["before"][1]
+    after = total["after"][0] / total["after"][1]
+    print "%-20s %8d %12.0f %12.0f %7.2fx" % (
+        "TOTAL", total["after"][0], before, after, after / before)
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv) or 0)
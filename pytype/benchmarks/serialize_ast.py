@@ -0,0 +1,124 @@
+"""Benchmark for the binary AST format of serialize_ast.
+
+Stores the given modules both as pickles (the format serialize_ast.StoreAst
+used to write) and in the binary AST format, and reports file sizes and the
+best time for writing, loading, and loading under a different module name.
+Loading includes serialize_ast.ProcessAst, which fills in the class pointers.
+The last column is the time for loading the binary file lazily and looking up
+a single class.
+
+Usage:
+  python -m pytype.benchmarks.serialize_ast [--repeat=N] [modules...]
+"""
+
+import optparse
+import os
+import sys
+import time
+
+from pytype import config
+from pytype import load_pytd
+from pytype import utils
+from pytype.pytd import serialize_ast
+from pytype.pytd import utils as pytd_utils
+from pytype.pytd.parse import visitors
+
+
+_DEFAULT_MODULES = ["__builtin__", "typing", "os", "collections", "ctypes"]
+
+
+def _store_pickle(ast, filename):
+  """What serialize_ast.StoreAst did before the binary format."""
+  deps = visitors.CollectDependencies()
+  ast.Visit(deps)
+  ast.Visit(visitors.ClearClassPointers())
+  indexer = serialize_ast.FindClassTypesVisitor()
+  ast.Visit(indexer)
+  pytd_utils.SavePickle(serialize_ast.SerializableAst(
+      ast, sorted(deps.modules or ()), sorted(indexer.class_type_nodes)),
+                        filename)
+
+
+def _load_pickle(filename, module_name, module_map):
+  serializable_ast = pytd_utils.LoadPickle(filename)
+  serializable_ast = serialize_ast.EnsureAstName(serializable_ast, module_name)
+  return serialize_ast.ProcessAst(serializable_ast, dict(module_map))
+
+
+def _load_binary(filename, module_name, module_map):
+  serializable_ast = serialize_ast.LoadAst(filename, module_name)
+  return serialize_ast.ProcessAst(serializable_ast, dict(module_map))
+
+
+def _load_lazily(filename, module_name, module_map, member):
+  serializable_ast = serialize_ast.LoadAst(filename, module_name, lazy=True)
+  ast = serialize_ast.ProcessAst(serializable_ast, dict(module_map))
+  if member:
+    ast.Lookup(member)
+
+
+def _best_time(f, repeat):
+  best = None
+  for _ in range(repeat):
+    start = time.time()
+    f()
+    elapsed = time.time() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+def _ms(seconds):
+  return "-" if seconds is None else "%.1fms" % (seconds * 1000)
+
+
+def main(argv):
+  parser = optparse.OptionParser(usage="%prog [options] [modules...]")
+  parser.add_option("--repeat", type="int", default=5,
+                    help="Number of runs per module; the best one is reported.")
+  parser.add_option("-V", "--python_version", default="2.7",
+                    help="Python version to load the modules for.")
+  opts, modules = parser.parse_args(argv[1:])
+  modules = modules or _DEFAULT_MODULES
+  options = config.Options.create(
+      python_version=tuple(map(int, opts.python_version.split("."))))
+  loader = load_pytd.Loader(None, options)
+  asts = [(name, loader.import_name(name)) for name in modules]
+  module_map = {name: module.ast for name, module in loader._modules.items()}
+  print "%-12s %9s %9s %8s %8s %8s %8s %8s %8s %8s" % (
+      "module", "pickle", "binary", "write", "write",
+      "load", "load", "rename", "rename", "lazy")
+  with utils.Tempdir() as d:
+    for name, ast in asts:
+      if ast is None:
+        print "%-12s (not found)" % name
+        continue
+      other_map = {k: v for k, v in module_map.items() if k != name}
+      pickle_file = os.path.join(d.path, name + ".pickled")
+      binary_file = os.path.join(d.path, name + ".binary")
+      row = []
+      for store, load, filename in (
+          (_store_pickle, _load_pickle, pickle_file),
+          (serialize_ast.StoreAst, _load_binary, binary_file)):
+        write = _best_time(lambda: store(ast, filename), opts.repeat)  # pylint: disable=cell-var-from-loop
+        read = _best_time(lambda: load(filename, name, other_map),  # pylint: disable=cell-var-from-loop
+                          opts.repeat)
+        try:
+          rename = _best_time(lambda: load(filename, "renamed", other_map),  # pylint: disable=cell-var-from-loop
+                              opts.repeat)
+        except AttributeError:
+          # RenameModuleVisitor can't handle module-level type parameters
+          # without a scope, as in __builtin__.
+          rename = None
+        row.append((os.path.getsize(filename), write, read, rename))
+      member = ast.classes[0].name if ast.classes else None
+      lazy = _best_time(
+          lambda: _load_lazily(binary_file, name, other_map, member),  # pylint: disable=cell-var-from-loop
+          opts.repeat)
+      (psize, pwrite, pread, prename), (bsize, bwrite, bread, brename) = row
+      print "%-12s %8dK %8dK %8s %8s %8s %8s %8s %8s %8s" % (
+          name, psize / 1024, bsize / 1024, _ms(pwrite), _ms(bwrite),
+          _ms(pread), _ms(bread), _ms(prename), _ms(brename), _ms(lazy))
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv) or 0)
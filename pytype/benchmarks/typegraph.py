@@ -0,0 +1,227 @@
+"""Microbenchmark for cfg.Program, cfg.Variable and cfg.Solver.
+
+Generates synthetic programs of different shapes (long chains, sequences of
+diamonds, loops, branches with conditions, and variables with close to
+cfg.MAX_VAR_SIZE bindings), and times the typegraph operations the VM relies
+on: CFGNode.HasCombination, Variable.Bindings, Variable.Filter,
+FindNodeBackwards, Program.MergeVariables and Variable.PasteVariable.
+
+Every operation runs on a freshly generated program, with empty caches. For
+every operation, this reports the best time out of --repeat runs, and the net
+number of objects tracked by the garbage collector that it leaves behind
+(cached results, new bindings, etc.).
+
+Usage:
+  python -m pytype.benchmarks.typegraph [--repeat=N] [--size=N]
+      [shapes...]
+"""
+
+import gc
+import optparse
+import sys
+import time
+
+from pytype.pytd import cfg
+
+
+class _Graph(object):
+  """A generated program.
+
+  Attributes:
+    program: The cfg.Program.
+    entry: The first CFG node.
+    exit: The last CFG node, where all queries are made.
+    variables: The variables to filter, merge and paste.
+    queries: Lists of bindings, for HasCombination.
+  """
+
+  def __init__(self):
+    self.program = cfg.Program()
+    self.entry = self.program.NewCFGNode("entry")
+    self.program.entrypoint = self.entry
+    self.exit = self.entry
+    self.variables = []
+    self.queries = []
+
+
+def _chain(n):
+  """A chain of n nodes. Every binding depends on the one before it."""
+  g = _Graph()
+  variables = [g.program.NewVariable() for _ in range(10)]
+  previous = None
+  for i in range(n):
+    g.exit = g.exit.ConnectNew("n%d" % i)
+    source_set = {previous} if previous else set()
+    previous = variables[i % 10].AddBinding(i, source_set, g.exit)
+  g.variables = variables
+  g.queries = [[v.bindings[-1], w.bindings[-1]]
+               for v, w in zip(variables, variables[1:])]
+  return g
+
+
+def _diamonds(n):
+  """n if/else diamonds in a row, each assigning a variable in both arms."""
+  g = _Graph()
+  for i in range(n):
+    v = g.program.NewVariable()
+    left = g.exit.ConnectNew("left%d" % i)
+    right = g.exit.ConnectNew("right%d" % i)
+    v.AddBinding("left%d" % i, set(), left)
+    v.AddBinding("right%d" % i, set(), right)
+    g.exit = left.ConnectNew("join%d" % i)
+    right.ConnectTo(g.exit)
+    g.variables.append(v)
+  first, last = g.variables[0], g.variables[-1]
+  g.queries = [[first.bindings[0], last.bindings[1]],
+               [first.bindings[1], last.bindings[0]]]
+  return g
+
+
+def _loops(n):
+  """A chain of n nodes, with a back edge every five nodes."""
+  g = _Graph()
+  counter = g.program.NewVariable()
+  nodes = []
+  for i in range(n):
+    g.exit = g.exit.ConnectNew("n%d" % i)
+    nodes.append(g.exit)
+    counter.AddBinding(i % 7, set(), g.exit)
+    if i % 5 == 4:
+      g.exit.ConnectTo(nodes[i - 4])
+  g.variables = [counter]
+  g.queries = [[b] for b in counter.bindings]
+  return g
+
+
+def _conditions(n):
+  """n branches, each taken depending on a binding assigned before it."""
+  g = _Graph()
+  flags = []
+  for i in range(n):
+    flag = g.program.NewVariable()
+    true = flag.AddBinding(True, set(), g.exit)
+    false = flag.AddBinding(False, set(), g.exit)
+    then = g.exit.ConnectNew("then%d" % i, condition=true)
+    other = g.exit.ConnectNew("else%d" % i, condition=false)
+    g.exit = then.ConnectNew("join%d" % i)
+    other.ConnectTo(g.exit)
+    flags.append(flag)
+  g.variables = flags
+  g.queries = [[f.bindings[0], h.bindings[1]] for f, h in zip(flags, flags[1:])]
+  return g
+
+
+def _wide(n):
+  """n variables with cfg.MAX_VAR_SIZE - 1 bindings each, on a chain."""
+  g = _Graph()
+  g.variables = [g.program.NewVariable() for _ in range(n)]
+  for i in range(cfg.MAX_VAR_SIZE - 1):
+    g.exit = g.exit.ConnectNew("n%d" % i)
+    for v in g.variables:
+      v.AddBinding(i, set(), g.exit)
+  g.queries = [[v.bindings[0] for v in g.variables[:2]],
+               [v.bindings[-1] for v in g.variables]]
+  return g
+
+
+# Shapes, with their size for --size=1.
+_SHAPES = (
+    ("chain", _chain, 200),
+    ("diamonds", _diamonds, 50),
+    ("loops", _loops, 100),
+    ("conditions", _conditions, 20),
+    ("wide", _wide, 20),
+)
+
+
+def _has_combination(g):
+  for bindings in g.queries:
+    g.exit.HasCombination(bindings)
+
+
+def _bindings(g):
+  for v in g.variables:
+    v.Bindings(g.exit)
+
+
+def _filter(g):
+  for v in g.variables:
+    v.Filter(g.exit)
+
+
+def _find_node_backwards(g):
+  # pylint: disable=protected-access
+  path_finder = cfg._PathFinder(g.program.reachability)
+  path_finder.FindNodeBackwards(g.exit, g.entry, frozenset())
+
+
+def _merge_variables(g):
+  g.program.MergeVariables(g.exit, g.variables)
+
+
+def _paste_variable(g):
+  v = g.program.NewVariable()
+  for other in g.variables:
+    v.PasteVariable(other, g.exit)
+
+
+_OPERATIONS = (
+    ("HasCombination", _has_combination),
+    ("Bindings", _bindings),
+    ("Filter", _filter),
+    ("FindNodeBackwards", _find_node_backwards),
+    ("MergeVariables", _merge_variables),
+    ("PasteVariable", _paste_variable),
+)
+
+
+def _best_time(generate, size, operation, repeat):
+  best = None
+  for _ in range(repeat):
+    g = generate(size)
+    start = time.time()
+    operation(g)
+    elapsed = time.time() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+def _net_objects(generate, size, operation):
+  """Count the objects the operation leaves behind, on a new program."""
+  g = generate(size)
+  gc.collect()
+  gc.disable()
+  try:
+    before = len(gc.get_objects())
+    operation(g)
+    gc.collect()
+    return len(gc.get_objects()) - before
+  finally:
+    gc.enable()
+
+
+def main(argv):
+  parser = optparse.OptionParser(usage="%prog [options] [shapes...]")
+  parser.add_option("--repeat", type="int", default=5,
+                    help="Number of runs per operation; the best one is "
+                    "reported.")
+  parser.add_option("--size", type="int", default=1,
+                    help="Multiplier for the size of the generated programs.")
+  opts, selected = parser.parse_args(argv[1:])
+  print "%-12s %-18s %7s %7s %10s %8s" % (
+      "shape", "operation", "nodes", "vars", "time", "objects")
+  for shape, generate, size in _SHAPES:
+    if selected and shape not in selected:
+      continue
+    size *= opts.size
+    g = generate(size)
+    nodes, variables = len(g.program.cfg_nodes), g.program.next_variable_id
+    for name, operation in _OPERATIONS:
+      seconds = _best_time(generate, size, operation, opts.repeat)
+      objects = _net_objects(generate, size, operation)
+      print "%-12s %-18s %7d %7d %8.3fms %8d" % (
+          shape, name, nodes, variables, seconds * 1000, objects)
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv) or 0)
@@ -0,0 +1,134 @@
+"""Benchmark for the traversal in pytd/parse/node.py.
+
+Times two workloads that are dominated by visitors: loading __builtin__ and
+typing (pytd_builtins.GetBuiltinsAndTyping, without its cache), and running
+optimize.Optimize over __builtin__, like scripts/pytype does for its output.
+Each workload runs twice: once with the current node.Visit, and once emulating
+the old one (per-visit timing and metric lookups even with metrics disabled,
+and a new list of children for every node and tuple).
+
+Usage:
+  python -m pytype.benchmarks.visitors [--repeat=N]
+"""
+
+import optparse
+import sys
+import time
+
+from pytype import metrics
+from pytype.pytd import optimize
+from pytype.pytd import utils as pytd_utils
+from pytype.pytd.parse import builtins
+from pytype.pytd.parse import node
+
+
+def _legacy_visit_node(n, visitor, *args, **kwargs):
+  """What node._VisitNode did before the fast path for unchanged children."""
+  node_class = n.__class__
+  if node_class is tuple:
+    changed = False
+    new_children = []
+    for child in n:
+      new_child = _legacy_visit_node(child, visitor, *args, **kwargs)
+      if new_child is not child:
+        changed = True
+      new_children.append(new_child)
+    return node_class(new_children) if changed else n
+  elif not isinstance(n, tuple):
+    return n
+  node_class_name = node_class.__name__
+  if node_class_name not in visitor.visit_class_names:
+    return n
+  if node_class_name in visitor.enter_functions:
+    if visitor.Enter(n, *args, **kwargs) is False:
+      return n
+  changed = False
+  new_children = []
+  for child in n:
+    new_child = _legacy_visit_node(child, visitor, *args, **kwargs)
+    if new_child is not child:
+      changed = True
+    new_children.append(new_child)
+  if changed:
+    if node_class_name in visitor.unchecked_node_names:
+      new_node = node._CreateUnchecked(node_class, *new_children)  # pylint: disable=protected-access
+    else:
+      new_node = node_class(*new_children)
+  else:
+    new_node = n
+  visitor.old_node = n
+  if (visitor.visits_all_node_types or
+      node_class_name in visitor.visit_functions):
+    new_node = visitor.Visit(new_node, *args, **kwargs)
+  if node_class_name in visitor.leave_functions:
+    visitor.Leave(n, *args, **kwargs)
+  del visitor.old_node
+  return new_node
+
+
+_legacy_visiting = set()
+
+
+def _legacy_visit(n, visitor, *args, **kwargs):
+  """What node._Visit did before it skipped timing with metrics disabled."""
+  name = type(visitor).__name__
+  recursive = name in _legacy_visiting
+  _legacy_visiting.add(name)
+  start = time.clock()
+  try:
+    return _legacy_visit_node(n, visitor, *args, **kwargs)
+  finally:
+    if not recursive:
+      _legacy_visiting.remove(name)
+      elapsed = time.clock() - start
+      metrics.get_metric("visit_" + name, metrics.Distribution).add(elapsed)
+      if _legacy_visiting:
+        metrics.get_metric(
+            "visit_nested_" + name, metrics.Distribution).add(elapsed)
+
+
+def _load_builtins():
+  builtins._cached_builtins_pytd = None  # pylint: disable=protected-access
+  builtins.GetBuiltinsAndTyping()
+
+
+def _optimize(ast, builtins_pytd):
+  return lambda: optimize.Optimize(ast, builtins_pytd, lossy=False,
+                                   use_abcs=False, max_union=7,
+                                   remove_mutable=False)
+
+
+def _best_time(f, repeat):
+  best = None
+  for _ in range(repeat):
+    start = time.time()
+    f()
+    elapsed = time.time() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+def main(argv):
+  parser = optparse.OptionParser(usage="%prog [options]")
+  parser.add_option("--repeat", type="int", default=5,
+                    help="Number of runs per workload; the best one is "
+                    "reported.")
+  opts, _ = parser.parse_args(argv[1:])
+  b, t = builtins.GetBuiltinsAndTyping()
+  workloads = [("load builtins", _load_builtins),
+               ("optimize", _optimize(b, pytd_utils.Concat(b, t)))]
+  visit = node._Visit  # pylint: disable=protected-access
+  print "%-14s %10s %10s %8s" % ("workload", "before", "after", "speedup")
+  for name, f in workloads:
+    try:
+      node._Visit = _legacy_visit  # pylint: disable=protected-access
+      before = _best_time(f, opts.repeat)
+    finally:
+      node._Visit = visit  # pylint: disable=protected-access
+    after = _best_time(f, opts.repeat)
+    print "%-14s %9.1fms %9.1fms %7.2fx" % (
+        name, before * 1000, after * 1000, before / after)
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv) or 0)
@@ -0,0 +1,203 @@
+"""On-disk cache for compiled and block-ordered bytecode.
+
+Compiling a file (in an external Python process) and then disassembling and
+ordering its bytecode is repeated for every run, even for inputs that haven't
+changed, most notably __builtin__.py. This module stores the result of
+VirtualMachine.compile_src, i.e., a tree of blocks.OrderedCode objects, in a
+directory, keyed by a hash of everything that influences it.
+
+OrderedCode is a heavily linked structure (opcodes point to their neighbors,
+blocks to each other), which doesn't pickle well. We hence serialize it into
+a compact, flat form of tuples and ints, and rebuild the links on load.
+"""
+
+import cPickle
+import cStringIO
+import hashlib
+import logging
+import os
+import sys
+
+from pytype import __version__
+from pytype import blocks
+from pytype import metrics
+from pytype import utils
+from pytype.pyc import compile_bytecode
+from pytype.pyc import loadmarshal
+from pytype.pyc import magic
+from pytype.pyc import opcodes
+from pytype.pyc import pyc
+
+
+log = logging.getLogger(__name__)
+
+
+# Bump this whenever the serialized format changes.
+_FORMAT_VERSION = 1
+
+_cache_hits = metrics.Counter("bytecode_cache_hits")
+_cache_misses = metrics.Counter("bytecode_cache_misses")
+
+# The modules that compile, load and order the bytecode we cache. Their source
+# is part of the key, so that editing them doesn't leave stale entries behind.
+_SOURCE_MODULES = (blocks, compile_bytecode, loadmarshal, magic, opcodes, pyc)
+
+_source_hash = None
+
+
+def source_hash():
+  """Hash the source of this module and of _SOURCE_MODULES.
+
+  This is only computed once per process.
+
+  Returns:
+    A hex digest.
+  """
+  global _source_hash
+  if _source_hash is None:
+    m = hashlib.sha1()
+    for module in _SOURCE_MODULES + (sys.modules[__name__],):
+      filename = module.__file__
+      if filename.endswith((".pyc", ".pyo")) and os.path.exists(filename[:-1]):
+        filename = filename[:-1]
+      m.update(module.__name__ + "\0")
+      with open(filename, "rb") as fi:
+        m.update(fi.read())
+    _source_hash = m.hexdigest()
+  return _source_hash
+
+
+def _persistent_id(obj):
+  # Ellipsis (a possible constant in Python 3 code) can't be pickled.
+  if obj is Ellipsis:
+    return "Ellipsis"
+  return None
+
+
+def _persistent_load(pid):
+  if pid == "Ellipsis":
+    return Ellipsis
+  raise cPickle.UnpicklingError("Invalid persistent id: %r" % pid)
+
+
+def _encode_code(code):
+  """Flatten an OrderedCode into tuples of primitive values."""
+  fields = {name: value for name, value in code.__dict__.items()
+            if name.startswith("co_") and name not in ("co_code", "co_consts")}
+  consts = tuple((True, _encode_code(c)) if isinstance(c, blocks.OrderedCode)
+                 else (False, c)
+                 for c in code.co_consts)
+  ops = tuple((op.name, op.line, op.arg, op.pretty_arg) if op.has_arg()
+              else (op.name, op.line)
+              for op in code.co_code)
+  block_targets = tuple((op.index, op.block_target.index)
+                        for op in code.co_code
+                        if getattr(op, "block_target", None))
+  # Blocks that are unreachable aren't part of the order, but they still
+  # contribute edges, so we store them, too, after the ordered ones.
+  all_blocks = list(code.order)
+  position = {block: i for i, block in enumerate(all_blocks)}
+  for block in all_blocks:
+    for b in sorted(block.incoming | block.outgoing, key=lambda b: b.id):
+      if b not in position:
+        position[b] = len(all_blocks)
+        all_blocks.append(b)
+  block_data = tuple((block.code[0].index, block.code[-1].index + 1,
+                      tuple(sorted(position[b] for b in block.outgoing)))
+                     for block in all_blocks)
+  return (fields, isinstance(code.co_consts, tuple), consts, ops,
+          block_targets, block_data, len(code.order), code.python_version)
+
+
+class _CodeFields(object):
+  """Holds the co_* attributes for constructing an OrderedCode."""
+
+  def __init__(self, fields):
+    self.__dict__.update(fields)
+    self.co_code = ()
+
+
+def _decode_code(data):
+  """Inverse of _encode_code."""
+  (fields, consts_is_tuple, consts, ops, block_targets, block_data,
+   num_ordered, python_version) = data
+  co_consts = [_decode_code(c) if is_code else c for is_code, c in consts]
+  fields["co_consts"] = tuple(co_consts) if consts_is_tuple else co_consts
+  code = []
+  for index, op in enumerate(ops):
+    cls = getattr(opcodes, op[0])
+    if len(op) == 4:
+      code.append(cls(index, op[1], op[2], op[3]))  # pytype: disable=wrong-arg-count
+    else:
+      code.append(cls(index, op[1]))
+  for i, op in enumerate(code):
+    if op.FLAGS & (opcodes.HAS_JREL | opcodes.HAS_JABS):
+      op.target = code[op.arg]
+    op.prev = code[i - 1] if i > 0 else None
+    op.next = code[i + 1] if i < len(code) - 1 else None
+    op.block_target = None
+  for index, target in block_targets:
+    code[index].block_target = code[target]
+  all_blocks = [blocks.Block(code[start:end]) for start, end, _ in block_data]
+  for block, (_, _, outgoing) in zip(all_blocks, block_data):
+    for i in outgoing:
+      block.connect_outgoing(all_blocks[i])
+  return blocks.OrderedCode(_CodeFields(fields), code,
+                            all_blocks[:num_ordered], python_version)
+
+
+def dumps(code):
+  """Serialize an OrderedCode (including nested code objects) to a string."""
+  f = cStringIO.StringIO()
+  pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+  pickler.persistent_id = _persistent_id
+  pickler.dump(_encode_code(code))
+  return f.getvalue()
+
+
+def loads(s):
+  """Inverse of dumps."""
+  unpickler = cPickle.Unpickler(cStringIO.StringIO(s))
+  unpickler.persistent_load = _persistent_load
+  return _decode_code(unpickler.load())
+
+
+class BytecodeCache(object):
+  """A directory of serialized OrderedCode, keyed by a content hash."""
+
+  def __init__(self, cache_dir):
+    self._cache_dir = cache_dir
+
+  def key(self, src, filename, mode, python_version, python_exe):
+    """Compute the cache key for the given compile parameters."""
+    m = hashlib.sha1()
+    m.update(repr((_FORMAT_VERSION, __version__.__version__, source_hash(),
+                   filename, mode, tuple(python_version), python_exe)))
+    m.update(src.encode("utf-8") if isinstance(src, unicode) else src)
+    return m.hexdigest()
+
+  def _path(self, key):
+    return os.path.join(self._cache_dir, key[:2], key[2:])
+
+  def get(self, key):
+    """Look up a key. Returns an OrderedCode, or None."""
+    try:
+      with open(self._path(key), "rb") as fi:
+        data = fi.read()
+    except IOError:
+      _cache_misses.inc()
+      return None
+    try:
+      code = loads(data)
+    except Exception:  # pylint: disable=broad-except
+      log.warning("Ignoring corrupt bytecode cache entry %s", key)
+      _cache_misses.inc()
+      return None
+    _cache_hits.inc()
+    return code
+
+  def put(self, key, code):
+    try:
+      utils.atomic_write(self._path(key), dumps(code))
+    except (IOError, OSError) as e:
+      log.warning("Couldn't write bytecode cache entry %s: %s", key, e)
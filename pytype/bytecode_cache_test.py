@@ -0,0 +1,117 @@
+"""Tests for bytecode_cache.py."""
+
+import textwrap
+
+from pytype import blocks
+from pytype import bytecode_cache
+from pytype import utils
+from pytype.pyc import pyc
+import unittest
+
+
+class BytecodeCacheTest(unittest.TestCase):
+  """Tests for serializing and caching OrderedCode."""
+
+  python_version = (2, 7)
+
+  def _compile(self, src):
+    code = pyc.compile_src(textwrap.dedent(src), self.python_version,
+                           python_exe=None, filename="test_input.py")
+    return blocks.process_code(code)
+
+  def _describe(self, code):
+    """Build a comparable representation of an OrderedCode."""
+    def index(op):
+      return op and op.index
+    consts = [self._describe(c) if isinstance(c, blocks.OrderedCode) else c
+              for c in code.co_consts]
+    fields = sorted((k, v) for k, v in code.__dict__.items()
+                    if k.startswith("co_") and k not in ("co_code",
+                                                         "co_consts"))
+    ops = [(op.name, op.index, op.line, getattr(op, "arg", None),
+            getattr(op, "pretty_arg", None), index(op.target),
+            index(op.prev), index(op.next), index(op.block_target))
+           for op in code.co_code]
+    order = [(b.id, [op.index for op in b.code],
+              sorted(x.id for x in b.incoming),
+              sorted(x.id for x in b.outgoing)) for b in code.order]
+    return (fields, type(code.co_consts), consts, ops, order,
+            code.python_version)
+
+  def assertRoundTrips(self, src):
+    code = self._compile(src)
+    reloaded = bytecode_cache.loads(bytecode_cache.dumps(code))
+    self.assertEqual(self._describe(code), self._describe(reloaded))
+    for op in reloaded.co_code:
+      self.assertIs(reloaded, op.code)
+
+  def test_simple(self):
+    self.assertRoundTrips("x = 1")
+
+  def test_control_flow(self):
+    self.assertRoundTrips("""
+      def f(x):
+        for i in x:
+          try:
+            if i:
+              break
+            x = [y for y in i]
+          except ValueError:
+            raise
+          finally:
+            del x
+        while x:
+          x -= 1
+        return lambda: i
+      class A(object):
+        def g(self):
+          return f(self)
+    """)
+
+  def test_cache(self):
+    code = self._compile("def f(): return 3")
+    with utils.Tempdir() as d:
+      cache = bytecode_cache.BytecodeCache(d.path)
+      key = cache.key("src", "test_input.py", "exec", self.python_version,
+                      None)
+      self.assertIsNone(cache.get(key))
+      cache.put(key, code)
+      self.assertEqual(self._describe(code), self._describe(cache.get(key)))
+
+  def test_key(self):
+    cache = bytecode_cache.BytecodeCache("/nonexistent")
+    key = cache.key("x = 1", "a.py", "exec", (2, 7), None)
+    self.assertEqual(key, cache.key("x = 1", "a.py", "exec", (2, 7), None))
+    self.assertNotEqual(key, cache.key("x = 2", "a.py", "exec", (2, 7), None))
+    self.assertNotEqual(key, cache.key("x = 1", "b.py", "exec", (2, 7), None))
+    self.assertNotEqual(key, cache.key("x = 1", "a.py", "exec", (3, 6), None))
+    self.assertNotEqual(key, cache.key("x = 1", "a.py", "exec", (2, 7),
+                                       "python2.7"))
+
+  def test_key_source_hash(self):
+    cache = bytecode_cache.BytecodeCache("/nonexistent")
+    key = cache.key("x = 1", "a.py", "exec", (2, 7), None)
+    source_hash = bytecode_cache.source_hash()
+    self.addCleanup(setattr, bytecode_cache, "_source_hash", source_hash)
+    # Simulate an edit to blocks.py or pyc/opcodes.py.
+    bytecode_cache._source_hash = "edited"
+    self.assertNotEqual(key, cache.key("x = 1", "a.py", "exec", (2, 7), None))
+
+  def test_corrupt_entry(self):
+    with utils.Tempdir() as d:
+      cache = bytecode_cache.BytecodeCache(d.path)
+      key = cache.key("x = 1", "a.py", "exec", self.python_version, None)
+      d.create_file("%s/%s" % (key[:2], key[2:]), "garbage")
+      self.assertIsNone(cache.get(key))
+
+
+class BytecodeCachePython3Test(BytecodeCacheTest):
+
+  python_version = (3, 6)
+
+  def test_ellipsis(self):
+    self.assertRoundTrips("x = (..., 1)")
+
+
+if __name__ == "__main__":
+  unittest.main()
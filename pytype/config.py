@@ -41,7 +41,10 @@ class Options(object):
     """
     o = self._options()
     self._options, arguments = o.parse_args(argv)
-    self._options.input, output = _parse_arguments(arguments[1:])
+    if self._options.batch:
+      self._options.input, output = arguments[1:] or None, None
+    else:
+      self._options.input, output = _parse_arguments(arguments[1:])
     if output:
       if self._options.output:
         raise optparse.OptionValueError("x:y notation not allowed with -o")
@@ -68,6 +71,12 @@ class Options(object):
         usage=("Usage: %prog [options] "
                "file1.py[:file1.pyi] [file2.py:file2.pyi [...]]"),
         description="Infer/check types in a Python module")
+    o.add_option(
+        "--batch", action="store_true",
+        dest="batch", default=False,
+        help=("Process all the given files, in the order of their imports, "
+              "in a pool of worker processes. The output (-o) is a directory "
+              "into which a .pyi is written for every module."))
     o.add_option(
         "-B", "--builtins", type="string", action="store",
         dest="pybuiltins_filename", default=None,
@@ -82,10 +91,27 @@ class Options(object):
         "-C", "--check", action="store_true",
         dest="check",
         help=("Don't do type inference. Only check for type errors."))
+    o.add_option(
+        "--cache-dir", type="string", action="store",
+        dest="cache_dir", default=None,
+        help=("Directory for caching intermediate results (like compiled "
+              "bytecode, or resolved pytd and typeshed modules) across runs. "
+              "Can be shared between processes."))
     o.add_option(
         "--check_preconditions", action="store_true",
         dest="check_preconditions", default=False,
         help=("Enable checking of preconditions."))
+    o.add_option(
+        "--compact-typegraph", action="store_true",
+        dest="compact_typegraph", default=False,
+        help=("Use a more memory efficient representation of the typegraph, "
+              "at the cost of some speed."))
+    o.add_option(
+        "--connect", type="string", action="store",
+        dest="connect", default=None,
+        help=("Send the input file to a pytype daemon listening on the given "
+              "Unix socket (see --serve), instead of processing it in this "
+              "process."))
     o.add_option(
         "-d", "--disable", action="store",
         dest="disable", default=None,
@@ -105,6 +131,16 @@ class Options(object):
         dest="imports_map", default=None,
         help=("Information for mapping import .pytd to files. "
               "This options is incompatible with --pythonpath."))
+    o.add_option(
+        "--intern-pytd", action="store_true",
+        dest="intern_pytd", default=False,
+        help=("Share a single instance between structurally equal types in "
+              "loaded pyi files, to save memory."))
+    o.add_option(
+        "-j", "--jobs", type="int", action="store",
+        dest="jobs", default=0,
+        help=("Number of worker processes to use with --batch. Defaults to "
+              "the number of CPUs."))
     o.add_option(
         "-m", "--main", action="store_true",
         dest="main_only", default=False,
@@ -124,6 +160,11 @@ class Options(object):
         "--metrics", type="string", action="store",
         dest="metrics", default=None,
         help="Write a metrics report to the specified file.")
+    o.add_option(
+        "--trace", type="string", action="store",
+        dest="trace", default=None,
+        help=("Write a trace of where the time goes, in the Chrome trace event "
+              "format, to the specified file. Open it in chrome://tracing."))
     o.add_option(
         "-N", "--no-cache-unknowns", action="store_false",
         dest="cache_unknowns", default=True,
@@ -192,6 +233,11 @@ class Options(object):
               "'foo.bar.pyi' and load it instead. This will load the pickled "
               "file without further verification. Allowing untrusted pickled "
               "files into the code tree can lead to arbitrary code execution!"))
+    o.add_option(
+        "--lazy-pickled-files", action="store_true", default=False,
+        dest="lazy_pickled_files",
+        help=("With --use-pickled-files, map pickled files into memory and "
+              "only decode the members of a module that are used."))
     o.add_option(
         "-P", "--pythonpath", type="string", action="store",
         dest="pythonpath", default="",
@@ -209,6 +255,12 @@ class Options(object):
         "--protocols", action="store_true",
         dest="protocols", default=False,
         help=("Solve unknown types to label with structural types."))
+    o.add_option(
+        "--serve", type="string", action="store",
+        dest="serve", default=None,
+        help=("Run as a daemon, serving check and infer requests (from "
+              "--connect) on the given Unix socket. The other options are "
+              "used as defaults for all requests."))
     o.add_option(
         "--touch", type="string", action="store",
         dest="touch", default=None,
@@ -276,6 +328,12 @@ class Options(object):
       else:
         setattr(self, node.name, value)
 
+  @uses(["input", "output"])
+  def _store_batch(self, batch):
+    if batch and self.input and not self.output:
+      raise optparse.OptParseError("--batch needs an output directory (-o).")
+    self.batch = batch
+
   @uses(["output"])
   def _store_check(self, check):
     if check is None:
@@ -286,13 +344,13 @@ class Options(object):
     else:
       self.check = check
 
-  @uses(["input"])
+  @uses(["input", "serve"])
   def _store_generate_builtins(self, generate_builtins):
     if generate_builtins:
       if self.input:
         raise optparse.OptionConflictError("Not allowed with an input file",
                                            "generate-builtins")
-    elif not self.input:
+    elif not self.input and not self.serve:
       raise optparse.OptParseError("Need a filename.")
     self.generate_builtins = generate_builtins
 
@@ -358,16 +416,19 @@ class Options(object):
                                      python_exe)
     self.python_exe = python_exe
 
-  @uses(["pythonpath", "output", "verbosity"])
+  @uses(["pythonpath", "output", "verbosity", "batch"])
   def _store_imports_map(self, imports_map):
     """Postprocess --imports_info."""
+    self.imports_info = imports_map
     if imports_map:
       if self.pythonpath not in ([], [""]):
         raise optparse.OptionConflictError(
             "Not allowed with --pythonpath", "imports_info")
 
+      # In batch mode, the output is a directory, and the outputs of the
+      # individual modules are added to the map as they're generated.
       self.imports_map = imports_map_loader.build_imports_map(
-          imports_map, self.output)
+          imports_map, None if self.batch else self.output)
     else:
       self.imports_map = None
 
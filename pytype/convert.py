@@ -1,11 +1,13 @@
 """Code for translating between type systems."""
 
+import collections
 import logging
 import types
 
 
 from pytype import abstract
 from pytype import blocks
+from pytype import metrics
 from pytype import output
 from pytype import special_builtins
 from pytype import utils
@@ -13,6 +15,7 @@ from pytype.pyc import loadmarshal
 from pytype.pytd import cfg
 from pytype.pytd import mro
 from pytype.pytd import pytd
+from pytype.pytd import serialize_ast
 from pytype.pytd import utils as pytd_utils
 
 
@@ -21,6 +24,86 @@ log = logging.getLogger(__name__)
 
 MAX_IMPORT_DEPTH = 12
 
+_templates_metric = metrics.MapCounter("convert_library_templates")
+
+
+# The parts of a PyTDClass that only depend on its pytd.Class.
+ClassTemplate = collections.namedtuple(
+    "ClassTemplate", ["member_map", "abstract_methods"])
+
+
+def make_class_template(pytd_cls):
+  member_map = {val.name: val for val in pytd_cls.constants + pytd_cls.methods}
+  abstract_methods = tuple(
+      name for name, member in member_map.items()
+      if isinstance(member, pytd.Function) and member.is_abstract)
+  return ClassTemplate(member_map, abstract_methods)
+
+
+class LibraryTemplates(object):
+  """Conversion data for __builtin__ and typing, shared by all VMs.
+
+  The pytd of __builtin__ and typing is loaded once per process (see
+  builtins.GetBuiltinsAndTyping) and never modified, so whatever we derive from
+  it can be reused by every VM in the process, e.g. when analyzing a batch of
+  modules. Abstract values themselves can't be shared, since they refer to
+  their VM and hold variables of its typegraph. Instead, every VM builds its
+  own from the templates kept here.
+
+  Attributes:
+    asts: The pytd.TypeDeclUnit of __builtin__ and typing.
+  """
+
+  def __init__(self, builtins_ast, typing_ast):
+    self.asts = (builtins_ast, typing_ast)
+    # The classes and functions in the asts. They are unique, and live as long
+    # as the asts do, so they can be identified by their ids.
+    self._node_ids = set()
+    for ast in self.asts:
+      for cls in ast.classes:
+        self._node_ids.add(id(cls))
+        self._node_ids.update(id(method) for method in cls.methods)
+      self._node_ids.update(id(f) for f in ast.functions)
+    # id(pytd.Class) -> ClassTemplate
+    self._class_templates = {}
+
+  def is_library_node(self, pyval):
+    return id(pyval) in self._node_ids
+
+  def get_class_template(self, pytd_cls):
+    """Get the template of a pytd.Class.
+
+    Args:
+      pytd_cls: A pytd.Class.
+
+    Returns:
+      A ClassTemplate. For classes in __builtin__ and typing, it's only created
+      once per process.
+    """
+    if not self.is_library_node(pytd_cls):
+      return make_class_template(pytd_cls)
+    template = self._class_templates.get(id(pytd_cls))
+    if template is None:
+      _templates_metric.inc("miss")
+      template = make_class_template(pytd_cls)
+      self._class_templates[id(pytd_cls)] = template
+    else:
+      _templates_metric.inc("hit")
+    return template
+
+
+_library_templates = None
+
+
+def get_library_templates(builtins_ast, typing_ast):
+  """Get the LibraryTemplates for the given __builtin__ and typing."""
+  global _library_templates
+  if (_library_templates is None or
+      _library_templates.asts[0] is not builtins_ast or
+      _library_templates.asts[1] is not typing_ast):
+    _library_templates = LibraryTemplates(builtins_ast, typing_ast)
+  return _library_templates
+
 
 class Converter(object):
   """Functions for creating the classes in abstract.py."""
@@ -38,6 +121,8 @@ class Converter(object):
     self.pytd_convert = output.Converter()
 
     self._convert_cache = {}
+    self._library_templates = get_library_templates(
+        vm.loader.builtins, vm.loader.typing)
 
     # Initialize primitive_classes to empty to allow constant_to_value to run.
     self.primitive_classes = ()
@@ -74,7 +159,8 @@ class Converter(object):
       else:
         instance = abstract.Instance(cls, self.vm)
       self.primitive_class_instances[name] = instance
-      self._convert_cache[(abstract.Instance, cls.pytd_cls)] = instance
+      key = self._get_cache_key(abstract.Instance, cls.pytd_cls)
+      self._convert_cache[key] = instance
 
     self.none_type = self.primitive_classes[types.NoneType]
     self.oldstyleclass_type = self.primitive_classes[types.ClassType]
@@ -105,6 +191,26 @@ class Converter(object):
         None: self.primitive_class_instances[bool],
     }
 
+  def _get_cache_key(self, kind, pyval):
+    """Get the key for pyval in _convert_cache.
+
+    Hashing a pytd.Class hashes its whole definition, so classes and functions
+    from __builtin__ and typing, which are unique, are keyed by id.
+
+    Args:
+      kind: What pyval is converted to, e.g. "constant" or abstract.Instance.
+      pyval: The value to convert.
+
+    Returns:
+      A hashable key.
+    """
+    if self._library_templates.is_library_node(pyval):
+      return kind, id(pyval)
+    return kind, pyval, type(pyval)
+
+  def get_class_template(self, pytd_cls):
+    return self._library_templates.get_class_template(pytd_cls)
+
   def value_to_constant(self, val, constant_type):
     if (isinstance(val, abstract.PythonConstant) and
         isinstance(val.pyval, constant_type or object)):
@@ -381,7 +487,7 @@ class Converter(object):
       The converted constant. (Instance of AtomicAbstractValue)
     """
     node = node or self.vm.root_cfg_node
-    key = ("constant", pyval, type(pyval))
+    key = self._get_cache_key("constant", pyval)
     if key in self._convert_cache:
       if self._convert_cache[key] is None:
         # This error is triggered by, e.g., classes inheriting from each other.
@@ -454,6 +560,8 @@ class Converter(object):
       except (KeyError, AttributeError):
         log.debug("Failed to find pytd", exc_info=True)
         raise
+    elif isinstance(pyval, serialize_ast.LazyTypeDeclUnit):
+      return abstract.Module(self.vm, pyval.name, pyval.MemberMap(), pyval)
     elif isinstance(pyval, pytd.TypeDeclUnit):
       data = (pyval.constants + pyval.type_params + pyval.classes +
               pyval.functions + pyval.aliases)
@@ -523,7 +631,7 @@ class Converter(object):
         cls = cls.cls
       if isinstance(cls, pytd.Class):
         # This key is also used in __init__
-        key = (abstract.Instance, cls)
+        key = self._get_cache_key(abstract.Instance, cls)
         if key not in self._convert_cache:
           if cls.name in ["__builtin__.type", "__builtin__.property"]:
             # An instance of "type" or of an anonymous property can be anything.
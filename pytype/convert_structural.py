@@ -3,6 +3,7 @@
 import itertools
 import logging
 
+from pytype import metrics
 from pytype.pytd import booleq
 from pytype.pytd import optimize
 from pytype.pytd import pytd
@@ -204,12 +205,13 @@ def solve(ast, builtins_pytd, protocols_pytd):
     A tuple of (1) a dictionary (str->str) mapping unknown class names to known
     class names and (2) a pytd.TypeDeclUnit of the complete classes in ast.
   """
-  builtins_pytd = transforms.RemoveMutableParameters(builtins_pytd)
-  builtins_pytd = visitors.LookupClasses(builtins_pytd)
-  protocols_pytd = visitors.LookupClasses(protocols_pytd)
-  ast = visitors.LookupClasses(ast, builtins_pytd)
-  return TypeSolver(
-      ast, builtins_pytd, protocols_pytd).solve(), extract_local(ast)
+  with metrics.span("solve"):
+    builtins_pytd = transforms.RemoveMutableParameters(builtins_pytd)
+    builtins_pytd = visitors.LookupClasses(builtins_pytd)
+    protocols_pytd = visitors.LookupClasses(protocols_pytd)
+    ast = visitors.LookupClasses(ast, builtins_pytd)
+    return TypeSolver(
+        ast, builtins_pytd, protocols_pytd).solve(), extract_local(ast)
 
 
 def extract_local(ast):
@@ -3,6 +3,7 @@
 
 from pytype import abstract
 from pytype import config
+from pytype import convert
 from pytype import errors
 from pytype import load_pytd
 from pytype import utils
@@ -283,6 +284,48 @@ class ConvertTest(unittest.TestCase):
     parameterized_cls = abstract.ParameterizedClass(cls, {}, self._vm)
     self.assertListEqual(parameterized_cls.abstract_methods, ["f"])
 
+  def test_library_templates(self):
+    options = config.Options.create()
+    other_vm = vm.VirtualMachine(
+        errors.ErrorLog(), options, load_pytd.Loader(None, options))
+    pytd_cls = self._vm.lookup_builtin("__builtin__.dict")
+    template = self._vm.convert.get_class_template(pytd_cls)
+    self.assertIs(template, other_vm.convert.get_class_template(pytd_cls))
+    cls = self._vm.convert.constant_to_value(pytd_cls)
+    other_cls = other_vm.convert.constant_to_value(pytd_cls)
+    self.assertIsNot(cls, other_cls)
+    self.assertIs(other_cls.vm, other_vm)
+    self.assertIs(cls, self._vm.convert.constant_to_value(pytd_cls))
+
+  def test_library_template_member_map(self):
+    pytd_cls = self._vm.lookup_builtin("__builtin__.dict")
+    template = self._vm.convert.get_class_template(pytd_cls)
+    cls = self._vm.convert.constant_to_value(pytd_cls)
+    cls._member_map["x"] = None  # pylint: disable=protected-access
+    self.assertNotIn("x", template.member_map)
+
+  def test_non_library_template(self):
+    ast = self._load_ast("a", """
+      class A(object):
+        @abstractmethod
+        def f(self) -> int: ...
+    """)
+    pytd_cls = ast.Lookup("a.A")
+    template = self._vm.convert.get_class_template(pytd_cls)
+    self.assertItemsEqual(template.member_map, ["f"])
+    self.assertEqual(template.abstract_methods, ("f",))
+    self.assertIsNot(template, self._vm.convert.get_class_template(pytd_cls))
+
+  def test_get_library_templates(self):
+    loader = self._vm.loader
+    templates = convert.get_library_templates(loader.builtins, loader.typing)
+    self.assertIs(
+        templates,
+        convert.get_library_templates(loader.builtins, loader.typing))
+    self.assertTrue(templates.is_library_node(loader.builtins.Lookup(
+        "__builtin__.int")))
+    self.assertFalse(templates.is_library_node(pytd.AnythingType()))
+
 
 if __name__ == "__main__":
   unittest.main()
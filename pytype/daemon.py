@@ -0,0 +1,206 @@
+"""A resident pytype process that serves requests over a Unix socket.
+
+For small inputs, most of the time of a pytype run goes into startup: parsing
+the builtins, typing and typeshed .pytd files and starting a compiler process.
+A daemon does all of this once, and then keeps the parsed ASTs, the compiler
+workers and the bytecode of __builtin__.py around for subsequent requests.
+
+Every request gets its own options, loader and error log, so nothing that's
+loaded or inferred for one file is visible to the next one.
+
+The protocol is one line of JSON in each direction, per connection. Requests:
+  {"command": "infer" | "check", "filename": <path to .py file>,
+   "module_name": <optional>, "pythonpath": <optional, like --pythonpath>,
+   "imports_info": <optional, like --imports_info>}
+  {"command": "shutdown"}
+Responses:
+  {"exit_code": <int>, "errors": <str>, "pyi": <str, or null when checking>}
+  {"error": <str>} if the request couldn't be processed.
+"""
+
+import copy
+import json
+import logging
+import os
+import shutil
+import socket
+import SocketServer
+import tempfile
+import traceback
+
+from pytype import imports_map_loader
+from pytype import infer
+from pytype.pyc import pyc
+from pytype.pytd.parse import builtins
+
+
+log = logging.getLogger(__name__)
+
+
+def _str(s):
+  # JSON decodes all strings as unicode.
+  return s.encode("utf-8") if isinstance(s, unicode) else s
+
+
+class DaemonError(Exception):
+  """Raised by the client if the daemon couldn't process a request."""
+
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+
+  def handle(self):
+    try:
+      response = self.server.process(json.loads(self.rfile.readline()))
+    except Exception:  # pylint: disable=broad-except
+      log.error("Error processing request", exc_info=True)
+      response = {"error": traceback.format_exc()}
+    self.wfile.write(json.dumps(response) + "\n")
+
+
+class Daemon(SocketServer.UnixStreamServer):
+  """Processes requests one at a time, until asked to shut down."""
+
+  def __init__(self, socket_path, options, analyze):
+    """Initialize the daemon.
+
+    Args:
+      socket_path: The Unix socket to listen on.
+      options: config.Options object, with the settings for all requests.
+      analyze: A function (input_filename, options) -> (errorlog, pyi source)
+        that checks or infers a single file.
+    """
+    SocketServer.UnixStreamServer.__init__(self, socket_path, _RequestHandler)
+    self.options = options
+    self._analyze = analyze
+    self._stopped = False
+
+  def warm_up(self):
+    """Load everything that's shared between requests."""
+    builtins.GetBuiltinsAndTyping()
+    # Start a compiler worker.
+    pyc.compile_src("", self.options.python_version, self.options.python_exe,
+                    "<warmup>")
+
+  def _request_options(self, request):
+    """Create the options for a single request."""
+    request = {_str(k): _str(v) for k, v in request.items()}
+    options = copy.copy(self.options)
+    options.tweak(input=request["filename"],
+                  output=None,
+                  check=request["command"] == "check",
+                  module_name=request.get("module_name"))
+    if request.get("imports_info"):
+      options.tweak(pythonpath=[""],
+                    imports_map=imports_map_loader.build_imports_map(
+                        request["imports_info"]))
+    elif request.get("pythonpath") is not None:
+      options.tweak(pythonpath=request["pythonpath"].split(os.pathsep))
+    return options
+
+  def process(self, request):
+    """Process a single request. Returns the response."""
+    command = request.get("command")
+    if command == "shutdown":
+      self._stopped = True
+      return {}
+    elif command not in ("infer", "check"):
+      return {"error": "Unknown command: %r" % command}
+    options = self._request_options(request)
+    log.info("%s %s", command, options.input)
+    errorlog, pyi = self._analyze(options.input, options)
+    if options.report_errors:
+      exit_code = 1 if errorlog.has_error() else 0
+      errors = str(errorlog)
+    else:
+      exit_code = 0
+      errors = ""
+    return {"exit_code": exit_code, "errors": errors, "pyi": pyi}
+
+  def serve_until_shutdown(self):
+    while not self._stopped:
+      self.handle_request()
+
+
+def _remove_stale_socket(socket_path):
+  if not os.path.exists(socket_path):
+    return
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(socket_path)
+  except socket.error:
+    os.unlink(socket_path)
+  else:
+    raise DaemonError("A daemon is already listening on %s" % socket_path)
+  finally:
+    sock.close()
+
+
+def serve(socket_path, options, analyze):
+  """Run a daemon on the given socket, until it receives "shutdown".
+
+  Args:
+    socket_path: The Unix socket to listen on.
+    options: config.Options object, with the settings for all requests.
+    analyze: See Daemon.__init__.
+  """
+  _remove_stale_socket(socket_path)
+  options = copy.copy(options)
+  tmp_cache_dir = None
+  if not options.cache_dir:
+    tmp_cache_dir = tempfile.mkdtemp(prefix="pytype_daemon_")
+    options.tweak(cache_dir=tmp_cache_dir)
+  daemon = Daemon(socket_path, options, analyze)
+  try:
+    daemon.warm_up()
+    log.info("Listening on %s", socket_path)
+    daemon.serve_until_shutdown()
+  finally:
+    daemon.server_close()
+    os.unlink(socket_path)
+    if tmp_cache_dir:
+      shutil.rmtree(tmp_cache_dir)
+
+
+def make_request(options):
+  """Create the request for checking or inferring options.input."""
+  # The daemon might run in a different directory, so only send absolute paths.
+  request = {"command": "check" if options.check else "infer",
+             "filename": os.path.abspath(options.input),
+             "module_name": infer.get_module_name(options.input, options)}
+  if options.imports_info:
+    request["imports_info"] = os.path.abspath(options.imports_info)
+  else:
+    request["pythonpath"] = os.pathsep.join(
+        os.path.abspath(path) if path else path for path in options.pythonpath)
+  return request
+
+
+def send_request(socket_path, request):
+  """Send a request to a daemon and wait for the response.
+
+  Args:
+    socket_path: The Unix socket the daemon is listening on.
+    request: A request, as a dict.
+
+  Returns:
+    The response, as a dict.
+
+  Raises:
+    DaemonError: If we couldn't reach the daemon, or it couldn't process
+      the request.
+  """
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(socket_path)
+    sock.sendall(json.dumps(request) + "\n")
+    data = sock.makefile("rb").readline()
+  except socket.error as e:
+    raise DaemonError("Couldn't talk to daemon at %s: %s" % (socket_path, e))
+  finally:
+    sock.close()
+  if not data:
+    raise DaemonError("Daemon at %s closed the connection" % socket_path)
+  response = json.loads(data)
+  if "error" in response:
+    raise DaemonError(response["error"])
+  return response
@@ -0,0 +1,99 @@
+"""Tests for daemon.py."""
+
+import os
+import threading
+
+from pytype import config
+from pytype import daemon
+from pytype import errors
+from pytype import utils
+import unittest
+
+
+class DaemonTest(unittest.TestCase):
+  """Tests for serving requests over a socket."""
+
+  def setUp(self):
+    self.tempdir = utils.Tempdir()
+    self.tempdir.__enter__()
+    self.socket_path = os.path.join(self.tempdir.path, "socket")
+    self.requests = []
+    self.server = daemon.Daemon(self.socket_path, config.Options.create(),
+                                self._analyze)
+    self.thread = threading.Thread(target=self.server.serve_until_shutdown)
+    self.thread.start()
+
+  def tearDown(self):
+    if self.thread.is_alive():
+      daemon.send_request(self.socket_path, {"command": "shutdown"})
+      self.thread.join()
+    self.server.server_close()
+    self.tempdir.__exit__(None, None, None)
+
+  def _analyze(self, input_filename, options):
+    """A stand-in for the analysis done by scripts/pytype."""
+    self.requests.append(options)
+    errorlog = errors.ErrorLog()
+    if "bad" in input_filename:
+      errorlog.import_error(None, "bad_module")
+    return errorlog, None if options.check else "x = ...  # type: int\n"
+
+  def test_infer(self):
+    response = daemon.send_request(self.socket_path, {
+        "command": "infer", "filename": "/a/foo.py", "module_name": "foo",
+        "pythonpath": "/a:/b"})
+    self.assertEqual({"exit_code": 0, "errors": "",
+                      "pyi": "x = ...  # type: int\n"}, response)
+    options, = self.requests
+    self.assertEqual("/a/foo.py", options.input)
+    self.assertEqual("foo", options.module_name)
+    self.assertEqual(["/a", "/b"], options.pythonpath)
+    self.assertFalse(options.check)
+    self.assertIsInstance(options.input, str)
+
+  def test_check(self):
+    response = daemon.send_request(self.socket_path, {
+        "command": "check", "filename": "/a/bad.py"})
+    self.assertEqual(1, response["exit_code"])
+    self.assertIn("bad_module", response["errors"])
+    self.assertIsNone(response["pyi"])
+
+  def test_request_isolation(self):
+    for filename in ("/a/foo.py", "/a/bar.py"):
+      daemon.send_request(self.socket_path, {"command": "infer",
+                                             "filename": filename})
+    first, second = self.requests
+    self.assertIsNot(first, second)
+    self.assertEqual("/a/foo.py", first.input)
+    self.assertIsNot(self.server.options, first)
+    self.assertEqual("dummy_input_file", self.server.options.input)
+
+  def test_unknown_command(self):
+    self.assertRaises(daemon.DaemonError, daemon.send_request,
+                      self.socket_path, {"command": "foo"})
+
+  def test_error(self):
+    self.assertRaises(daemon.DaemonError, daemon.send_request,
+                      self.socket_path, {"command": "infer"})
+
+  def test_shutdown(self):
+    daemon.send_request(self.socket_path, {"command": "shutdown"})
+    self.thread.join()
+    self.assertFalse(self.thread.is_alive())
+
+
+class MakeRequestTest(unittest.TestCase):
+
+  def test_make_request(self):
+    options = config.Options.create(input="foo.py", pythonpath=["", "lib"],
+                                    check=True)
+    request = daemon.make_request(options)
+    self.assertEqual("check", request["command"])
+    self.assertEqual(os.path.abspath("foo.py"), request["filename"])
+    self.assertEqual("foo", request["module_name"])
+    self.assertEqual(os.pathsep.join(["", os.path.abspath("lib")]),
+                     request["pythonpath"])
+
+
+if __name__ == "__main__":
+  unittest.main()
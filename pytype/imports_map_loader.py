@@ -104,6 +104,17 @@ def build_imports_map(options_info_path, output=None):
 
   _validate_map(imports_multimap, output)
 
+  return add_init_files(imports_map)
+
+
+def add_init_files(imports_map):
+  """Add empty "__init__" entries for all directories in an imports map.
+
+  Args:
+    imports_map: Dict of short_path to .pyi path.
+  Returns:
+    A new dict, with entries for intermediate directories added.
+  """
   # Add the potential directory nodes for adding "__init__", because some build
   # systems automatically create __init__.py in empty directories. These are
   # added with the path name appended with "/" (os.sep), mapping to the empty
@@ -5,7 +5,7 @@ import logging
 import os
 import subprocess
 import sys
-
+import time
 
 from pytype import abstract
 from pytype import convert_structural
@@ -37,6 +37,123 @@ INIT_MAXIMUM_DEPTH = 4
 
 _INITIALIZING = object()
 
+_cfg_nodes_metric = metrics.Counter("program_cfg_nodes")
+_variables_metric = metrics.Counter("program_variables")
+
+
+class FunctionCosts(metrics.Metric):
+  """Where the analysis time goes, per function of the analyzed code.
+
+  Functions are identified by their code objects, so module and class bodies
+  show up, too. For every function, this tracks
+    calls: How often a frame for the function was run.
+    cached: How many calls were answered from InterpreterFunction._call_cache.
+    opcodes: How many opcodes were executed in the function itself.
+    cfg_nodes, variables: How many CFG nodes and variables were created while
+      running the function itself, i.e., not counting the functions it called.
+    time: The time spent running the function, including the functions it
+      called. Recursive calls are only counted once.
+    self_time: The time spent running the function itself.
+  """
+
+  _FIELDS = ("calls", "cached", "opcodes", "cfg_nodes", "variables", "time",
+             "self_time")
+
+  def __init__(self, name):
+    super(FunctionCosts, self).__init__(name)
+    self._functions = {}  # Map from function name to a dict of the _FIELDS.
+    # The frames that are currently running, as lists [name, start time,
+    # nodes at start, variables at start, time/nodes/variables of callees].
+    self._stack = []
+    self._active = collections.Counter()  # Function name -> running frames.
+
+  @staticmethod
+  def _function_name(code):
+    return "%s (%s:%d)" % (code.co_name, code.co_filename, code.co_firstlineno)
+
+  def _get(self, name):
+    stats = self._functions.get(name)
+    if stats is None:
+      stats = self._functions[name] = dict.fromkeys(self._FIELDS, 0)
+    return stats
+
+  def enter(self, code, program):
+    """Start running a frame for the given code object."""
+    name = self._function_name(code)
+    self._get(name)["calls"] += 1
+    self._active[name] += 1
+    self._stack.append([name, time.time(), len(program.cfg_nodes),
+                        program.next_variable_id, 0.0, 0, 0])
+
+  def exit(self, program):
+    """Finish running the frame of the latest call to enter()."""
+    name, start, nodes, variables, child_time, child_nodes, child_variables = (
+        self._stack.pop())
+    elapsed = time.time() - start
+    nodes = len(program.cfg_nodes) - nodes
+    variables = program.next_variable_id - variables
+    stats = self._get(name)
+    self._active[name] -= 1
+    if not self._active[name]:
+      stats["time"] += elapsed
+    stats["self_time"] += elapsed - child_time
+    stats["cfg_nodes"] += nodes - child_nodes
+    stats["variables"] += variables - child_variables
+    if self._stack:
+      parent = self._stack[-1]
+      parent[4] += elapsed
+      parent[5] += nodes
+      parent[6] += variables
+
+  def add_opcode(self):
+    """Count an opcode executed in the current frame."""
+    if self._stack:
+      self._get(self._stack[-1][0])["opcodes"] += 1
+
+  def add_cached_call(self, code):
+    """Count a call that was answered from the call cache."""
+    self._get(self._function_name(code))["cached"] += 1
+
+  def _sorted(self):
+    return sorted(self._functions.items(),
+                  key=lambda item: (-item[1]["self_time"], item[0]))
+
+  def _summary(self):
+    lines = ["%d functions, by self_time:" % len(self._functions)]
+    lines.append("%9s %9s %7s %7s %8s %8s %9s  %s" % (
+        "self_time", "time", "calls", "cached", "opcodes", "nodes",
+        "variables", "function"))
+    for name, stats in self._sorted():
+      lines.append("%8.3fs %8.3fs %7d %7d %8d %8d %9d  %s" % (
+          stats["self_time"], stats["time"], stats["calls"], stats["cached"],
+          stats["opcodes"], stats["cfg_nodes"], stats["variables"], name))
+    return "\n".join(lines)
+
+  def _merge(self, other):
+    # pylint: disable=protected-access
+    for name, other_stats in other._functions.items():
+      stats = self._get(name)
+      for field in self._FIELDS:
+        stats[field] += other_stats[field]
+
+  def __getstate__(self):
+    # Write the report, sorted by self_time, for --metrics.
+    functions = []
+    for name, stats in self._sorted():
+      row = {"function": name}
+      row.update(stats)
+      functions.append(row)
+    return {"_name": self._name, "functions": functions}
+
+  def __setstate__(self, state):
+    self._name = state["_name"]
+    self._functions = {}
+    for row in state["functions"]:
+      row = dict(row)
+      self._functions[row.pop("function")] = row
+    self._stack = []
+    self._active = collections.Counter()
+
 
 class CallTracer(vm.VirtualMachine):
   """Virtual machine that records all function calls.
@@ -62,6 +179,7 @@ class CallTracer(vm.VirtualMachine):
     self._interpreter_functions = []
     self._analyzed_functions = set()
     self._generated_classes = {}
+    self._function_costs = metrics.get_metric("function_costs", FunctionCosts)
     self.exitpoint = None
 
   def create_argument(self, node, signature, name):
@@ -328,21 +446,22 @@ class CallTracer(vm.VirtualMachine):
     return node
 
   def analyze_class(self, node, val):
-    node, clsvar, instance = self.init_class(node, val.data)
-    good_instances = [b for b in instance.bindings
-                      if b.data.cls and val.data in b.data.cls.data]
-    if not good_instances:
-      # __new__ returned something that's not an instance of our class.
-      instance = val.data.instantiate(node)
-      node = self.call_init(node, instance)
-    elif len(good_instances) != len(instance.bindings):
-      # __new__ returned some extra possibilities we don't need.
-      instance = self.join_bindings(node, good_instances)
-    for name, methodvar in sorted(val.data.members.items()):
-      if name in self._CONSTRUCTORS:
-        continue  # We already called this method during initialization.
-      b = self.bind_method(node, name, methodvar, instance, clsvar)
-      node = self.analyze_method_var(node, name, b)
+    with metrics.span("analyze_class", cls=val.data.name):
+      node, clsvar, instance = self.init_class(node, val.data)
+      good_instances = [b for b in instance.bindings
+                        if b.data.cls and val.data in b.data.cls.data]
+      if not good_instances:
+        # __new__ returned something that's not an instance of our class.
+        instance = val.data.instantiate(node)
+        node = self.call_init(node, instance)
+      elif len(good_instances) != len(instance.bindings):
+        # __new__ returned some extra possibilities we don't need.
+        instance = self.join_bindings(node, good_instances)
+      for name, methodvar in sorted(val.data.members.items()):
+        if name in self._CONSTRUCTORS:
+          continue  # We already called this method during initialization.
+        b = self.bind_method(node, name, methodvar, instance, clsvar)
+        node = self.analyze_method_var(node, name, b)
     return node
 
   def analyze_function(self, node0, val):
@@ -353,9 +472,10 @@ class CallTracer(vm.VirtualMachine):
       # We analyze closures as part of the function they're defined in.
       log.info("Analyze functions: Skipping closure %s", val.data.name)
     else:
-      node1 = node0.ConnectNew(val.data.name)
-      node2 = self.maybe_analyze_method(node1, val)
-      node2.ConnectTo(node0)
+      with metrics.span("analyze_function", function=val.data.name):
+        node1 = node0.ConnectNew(val.data.name)
+        node2 = self.maybe_analyze_method(node1, val)
+        node2.ConnectTo(node0)
     return node0
 
   def analyze_toplevel(self, node, defs):
@@ -419,6 +539,23 @@ class CallTracer(vm.VirtualMachine):
     elif isinstance(func.data, abstract.PyTDFunction):
       self._calls.add(record)
 
+  def run_frame(self, frame, node):
+    if not metrics.is_enabled():
+      return super(CallTracer, self).run_frame(frame, node)
+    self._function_costs.enter(frame.f_code, self.program)
+    try:
+      return super(CallTracer, self).run_frame(frame, node)
+    finally:
+      self._function_costs.exit(self.program)
+
+  def trace_opcode(self, op):
+    if metrics.is_enabled():
+      self._function_costs.add_opcode()
+
+  def trace_call_cache_hit(self, func):
+    if metrics.is_enabled():
+      self._function_costs.add_cached_call(func.code)
+
   def trace_functiondef(self, f):
     if not self.reading_builtins:
       self._interpreter_functions.append(f)
@@ -616,13 +753,16 @@ def check_types(py_src, py_filename, errorlog, options, loader,
                       analyze_annotated=True,
                       generate_unknowns=False,
                       loader=loader)
-  loc, defs = tracer.run_program(
-      py_src, py_filename, init_maximum_depth, run_builtins)
+  with metrics.span("run_program"):
+    loc, defs = tracer.run_program(
+        py_src, py_filename, init_maximum_depth, run_builtins)
   snapshotter = metrics.get_metric("memory", metrics.Snapshot)
   snapshotter.take_snapshot("infer:check_types:tracer")
   if deep:
-    tracer.analyze(loc, defs, maximum_depth=(2 if options.quick else None))
+    with metrics.span("analyze"):
+      tracer.analyze(loc, defs, maximum_depth=(2 if options.quick else None))
   snapshotter.take_snapshot("infer:check_types:post")
+  _record_program_size(tracer.program)
   _maybe_output_debug(options, tracer.program)
 
 
@@ -660,17 +800,20 @@ def infer_types(src, errorlog, options, loader,
                       analyze_annotated=analyze_annotated,
                       generate_unknowns=options.protocols,
                       store_all_calls=not deep, loader=loader)
-  loc, defs = tracer.run_program(
-      src, filename, init_maximum_depth, run_builtins)
+  with metrics.span("run_program"):
+    loc, defs = tracer.run_program(
+        src, filename, init_maximum_depth, run_builtins)
   log.info("===Done running definitions and module-level code===")
   snapshotter = metrics.get_metric("memory", metrics.Snapshot)
   snapshotter.take_snapshot("infer:infer_types:tracer")
   if deep:
-    tracer.exitpoint = tracer.analyze(loc, defs, maximum_depth)
+    with metrics.span("analyze"):
+      tracer.exitpoint = tracer.analyze(loc, defs, maximum_depth)
   else:
     tracer.exitpoint = loc
   snapshotter.take_snapshot("infer:infer_types:post")
-  ast = tracer.compute_types(defs)
+  with metrics.span("compute_types"):
+    ast = tracer.compute_types(defs)
   ast = tracer.loader.resolve_ast(ast)
   if tracer.has_unknown_wildcard_imports or ("HAS_DYNAMIC_ATTRIBUTES" in defs or
                                              "has_dynamic_attributes" in defs):
@@ -708,10 +851,16 @@ def infer_types(src, errorlog, options, loader,
     proc.stdin.write(dot)
     proc.stdin.close()
 
+  _record_program_size(tracer.program)
   _maybe_output_debug(options, tracer.program)
   return ast, builtins_pytd
 
 
+def _record_program_size(program):
+  _cfg_nodes_metric.inc(len(program.cfg_nodes))
+  _variables_metric.inc(program.next_variable_id)
+
+
 def _maybe_output_debug(options, program):
   if options.output_debug:
     text = debug.program_to_text(program)
@@ -1,8 +1,12 @@
 """Tests for infer.py."""
 
+import textwrap
 
 from pytype import config
+from pytype import errors
 from pytype import infer
+from pytype import load_pytd
+from pytype import metrics
 
 import unittest
 
@@ -34,6 +38,60 @@ class InferTest(unittest.TestCase):
       module = infer.get_module_name(filename, options)
       self.assertEqual(module, expected)
 
+  def testFunctionCosts(self):
+    metrics._prepare_for_test()
+    self.addCleanup(metrics._prepare_for_test, False)
+    options = config.Options.create()
+    src = textwrap.dedent("""
+      def f(x):
+        return x
+      def g():
+        return f(1) + f(1)
+      g()
+    """)
+    infer.infer_types(src, errors.ErrorLog(), options,
+                      load_pytd.Loader(None, options), filename="t.py",
+                      run_builtins=False, deep=False)
+    costs = metrics.get_metric("function_costs", infer.FunctionCosts)
+    f = costs._functions["f (t.py:2)"]
+    g = costs._functions["g (t.py:4)"]
+    module = costs._functions["<module> (t.py:2)"]
+    # The second call of f is answered from the call cache.
+    self.assertEqual((1, 1), (f["calls"], f["cached"]))
+    self.assertEqual((1, 0), (g["calls"], g["cached"]))
+    for stats in (f, g, module):
+      self.assertGreater(stats["opcodes"], 0)
+      self.assertLessEqual(stats["self_time"], stats["time"])
+    self.assertGreaterEqual(module["time"], g["time"] + module["self_time"])
+    self.assertGreaterEqual(g["time"], f["time"])
+    report = str(costs).splitlines()
+    self.assertEqual("function_costs: 3 functions, by self_time:", report[0])
+    self.assertEqual(5, len(report))
+
+  def testFunctionCostsDisabled(self):
+    metrics._prepare_for_test(False)
+    options = config.Options.create()
+    infer.infer_types("def f(): pass\nf()\n", errors.ErrorLog(), options,
+                      load_pytd.Loader(None, options), filename="t.py",
+                      run_builtins=False, deep=False)
+    costs = metrics.get_metric("function_costs", infer.FunctionCosts)
+    self.assertEqual({}, costs._functions)
+
+  def testFunctionCostsMerge(self):
+    metrics._prepare_for_test()
+    self.addCleanup(metrics._prepare_for_test, False)
+    costs1 = infer.FunctionCosts("costs1")
+    costs1._get("f")["calls"] = 2
+    costs2 = infer.FunctionCosts("costs2")
+    costs2._get("f")["calls"] = 3
+    costs2._get("g")["self_time"] = 1.0
+    costs1._merge(costs2)
+    self.assertEqual(5, costs1._functions["f"]["calls"])
+    self.assertEqual(["g", "f"], [name for name, _ in costs1._sorted()])
+    restored = infer.FunctionCosts.__new__(infer.FunctionCosts)
+    restored.__setstate__(costs1.__getstate__())
+    self.assertEqual(costs1._functions, restored._functions)
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -3,7 +3,8 @@
 import logging
 import os
 
-
+from pytype import metrics
+from pytype import pyi_cache
 from pytype.pytd import serialize_ast
 from pytype.pytd import typeshed
 from pytype.pytd import utils as pytd_utils
@@ -12,6 +13,8 @@ from pytype.pytd.parse import visitors
 
 log = logging.getLogger(__name__)
 
+_failed_imports_metric = metrics.MapCounter("loader_failed_imports")
+
 
 class Module(object):
   """Represents a parsed module.
@@ -42,6 +45,46 @@ class BadDependencyError(Exception):
     return self.message
 
 
+class PathIndex(object):
+  """Answers which paths exist, from cached directory listings.
+
+  Searching the pythonpath tries several candidate paths for every import, and
+  most of them don't exist. Instead of a stat call per candidate, this lists
+  every directory once, so that a missing path costs a set lookup. Paths that
+  are listed are stat'ed once, to tell files from directories (and to skip
+  broken symlinks).
+  """
+
+  def __init__(self):
+    self._listings = {}  # directory -> frozenset of names, or None
+    self._stats = {}  # path -> (exists, isdir), for listed paths
+
+  def _list(self, directory):
+    if directory not in self._listings:
+      try:
+        names = frozenset(os.listdir(directory or os.curdir))
+      except OSError:
+        names = None
+      self._listings[directory] = names
+    return self._listings[directory]
+
+  def _stat(self, path):
+    directory, name = os.path.split(path)
+    if name:
+      names = self._list(directory)
+      if names is None or name not in names:
+        return False, False
+    if path not in self._stats:
+      self._stats[path] = os.path.exists(path), os.path.isdir(path)
+    return self._stats[path]
+
+  def exists(self, path):
+    return self._stat(path)[0]
+
+  def isdir(self, path):
+    return self._stat(path)[1]
+
+
 class Loader(object):
   """A cache for loaded PyTD files.
 
@@ -54,6 +97,15 @@ class Loader(object):
     _modules: A map, filename to Module, for caching modules already loaded.
     _concatenated: A concatenated pytd of all the modules. Refreshed when
                    necessary.
+    _intern_table: If --intern-pytd is given, the table of canonical types
+                   shared by all loaded modules. See visitors.InternTypes.
+    _pyi_cache: If --cache-dir is given, the pyi_cache.PyiCache for the
+                modules from pytype's pytd files and typeshed, and for the
+                snapshot of __builtin__ and typing.
+    _path_index: The PathIndex used to search the pythonpath.
+    _failed_imports: The names of the modules that couldn't be found.
+    _search_key: The pythonpath and imports_map that _path_index and
+                 _failed_imports are valid for.
   """
 
   PREFIX = "pytd:"  # for pytd files that ship with pytype
@@ -63,6 +115,9 @@ class Loader(object):
                options):
     self.base_module = base_module
     self.options = options
+    self._pyi_cache = pyi_cache.from_options(options)
+    if self._pyi_cache:
+      self._pyi_cache.load_builtins()
     self.builtins, self.typing = builtins.GetBuiltinsAndTyping()
     self._modules = {
         "__builtin__":
@@ -70,15 +125,23 @@ class Loader(object):
         "typing":
         Module("typing", self.PREFIX + "typing", self.typing)
     }
+    # GetBuiltinsAndTyping already filled in all class pointers.
+    for module in self._modules.values():
+      module.dirty = False
     self._concatenated = None
+    self._intern_table = {} if options.intern_pytd else None
+    self._path_index = PathIndex()
+    self._failed_imports = set()
+    self._search_key = None
     # Paranoid verification that pytype.main properly checked the flags:
     if self.options.imports_map is not None:
       assert self.options.pythonpath == [""]
 
   def _postprocess_pyi(self, ast):
     """Apply all the PYI transformations we need."""
-    ast = ast.Visit(visitors.LookupBuiltins(self.builtins, full_names=False))
-    ast = ast.Visit(visitors.ExpandCompatibleBuiltins(self.builtins))
+    ast = ast.Visit(visitors.FusedVisitor(
+        visitors.LookupBuiltins(self.builtins, full_names=False),
+        visitors.ExpandCompatibleBuiltins(self.builtins)))
     ast = ast.Visit(visitors.LookupLocalTypes())
     return ast
 
@@ -130,6 +193,12 @@ class Loader(object):
       # Now that any imported TypeVar instances have been resolved, adjust type
       # parameters in classes and functions.
       module.ast = module.ast.Visit(visitors.AdjustTypeParameters())
+      # Interning has to happen before filling in the local pointers below:
+      # Rebuilding the tree afterwards would leave them pointing to the old
+      # classes.
+      if self._intern_table is not None:
+        module.ast = module.ast.Visit(
+            visitors.InternTypes(self._intern_table))
       # Now we can fill in internal cls pointers to ClassType nodes in the
       # module. This code executes when the module is first loaded, which
       # happens before any others use it to resolve dependencies, so there are
@@ -143,6 +212,33 @@ class Loader(object):
       raise
     return module.ast
 
+  def _process_serialized_module(self, module_name, filename, loaded_ast):
+    """Create a module from a serialize_ast.SerializableAst.
+
+    Args:
+      module_name: The fully qualified name of the module being imported.
+      filename: The file the ast was loaded from.
+      loaded_ast: The serialize_ast.SerializableAst, as returned by LoadAst.
+
+    Returns:
+      The ast (pytd.TypeDeclUnit) as represented in this loader.
+    """
+    self._concatenated = None  # invalidate
+    dependencies = [d for d in loaded_ast.dependencies
+                    if d != loaded_ast.ast.name]
+
+    self._modules[module_name] = Module(module_name, filename, loaded_ast.ast)
+    self._load_ast_dependencies(dependencies, loaded_ast.ast, module_name)
+
+    try:
+      ast = serialize_ast.ProcessAst(loaded_ast, self._get_module_map())
+    except serialize_ast.UnrestorableDependencyError as e:
+      del self._modules[module_name]
+      raise BadDependencyError(e.message, module_name)
+    self._modules[module_name].ast = ast
+    self._modules[module_name].dirty = False
+    return ast
+
   def _collect_ast_dependencies(self, ast):
     """Goes over an ast and returns all references module names."""
     deps = visitors.CollectDependencies()
@@ -230,31 +326,46 @@ class Loader(object):
       raise ValueError("Attempting relative import in non-package.")
     components = self.base_module.split(".")
     sub_module = ".".join(components[0:-level])
-    ast = self._import_name(sub_module)
-    self._lookup_all_classes()
+    with metrics.span("import", module=sub_module):
+      ast = self._import_name(sub_module)
+      self._lookup_all_classes()
     return ast
 
   def import_name(self, module_name):
-    ast = self._import_name(module_name)
-    self._lookup_all_classes()
+    with metrics.span("import", module=module_name):
+      ast = self._import_name(module_name)
+      self._lookup_all_classes()
     return ast
 
   def _load_builtin(self, subdir, module_name, typeshed_only=False):
     """Load a pytd/pyi that ships with pytype or typeshed."""
+    # Try our own type definitions first, then fall back to typeshed.
+    sources = []
+    if not typeshed_only:
+      sources.append(pyi_cache.PYTD)
+    if self.options.typeshed:
+      sources.append(pyi_cache.TYPESHED)
+    if self._pyi_cache:
+      loaded_ast = self._pyi_cache.get(
+          subdir, module_name, sources, lazy=self.options.lazy_pickled_files)
+      if loaded_ast:
+        log.debug("Found cached %s entry for %r", subdir, module_name)
+        return self._process_serialized_module(
+            module_name, self.PREFIX + module_name, loaded_ast)
     version = self.options.python_version
-    # Try our own type definitions first.
-    if typeshed_only:
-      mod = None
-    else:
-      mod = builtins.ParsePredefinedPyTD(subdir, module_name, version)
-    if not mod and self.options.typeshed:
-      # Fall back to typeshed.
-      mod = typeshed.parse_type_definition(subdir, module_name, version)
-    if mod:
-      log.debug("Found %s entry for %r", subdir, module_name)
-      return self.load_file(filename=self.PREFIX + module_name,
-                            module_name=module_name,
-                            ast=mod)
+    for source in sources:
+      if source == pyi_cache.PYTD:
+        mod = builtins.ParsePredefinedPyTD(subdir, module_name, version)
+      else:
+        mod = typeshed.parse_type_definition(subdir, module_name, version)
+      if mod:
+        log.debug("Found %s entry for %r in %s", subdir, module_name, source)
+        ast = self.load_file(filename=self.PREFIX + module_name,
+                             module_name=module_name,
+                             ast=mod)
+        if self._pyi_cache:
+          self._pyi_cache.put(subdir, module_name, source, ast)
+        return ast
     return None
 
   def _import_name(self, module_name):
@@ -268,6 +379,20 @@ class Loader(object):
       the module wasn't found.
     """
     assert os.sep not in module_name, (os.sep, module_name)
+    pythonpath = tuple(self.options.pythonpath)
+    imports_map = self.options.imports_map
+    # Keep the imports_map itself rather than its id, which a new map could
+    # reuse once the old one is freed.
+    if (self._search_key is None or self._search_key[0] != pythonpath or
+        self._search_key[1] is not imports_map):
+      self._path_index = PathIndex()
+      self._failed_imports = set()
+      self._search_key = (pythonpath, imports_map)
+    elif module_name in self._failed_imports:
+      _failed_imports_metric.inc("hit")
+      log.debug("Skipping known missing module %r", module_name)
+      return None
+    _failed_imports_metric.inc("miss")
     log.debug("Trying to import %r", module_name)
     # Builtin modules (but not standard library modules!) take precedence
     # over modules in PYTHONPATH.
@@ -292,6 +417,7 @@ class Loader(object):
       if mod:
         return mod
 
+    self._failed_imports.add(module_name)
     log.warning("Couldn't import module %s %r in (path=%r) imports_map: %s",
                 module_name, module_name, self.options.pythonpath,
                 "%d items" % len(self.options.imports_map) if
@@ -323,7 +449,7 @@ class Loader(object):
       if init_ast is not None:
         log.debug("Found module %r with path %r", module_name, init_path)
         return init_ast
-      elif self.options.imports_map is None and os.path.isdir(path):
+      elif self.options.imports_map is None and self._path_index.isdir(path):
         # We allow directories to not have an __init__ file.
         # The module's empty, but you can still load submodules.
         log.debug("Created empty module %r with path %r",
@@ -357,7 +483,8 @@ class Loader(object):
 
     # We have /dev/null entries in the import_map - os.path.isfile() returns
     # False for those. However, we *do* want to load them. Hence exists / isdir.
-    if os.path.exists(full_path) and not os.path.isdir(full_path):
+    if (self._path_index.exists(full_path) and
+        not self._path_index.isdir(full_path)):
       return self.load_file(filename=full_path, module_name=module_name)
     else:
       return None
@@ -394,21 +521,9 @@ class PickledPyiLoader(Loader):
     existing = self._get_existing_ast(module_name, filename)
     if existing:
       return existing
-    loaded_ast = pytd_utils.LoadPickle(filename)
-    # At this point ast.name and module_name could be different.
-    # They are later synced in ProcessAst.
-    dependencies = [d for d in loaded_ast.dependencies
-                    if d != loaded_ast.ast.name]
-
-    loaded_ast = serialize_ast.EnsureAstName(loaded_ast, module_name)
-    self._modules[module_name] = Module(module_name, filename, loaded_ast.ast)
-    self._load_ast_dependencies(dependencies, ast, module_name)
-
     try:
-      ast = serialize_ast.ProcessAst(loaded_ast, self._get_module_map())
-    except serialize_ast.UnrestorableDependencyError as e:
-      del self._modules[module_name]
+      loaded_ast = serialize_ast.LoadAst(
+          filename, module_name, lazy=self.options.lazy_pickled_files)
+    except serialize_ast.FormatError as e:
       raise BadDependencyError(e.message, module_name)
-    self._modules[module_name].ast = ast
-    self._modules[module_name].dirty = False
-    return ast
+    return self._process_serialized_module(module_name, filename, loaded_ast)
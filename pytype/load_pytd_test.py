@@ -6,6 +6,8 @@ import textwrap
 
 from pytype import config
 from pytype import load_pytd
+from pytype import metrics
+from pytype import pyi_cache
 from pytype import utils
 from pytype.pytd import pytd
 from pytype.pytd import serialize_ast
@@ -150,6 +152,80 @@ class ImportPathsTest(unittest.TestCase):
       f, = module2.Lookup("module2.f").signatures
       self.assertEqual("List[int]", pytd.Print(f.return_type))
 
+  def testInternTypes(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+          from typing import List
+          def f(x: List[int]) -> str
+      """)
+      d.create_file("bar.pyi", """
+          from typing import List
+          def g(x: List[int]) -> str
+      """)
+      self.options.tweak(pythonpath=[d.path], intern_pytd=True)
+      loader = load_pytd.Loader("base", self.options)
+      f, = loader.import_name("foo").Lookup("foo.f").signatures
+      g, = loader.import_name("bar").Lookup("bar.g").signatures
+      self.assertIs(f.params[0].type, g.params[0].type)
+      self.assertIs(f.return_type, g.return_type)
+      self.assertEqual("List[int]", pytd.Print(f.params[0].type))
+
+  def testCacheDir(self):
+    with utils.Tempdir() as d:
+      self.options.tweak(cache_dir=d.path)
+      ast = load_pytd.Loader("base", self.options).import_name("os")
+      cache = pyi_cache.PyiCache(os.path.join(d.path, "pyi"),
+                                 self.PYTHON_VERSION)
+      self.assertTrue(cache.get("stdlib", "os", (pyi_cache.PYTD,)))
+      loader = load_pytd.Loader("base", self.options)
+      cached_ast = loader.import_name("os")
+      self.assertFalse(loader._modules["os"].dirty)
+      self.assertTrue(ast.ASTeq(cached_ast))
+      cached_ast.Visit(visitors.VerifyLookup())
+
+  def testFailedImportCache(self):
+    metrics._prepare_for_test()
+    self.addCleanup(metrics._prepare_for_test, False)
+    counts = load_pytd._failed_imports_metric._counts
+    with utils.Tempdir() as d1:
+      with utils.Tempdir() as d2:
+        d2.create_file("foo.pyi", "x = ... # type: int")
+        self.options.tweak(pythonpath=[d1.path])
+        loader = load_pytd.Loader("base", self.options)
+        self.assertIsNone(loader.import_name("foo"))
+        hits = counts.get("hit", 0)
+        self.assertIsNone(loader.import_name("foo"))
+        self.assertEqual(hits + 1, counts.get("hit", 0))
+        # A different pythonpath invalidates the cache.
+        self.options.tweak(pythonpath=[d1.path, d2.path])
+        self.assertTrue(loader.import_name("foo").Lookup("foo.x"))
+
+  def testFailedImportCacheWithImportsMap(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", "x = ... # type: int")
+      self.options.tweak(pythonpath=[""], imports_map={})
+      loader = load_pytd.Loader("base", self.options)
+      self.assertIsNone(loader.import_name("foo"))
+      # A new imports_map invalidates the cache, even if it reuses the memory of
+      # the old one, which is freed first here.
+      self.options.imports_map = None
+      self.options.imports_map = {"foo": os.path.join(d.path, "foo.pyi")}
+      self.assertTrue(loader.import_name("foo").Lookup("foo.x"))
+
+  def testPathIndex(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo/bar.pyi")
+      os.symlink(os.path.join(d.path, "nonexistent"),
+                 os.path.join(d.path, "broken.pyi"))
+      index = load_pytd.PathIndex()
+      self.assertTrue(index.exists(os.path.join(d.path, "foo")))
+      self.assertTrue(index.isdir(os.path.join(d.path, "foo")))
+      self.assertTrue(index.exists(os.path.join(d.path, "foo", "bar.pyi")))
+      self.assertFalse(index.isdir(os.path.join(d.path, "foo", "bar.pyi")))
+      self.assertFalse(index.exists(os.path.join(d.path, "baz.pyi")))
+      self.assertFalse(index.isdir(os.path.join(d.path, "baz", "qux")))
+      self.assertFalse(index.exists(os.path.join(d.path, "broken.pyi")))
+
   def testImportMapCongruence(self):
     with utils.Tempdir() as d:
       foo_path = d.create_file("foo.pyi", "class X: ...")
@@ -287,6 +363,22 @@ class PickledPyiLoaderTest(unittest.TestCase):
       g = loaded_ast.Lookup("foo.g")
       self.assertEqual(g.type.function, loaded_ast.Lookup("foo.f"))
 
+  def testLazyLoad(self):
+    with utils.Tempdir() as d:
+      self._CreateFiles(tempdir=d)
+      module1 = _Module(module_name="module1", file_name="module1.pyi")
+      module2 = _Module(module_name="module2", file_name="module2.pyi")
+      ast = self._LoadAst(tempdir=d, module=module1)
+      self._PickleModules(d, module1, module2)
+      self.options.tweak(lazy_pickled_files=True)
+      loaded_ast = self._LoadPickledModule(
+          d, module1._replace(file_name="module1.pyi.pickled"))
+      self.assertIsInstance(loaded_ast, serialize_ast.LazyTypeDeclUnit)
+      cls = loaded_ast.Lookup("module1.SomeClass")
+      _, param = cls.Lookup("__init__").signatures[0].params
+      self.assertEqual("module2.ObjectMod2", param.type.cls.name)
+      self.assertTrue(ast.ASTeq(loaded_ast))
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -4,6 +4,7 @@ import logging
 
 from pytype import abstract
 from pytype import function
+from pytype import metrics
 from pytype import special_builtins
 from pytype import utils
 from pytype.pytd import pep484
@@ -18,10 +19,28 @@ _COMPATIBLE_BUILTINS = [
     for compatible_builtin, builtin in pep484.COMPAT_ITEMS
 ]
 
+# Maps each builtin to the builtins it can be used as, e.g. int to float.
+_COMPATIBLE_BUILTINS_BY_NAME = {}
+for _compatible, _builtin in _COMPATIBLE_BUILTINS:
+  _COMPATIBLE_BUILTINS_BY_NAME.setdefault(_compatible, []).append(_builtin)
+
+_ancestors_metric = metrics.MapCounter("matcher_ancestors_cache")
+_class_match_metric = metrics.MapCounter("matcher_class_match_cache")
+
 
 class AbstractMatcher(object):
   """Matcher for abstract values."""
 
+  def __init__(self):
+    # Both caches are keyed by object ids, since ParameterizedClass hashes its
+    # (possibly lazy) type parameters. The entries hold on to the objects, so
+    # the ids can't be reused.
+    # id(cls) -> (cls, cls.mro, ancestor index). See _get_ancestors.
+    self._ancestors = {}
+    # (id(cls), id(formal type)) -> (cls, formal type, cls.mro, matches). See
+    # _match_class_and_instance_against_type.
+    self._class_matches = {}
+
   def _set_error_subst(self, subst):
     """Set the substitution used by compute_subst in the event of an error."""
     self._error_subst = subst
@@ -502,28 +521,33 @@ class AbstractMatcher(object):
         return None
     return subst
 
-  def _match_from_mro(self, left, other_type):
-    """Checks a type's MRO for a match for a formal type.
+  def _get_ancestors(self, left):
+    """Index a type's MRO, for _match_from_mro.
 
     Args:
       left: The type.
-      other_type: The formal type.
 
     Returns:
-      The match, if any, None otherwise.
+      A tuple of two dicts, mapping the id of every class in the MRO, and the
+      name of every builtin that a class in the MRO is compatible with, to a
+      tuple (position in the MRO, MRO entry). Only the first entry is kept.
     """
-    for base in left.mro:
+    entry = self._ancestors.get(id(left))
+    if entry is not None and entry[1] is left.mro:
+      _ancestors_metric.inc("hit")
+      return entry[2]
+    _ancestors_metric.inc("miss")
+    by_class = {}
+    by_compatible_name = {}
+    for i, base in enumerate(left.mro):
       if isinstance(base, abstract.ParameterizedClass):
         base_cls = base.base_cls
       else:
         base_cls = base
       if isinstance(base_cls, abstract.Class):
-        if other_type is base_cls or (
-            isinstance(other_type, abstract.ParameterizedClass) and
-            other_type.base_cls is base_cls) or (
-                (base_cls.full_name,
-                 other_type.full_name) in _COMPATIBLE_BUILTINS):
-          return base
+        by_class.setdefault(id(base_cls), (i, base))
+        for name in _COMPATIBLE_BUILTINS_BY_NAME.get(base_cls.full_name, ()):
+          by_compatible_name.setdefault(name, (i, base))
       elif isinstance(base_cls, abstract.AMBIGUOUS_OR_EMPTY):
         # See match_Function_against_Class in type_match.py. Even though it's
         # possible that this ambiguous base is of type other_type, our class
@@ -532,6 +556,51 @@ class AbstractMatcher(object):
         continue
       else:
         raise AssertionError("Bad base class %r", base_cls)
+    ancestors = by_class, by_compatible_name
+    self._ancestors[id(left)] = (left, left.mro, ancestors)
+    return ancestors
+
+  def _match_from_mro(self, left, other_type):
+    """Checks a type's MRO for a match for a formal type.
+
+    Args:
+      left: The type.
+      other_type: The formal type.
+
+    Returns:
+      The match, if any, None otherwise.
+    """
+    by_class, by_compatible_name = self._get_ancestors(left)
+    if isinstance(other_type, abstract.ParameterizedClass):
+      other_cls = other_type.base_cls
+    else:
+      other_cls = other_type
+    match = by_class.get(id(other_cls))
+    compatible_match = by_compatible_name.get(other_type.full_name)
+    if compatible_match and (not match or compatible_match[0] < match[0]):
+      match = compatible_match
+    return match[1] if match else None
+
+  def may_match_instance_of(self, left, other_type):
+    """Quick check whether an instance of a class can match a formal type.
+
+    Args:
+      left: A class.
+      other_type: A formal type.
+
+    Returns:
+      False if matching any instance of left against other_type would fail,
+      True if it might succeed.
+    """
+    if isinstance(other_type, abstract.Union):
+      return any(self.may_match_instance_of(left, t)
+                 for t in other_type.options)
+    elif (not isinstance(left, abstract.Class) or
+          not isinstance(other_type, abstract.Class) or
+          other_type.full_name == "__builtin__.object"):
+      return True
+    return (self._match_from_mro(left, other_type) is not None or
+            self._get_protocol(other_type) is not None)
 
   def _match_class_and_instance_against_type(
       self, left, instance, other_type, subst, node, view):
@@ -551,16 +620,36 @@ class AbstractMatcher(object):
       return subst
 
     if isinstance(other_type, abstract.Class):
+      # Without type parameters, and with the exceptions below, whether an
+      # instance matches only depends on its class, and the substitution is
+      # returned unchanged.
+      cacheable = not isinstance(
+          other_type, abstract.ParameterizedClass) and not isinstance(
+              instance, abstract.Tuple)
+      if cacheable:
+        key = (id(left), id(other_type))
+        entry = self._class_matches.get(key)
+        if entry is not None and entry[2] is left.mro:
+          _class_match_metric.inc("hit")
+          return subst if entry[3] else None
+        _class_match_metric.inc("miss")
       base = self._match_from_mro(left, other_type)
       if base is None:
         protocol = self._get_protocol(other_type)
         if protocol:
           return self._match_against_protocol(left, other_type, protocol,
                                               subst, node, view)
-        return None
+        new_subst = None
       else:
-        return self._match_instance(
+        new_subst = self._match_instance(
             base, instance, other_type, subst, node, view)
+        # Instances of subclasses of tuple are matched via their type
+        # parameters.
+        cacheable = cacheable and not isinstance(base, abstract.TupleClass)
+      if cacheable:
+        self._class_matches[key] = (
+            left, other_type, left.mro, new_subst is not None)
+      return new_subst
     elif isinstance(other_type, abstract.Nothing):
       return None
     else:
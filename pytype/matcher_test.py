@@ -6,6 +6,8 @@ from pytype import abstract
 from pytype import config
 from pytype import errors
 from pytype import load_pytd
+from pytype import matcher
+from pytype import metrics
 from pytype import utils
 from pytype import vm
 
@@ -429,5 +431,35 @@ class MatcherTest(unittest.TestCase):
     self.assertMatch(left1, right)
     self.assertNoMatch(left2, right)
 
+  def testCachedClassMatch(self):
+    metrics._prepare_for_test()
+    self.addCleanup(metrics._prepare_for_test, False)
+    counts = matcher._class_match_metric._counts
+    base = self._make_class("base")
+    left = abstract.InterpreterClass(
+        "left", [base.to_variable(self.vm.root_cfg_node)], {}, None, self.vm)
+    other = self._make_class("other")
+    instance = abstract.Instance(left, self.vm)
+    hits = counts.get("hit", 0)
+    for _ in range(2):
+      self.assertMatch(instance, base)
+      self.assertNoMatch(instance, other)
+    self.assertEqual(hits + 2, counts.get("hit", 0))
+
+  def testCachedClassMatchChangedMro(self):
+    base = self._make_class("base")
+    left = abstract.InterpreterClass(
+        "left", [base.to_variable(self.vm.root_cfg_node)], {}, None, self.vm)
+    instance = abstract.Instance(left, self.vm)
+    self.assertMatch(instance, base)
+    left.mro = (left, self.vm.convert.object_type)
+    self.assertNoMatch(instance, base)
+
+  def testCompatibleBuiltinInMro(self):
+    left = self._convert_type("int", as_instance=True)
+    self.assertMatch(left, self._convert_type("float"))
+    self.assertMatch(left, self._convert_type("complex"))
+    self.assertNoMatch(left, self._convert_type("str"))
+
 if __name__ == "__main__":
   unittest.main()
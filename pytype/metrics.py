@@ -16,10 +16,20 @@ def foo():
 
 def bar(n):
   _my_counter.inc(n)  # calls to bar() count as n units.
+
+Separately from metrics, code can be traced with spans, which nest, and are
+written in the Chrome trace event format, for chrome://tracing:
+
+def baz(filename):
+  with metrics.span("baz", filename=filename):
+    ...
 """
 
+import json
 import math
+import os
 import re
+import thread
 import time
 
 import yaml
@@ -46,6 +56,11 @@ def _prepare_for_test(enabled=True):
   _enabled = enabled
 
 
+def is_enabled():
+  """Return True iff metrics are currently being collected."""
+  return _enabled
+
+
 def get_metric(name, constructor, *args, **kwargs):
   """Return an existing metric or create a new one for the given name.
 
@@ -367,3 +382,120 @@ class MetricsContext(object):
     if self._output_path:
       with open(self._output_path, "w") as f:
         yaml.dump(_registered_metrics.values(), f)
+
+
+_trace_events = None  # List of recorded trace events iff tracing is enabled.
+
+
+def is_tracing():
+  """Return True iff spans are currently being recorded."""
+  return _trace_events is not None
+
+
+class _Span(object):
+  """A context manager that records a complete ("X") trace event."""
+
+  __slots__ = ("_name", "_args", "_start")
+
+  def __init__(self, name, args):
+    self._name = name
+    self._args = args
+    self._start = None
+
+  def __enter__(self):
+    self._start = time.time()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    end = time.time()
+    if _trace_events is None:
+      return
+    # Timestamps are in microseconds, and absolute, so that traces recorded by
+    # different processes line up.
+    event = {"name": self._name, "ph": "X",
+             "ts": self._start * 1e6, "dur": (end - self._start) * 1e6,
+             "pid": os.getpid(), "tid": thread.get_ident()}
+    if self._args:
+      event["args"] = self._args
+    _trace_events.append(event)
+
+
+class _NoSpan(object):
+  """The span returned when tracing is disabled. Does nothing."""
+
+  __slots__ = ()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **args):
+  """Return a context manager for tracing the time spent in a "with" statement.
+
+  Spans that are entered while another span is active show up nested below it.
+  If tracing is disabled, this returns a shared object that does nothing.
+
+  Args:
+    name: The name of the span, e.g. "analyze_function".
+    **args: Additional information to display for the span, e.g. the name of
+        the function. Must be JSON-serializable.
+
+  Returns:
+    A context manager.
+  """
+  if _trace_events is None:
+    return _NO_SPAN
+  return _Span(name, args)
+
+
+def pop_trace_events():
+  """Remove and return all trace events recorded so far in this process."""
+  if _trace_events is None:
+    return []
+  events = _trace_events[:]
+  del _trace_events[:]
+  return events
+
+
+def add_trace_events(events):
+  """Add trace events recorded elsewhere, e.g. in another process."""
+  if _trace_events is not None:
+    _trace_events.extend(events)
+
+
+def merge_trace_from_file(trace_file):
+  """Merge the events of a trace written by TraceContext into this one."""
+  add_trace_events(json.load(trace_file)["traceEvents"])
+
+
+class TraceContext(object):
+  """A context manager that enables tracing and writes the recorded spans."""
+
+  def __init__(self, output_path):
+    """Initialize.
+
+    Args:
+      output_path: The path for the trace, in the Chrome trace event format.
+          If empty, no spans are recorded.
+    """
+    self._output_path = output_path
+    self._old_events = None  # Set in __enter__.
+
+  def __enter__(self):
+    global _trace_events
+    self._old_events = _trace_events
+    _trace_events = [] if self._output_path else None
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    global _trace_events
+    events = _trace_events
+    _trace_events = self._old_events
+    if self._output_path:
+      with open(self._output_path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
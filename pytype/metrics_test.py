@@ -1,6 +1,7 @@
 """Test errors.py."""
 
 import cStringIO
+import json
 import math
 import tempfile
 import time
@@ -306,5 +307,63 @@ class MetricsContextTest(unittest.TestCase):
     self.assertEqual(0, self._counter._total)
 
 
+class TraceTest(unittest.TestCase):
+  """Tests for span and TraceContext."""
+
+  def test_disabled(self):
+    with metrics.span("foo", x=1) as s:
+      pass
+    self.assertIs(s, metrics.span("bar"))
+    self.assertFalse(metrics.is_tracing())
+    self.assertEqual([], metrics.pop_trace_events())
+
+  def test_nested(self):
+    with tempfile.NamedTemporaryFile() as out:
+      out.close()
+      with metrics.TraceContext(out.name):
+        self.assertTrue(metrics.is_tracing())
+        with metrics.span("outer"):
+          with metrics.span("inner", x=1):
+            time.sleep(0.001)
+      self.assertFalse(metrics.is_tracing())
+      with open(out.name) as f:
+        inner, outer = json.load(f)["traceEvents"]
+    self.assertEqual("inner", inner["name"])
+    self.assertEqual({"x": 1}, inner["args"])
+    self.assertEqual("outer", outer["name"])
+    self.assertNotIn("args", outer)
+    for event in (inner, outer):
+      self.assertEqual("X", event["ph"])
+    self.assertLessEqual(outer["ts"], inner["ts"])
+    self.assertGreaterEqual(outer["ts"] + outer["dur"],
+                            inner["ts"] + inner["dur"])
+    self.assertGreaterEqual(inner["dur"], 1000)
+
+  def test_merge(self):
+    with tempfile.NamedTemporaryFile() as out:
+      out.close()
+      with metrics.TraceContext(out.name):
+        with metrics.span("foo"):
+          pass
+      with metrics.TraceContext(out.name):
+        with open(out.name) as f:
+          metrics.merge_trace_from_file(f)
+        with metrics.span("bar"):
+          pass
+      with open(out.name) as f:
+        events = json.load(f)["traceEvents"]
+    self.assertEqual(["foo", "bar"], [e["name"] for e in events])
+
+  def test_pop_trace_events(self):
+    with tempfile.NamedTemporaryFile() as out:
+      with metrics.TraceContext(out.name):
+        with metrics.span("foo"):
+          pass
+        events = metrics.pop_trace_events()
+        self.assertEqual([], metrics.pop_trace_events())
+        metrics.add_trace_events(events)
+        self.assertEqual(events, metrics.pop_trace_events())
+
+
 if __name__ == "__main__":
   unittest.main()
@@ -1,4 +1,9 @@
-"""Compiles a single .py to a .pyc and writes it to stdout."""
+"""Compiles a single .py to a .pyc and writes it to stdout.
+
+When invoked with the single argument "--serve", this instead runs as a
+persistent compiler worker: It reads compile requests from stdin and writes
+the results to stdout until stdin is closed. See serve() for the protocol.
+"""
 
 # These are C modules built into Python. Don't add any modules that are
 # implemented in a .py:
@@ -18,6 +23,27 @@ def _write32(f, w):
       (w >> 24) & 0xff]))
 
 
+def _read32(f):
+  b = bytearray(f.read(4))
+  if len(b) != 4:
+    raise EOFError()
+  return b[0] | (b[1] << 8) | (b[2] << 16) | (b[3] << 24)
+
+
+def _read_exactly(f, size):
+  data = f.read(size)
+  if len(data) != size:
+    raise EOFError()
+  return data
+
+
+def _native_str(data):
+  if sys.version_info[0] == 3:
+    return data.decode("utf-8")
+  else:
+    return data
+
+
 def write_pyc(f, codeobject, source_size=0, timestamp=0):
   f.write(MAGIC)
   _write32(f, timestamp)
@@ -29,6 +55,10 @@ def write_pyc(f, codeobject, source_size=0, timestamp=0):
 def compile_to_pyc(data_file, filename, output, mode="exec"):
   with open(data_file, "r") as fi:
     src = fi.read()
+  compile_src_to_pyc(src, filename, output, mode)
+
+
+def compile_src_to_pyc(src, filename, output, mode="exec"):
   try:
     codeobject = compile(src, filename, mode)
   except Exception as err:  # pylint: disable=broad-except
@@ -42,12 +72,56 @@ def compile_to_pyc(data_file, filename, output, mode="exec"):
     write_pyc(output, codeobject)
 
 
+def serve(infile, outfile):
+  """Answer compile requests until infile is closed.
+
+  A request consists of the three 32 bit (little endian) lengths of the mode,
+  the filename and the source code, followed by the data of these three
+  fields. For every request, we write back the 32 bit length of the result,
+  followed by the result itself, in the same format that compile_to_pyc uses.
+
+  Args:
+    infile: A binary file-like object to read requests from.
+    outfile: A binary file-like object to write results to.
+  """
+  while True:
+    try:
+      mode_len = _read32(infile)
+    except EOFError:
+      return
+    filename_len = _read32(infile)
+    src_len = _read32(infile)
+    mode = _native_str(_read_exactly(infile, mode_len))
+    filename = _native_str(_read_exactly(infile, filename_len))
+    src = _read_exactly(infile, src_len)
+    output = _Buffer()
+    compile_src_to_pyc(src, filename, output, mode)
+    result = b"".join(output.chunks)
+    _write32(outfile, len(result))
+    outfile.write(result)
+    outfile.flush()
+
+
+class _Buffer(object):
+  """Minimal file-like object collecting written data. (No .py imports.)"""
+
+  def __init__(self):
+    self.chunks = []
+
+  def write(self, data):
+    self.chunks.append(bytes(data))
+
+
 def main():
-  if len(sys.argv) != 4:
-    sys.exit(1)
   # pytype: disable=attribute-error
   output = sys.stdout.buffer if hasattr(sys.stdout, "buffer") else sys.stdout
+  infile = sys.stdin.buffer if hasattr(sys.stdin, "buffer") else sys.stdin
   # pytype: enable=attribute-error
+  if sys.argv[1:] == ["--serve"]:
+    serve(infile, output)
+    return
+  if len(sys.argv) != 4:
+    sys.exit(1)
   compile_to_pyc(data_file=sys.argv[1], filename=sys.argv[2],
                  output=output, mode=sys.argv[3])
 
@@ -0,0 +1,228 @@
+"""A pool of long-lived processes for compiling source code to bytecode.
+
+Starting a new Python interpreter for every file we want to compile is
+expensive. Instead, we keep one or more worker processes per target
+interpreter around and send them compile requests over a pipe. See
+compile_bytecode.serve() for the worker side of the protocol.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import subprocess
+import threading
+
+from pytype import utils
+
+
+log = logging.getLogger(__name__)
+
+
+COMPILE_SCRIPT = "pyc/compile_bytecode.py"
+
+
+class WorkerError(IOError):
+  """Raised if a worker process died or sent back garbage."""
+
+
+def _write32(f, w):
+  f.write(chr(w & 0xff) + chr((w >> 8) & 0xff) +
+          chr((w >> 16) & 0xff) + chr((w >> 24) & 0xff))
+
+
+def _read32(f):
+  data = f.read(4)
+  if len(data) != 4:
+    raise WorkerError("Compiler worker terminated unexpectedly")
+  b = bytearray(data)
+  return b[0] | (b[1] << 8) | (b[2] << 16) | (b[3] << 24)
+
+
+def worker_command(python_version, python_exe):
+  """Return the command line for starting a compiler worker.
+
+  Args:
+    python_version: Python version, (major, minor).
+    python_exe: Path to a Python interpreter, or None. If this is None, the
+      system "pythonX.X" interpreter will be used.
+
+  Returns:
+    A list of strings.
+  """
+  if python_exe:
+    # Allow python_exe to contain parameters (E.g. "-T")
+    exe = python_exe.split() + ["-S"]
+  else:
+    exe = ["python" + ".".join(map(str, python_version))]
+  # We pass the script on the command line, since stdin is used for requests.
+  return exe + ["-c", utils.load_pytype_file(COMPILE_SCRIPT), "--serve"]
+
+
+class CompilerWorker(object):
+  """A single compiler process."""
+
+  def __init__(self, cmd):
+    self._process = subprocess.Popen(
+        cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+  def is_alive(self):
+    return self._process.poll() is None
+
+  def compile(self, src, filename, mode):
+    """Send a compile request and wait for the result.
+
+    Args:
+      src: Python source code, as a str.
+      filename: The filename to compile the code under.
+      mode: "exec", "eval" or "single".
+
+    Returns:
+      The output of compile_bytecode.compile_to_pyc, as a str.
+
+    Raises:
+      WorkerError: If the worker process died.
+    """
+    if isinstance(src, unicode):
+      src = src.encode("utf-8")
+    if isinstance(filename, unicode):
+      filename = filename.encode("utf-8")
+    try:
+      stdin = self._process.stdin
+      for field in (mode, filename, src):
+        _write32(stdin, len(field))
+      stdin.write(mode + filename + src)
+      stdin.flush()
+      size = _read32(self._process.stdout)
+      result = self._process.stdout.read(size)
+    except (IOError, OSError) as e:
+      raise WorkerError("Compiler worker failed: %s" % e)
+    if len(result) != size:
+      raise WorkerError("Compiler worker terminated unexpectedly")
+    return result
+
+  def close(self):
+    """Ask the worker to exit and wait for it."""
+    try:
+      self._process.stdin.close()
+    except IOError:
+      pass
+    self._process.wait()
+
+  def kill(self):
+    if self.is_alive():
+      self._process.kill()
+    self._process.wait()
+
+
+class CompilerPool(object):
+  """Long-lived compiler workers, keyed by (python_version, python_exe).
+
+  Workers are started lazily, the first time a request for a given interpreter
+  comes in, and are reused for subsequent requests. Up to max_workers requests
+  per interpreter are processed concurrently; if more threads ask for a
+  compile at the same time, they block until a worker becomes available.
+  """
+
+  def __init__(self, max_workers=None):
+    self._max_workers = max_workers or multiprocessing.cpu_count()
+    self._lock = threading.Condition()
+    self._idle = {}  # key -> list of idle CompilerWorker
+    self._busy = {}  # key -> number of workers currently compiling
+    self._closed = False
+
+  def _acquire(self, key):
+    """Get an idle worker for key, starting a new one if necessary."""
+    with self._lock:
+      while True:
+        if self._closed:
+          raise WorkerError("Compiler pool has been shut down")
+        idle = self._idle.get(key)
+        while idle:
+          worker = idle.pop()
+          if worker.is_alive():
+            self._busy[key] = self._busy.get(key, 0) + 1
+            return worker
+          log.warning("Discarding dead compiler worker for %r", key)
+        if self._busy.get(key, 0) < self._max_workers:
+          self._busy[key] = self._busy.get(key, 0) + 1
+          break
+        self._lock.wait()
+    # Start the process outside of the lock, so other keys aren't blocked.
+    try:
+      return CompilerWorker(worker_command(*key))
+    except OSError:
+      self._release(key, None)
+      raise
+
+  def _release(self, key, worker):
+    with self._lock:
+      self._busy[key] -= 1
+      if worker is not None:
+        if self._closed:
+          worker.close()
+        else:
+          self._idle.setdefault(key, []).append(worker)
+      self._lock.notify()
+
+  def compile(self, src, filename, python_version, python_exe, mode="exec"):
+    """Compile source code in a worker for the given interpreter.
+
+    If the worker crashes, it is replaced by a new one and the request is
+    retried once.
+
+    Args:
+      src: Python source code.
+      filename: The filename to compile the code under.
+      python_version: Python version, (major, minor).
+      python_exe: Path to a Python interpreter, or None.
+      mode: "exec", "eval" or "single".
+
+    Returns:
+      The output of compile_bytecode.compile_to_pyc, as a str.
+
+    Raises:
+      WorkerError: If the compile failed twice because of a crashing worker.
+    """
+    key = (tuple(python_version), python_exe)
+    for attempt in range(2):
+      worker = self._acquire(key)
+      try:
+        result = worker.compile(src, filename, mode)
+      except WorkerError:
+        worker.kill()
+        self._release(key, None)
+        if attempt:
+          raise
+        log.warning("Compiler worker for %r crashed, restarting it", key)
+      else:
+        self._release(key, worker)
+        return result
+
+  def shutdown(self):
+    """Stop all idle workers. Busy workers are stopped when released."""
+    with self._lock:
+      self._closed = True
+      workers = sum(self._idle.values(), [])
+      self._idle.clear()
+      self._lock.notify_all()
+    for worker in workers:
+      worker.close()
+
+
+_default_pool = None
+_default_pool_pid = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+  """Return the process-wide CompilerPool, creating it if necessary."""
+  global _default_pool, _default_pool_pid
+  with _default_pool_lock:
+    # A forked child inherits the pipes of its parent's workers, but must not
+    # use them, since the parent might be talking to the same worker.
+    if _default_pool is None or _default_pool_pid != os.getpid():
+      _default_pool = CompilerPool()
+      _default_pool_pid = os.getpid()
+      atexit.register(_default_pool.shutdown)
+    return _default_pool
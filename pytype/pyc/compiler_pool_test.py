@@ -0,0 +1,74 @@
+"""Tests for compiler_pool.py."""
+
+import threading
+
+from pytype.pyc import compiler_pool
+import unittest
+
+
+class CompilerPoolTest(unittest.TestCase):
+  """Tests for CompilerPool."""
+
+  python_version = (2, 7)
+
+  def setUp(self):
+    self.pool = compiler_pool.CompilerPool(max_workers=2)
+
+  def tearDown(self):
+    self.pool.shutdown()
+
+  def _compile(self, src, filename="test_input.py"):
+    return self.pool.compile(src, filename, self.python_version, None)
+
+  def _workers(self):
+    return sum(self.pool._idle.values(), [])  # pylint: disable=protected-access
+
+  def test_compile(self):
+    result = self._compile("foobar = 3")
+    self.assertEqual("\0", result[0])
+
+  def test_compile_error(self):
+    result = self._compile("\nfoo ==== bar--")
+    self.assertEqual("\1", result[0])
+    self.assertIn("test_input.py", result)
+
+  def test_reuse_worker(self):
+    self._compile("x = 1")
+    worker, = self._workers()
+    self._compile("y = 2")
+    self.assertEqual([worker], self._workers())
+
+  def test_restart_crashed_worker(self):
+    self._compile("x = 1")
+    worker, = self._workers()
+    worker.kill()
+    result = self._compile("y = 2")
+    self.assertEqual("\0", result[0])
+    new_worker, = self._workers()
+    self.assertIsNot(worker, new_worker)
+    self.assertTrue(new_worker.is_alive())
+
+  def test_concurrent_requests(self):
+    results = {}
+    def compile_one(i):
+      results[i] = self._compile("x = %d" % i)
+    threads = [threading.Thread(target=compile_one, args=(i,))
+               for i in range(8)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    self.assertEqual(8, len(results))
+    self.assertTrue(all(r[0] == "\0" for r in results.values()))
+    self.assertLessEqual(len(self._workers()), 2)
+
+  def test_shutdown(self):
+    self._compile("x = 1")
+    worker, = self._workers()
+    self.pool.shutdown()
+    self.assertFalse(worker.is_alive())
+    self.assertRaises(compiler_pool.WorkerError, self._compile, "x = 1")
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -4,16 +4,14 @@ import copy
 import os
 import re
 import StringIO
-import subprocess
 import tempfile
 
-from pytype import utils
 from pytype.pyc import compile_bytecode
+from pytype.pyc import compiler_pool
 from pytype.pyc import loadmarshal
 from pytype.pyc import magic
 
 
-COMPILE_SCRIPT = "pyc/compile_bytecode.py"
 COMPILE_ERROR_RE = re.compile(r"^(.*) \((.*), line (\d+)\)$")
 
 
@@ -37,8 +35,8 @@ def compile_src_string_to_pyc_string(src, filename, python_version, python_exe,
   """Compile Python source code to pyc data.
 
   This may use py_compile if the src is for the same version as we're running,
-  or else it spawns an external process to produce a .pyc file. The generated
-  bytecode (.pyc file) is read and both it and any temporary files are deleted.
+  or else it sends the source to a long-lived compiler process for the target
+  version (see compiler_pool.py).
 
   Args:
     src: Python sourcecode
@@ -57,34 +55,23 @@ def compile_src_string_to_pyc_string(src, filename, python_version, python_exe,
     CompileError: If we find a syntax error in the file.
     IOError: If our compile script failed.
   """
-  fi = tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False)
-
-  try:
-    fi.write(src)
-    fi.close()
-    if python_exe == "HOST":
-      # We were asked to use the version of Python we're running to compile.
+  if python_exe == "HOST":
+    # We were asked to use the version of Python we're running to compile.
+    fi = tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False)
+    try:
+      fi.write(src)
+      fi.close()
       output = StringIO.StringIO()
       compile_bytecode.compile_to_pyc(fi.name, filename or fi.name,
                                       output, mode)
       bytecode = output.getvalue()
-    else:
-      # In order to be able to compile pyc files for both Python 2 and Python 3,
-      # we spawn an external process.
-      if python_exe:
-        # Allow python_exe to contain parameters (E.g. "-T")
-        exe = python_exe.split() + ["-S"]
-      else:
-        exe = ["python" + ".".join(map(str, python_version))]
-      cmd = exe + ["-", fi.name, filename or fi.name, mode]
-
-      src = utils.load_pytype_file(COMPILE_SCRIPT)
-
-      p = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-      bytecode, _ = p.communicate(src)
-      assert p.poll() == 0, "Child process failed"
-  finally:
-    os.unlink(fi.name)
+    finally:
+      os.unlink(fi.name)
+  else:
+    # In order to be able to compile pyc files for both Python 2 and Python 3,
+    # we use an external process.
+    bytecode = compiler_pool.get_default_pool().compile(
+        src, filename or "<string>", python_version, python_exe, mode)
   if bytecode[0] == chr(0):  # compile OK
     return bytecode[1:]
   elif bytecode[0] == chr(1):  # compile error
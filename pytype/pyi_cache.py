@@ -0,0 +1,230 @@
+"""On-disk cache for resolved modules from pytype's pytd files and typeshed.
+
+load_pytd.Loader parses, postprocesses and resolves every stdlib module it
+loads, in every process, although the result only changes when the pytd or
+typeshed files do. This module stores the resolved modules in the binary format
+of serialize_ast, in a directory keyed by the Python version and a hash of the
+names, sizes and modification times of all the files these modules are loaded
+from, which is much cheaper to compute than a hash of their contents. Each
+entry records whether the module came from pytype's pytd files or from
+typeshed, so that a run with --no-typeshed doesn't pick up typeshed modules.
+serialize_ast.StoreAst writes atomically, so parallel processes can share a
+cache directory.
+
+The cache also holds a snapshot of __builtin__ and typing, which every Loader
+needs, and which take much longer to parse than any other module.
+"""
+
+import hashlib
+import importlib
+import logging
+import os
+
+from pytype import __version__
+from pytype import metrics
+from pytype.pytd import serialize_ast
+from pytype.pytd import typeshed
+from pytype.pytd.parse import builtins as pytd_builtins
+from pytype.pytd.parse import visitors
+
+
+log = logging.getLogger(__name__)
+
+
+# The directories, relative to pytype/, with the files pytype ships for the
+# builtins and the standard library.
+_PYTD_DIRS = (os.path.join("pytd", "builtins"), os.path.join("pytd", "stdlib"))
+
+# Where a module was loaded from: pytype's pytd files, or typeshed.
+PYTD = "pytd"
+TYPESHED = "typeshed"
+
+# The directory for the snapshot of __builtin__ and typing. See load_builtins.
+_SNAPSHOT_DIR = "snapshot"
+_SNAPSHOT_MODULES = ("__builtin__", "typing")
+
+_cache_hits = metrics.Counter("pyi_cache_hits")
+_cache_misses = metrics.Counter("pyi_cache_misses")
+
+# The modules that parse, postprocess and resolve the cached modules. They are
+# given by name, because load_pytd imports this module.
+_SOURCE_MODULES = (
+    "pytype.load_pytd",
+    "pytype.pyi.parser",
+    "pytype.pyi.parser_ext",
+    "pytype.pytd.parse.builtins",
+    "pytype.pytd.parse.visitors",
+    "pytype.pytd.pep484",
+    "pytype.pytd.pytd",
+    "pytype.pytd.serialize_ast",
+    "pytype.pytd.typeshed",
+    "pytype.pytd.utils",
+    __name__,
+)
+
+_source_hash = None
+_content_hash = None
+
+
+def _hash_directory(m, path):
+  """Hash the relative path, size and mtime of every file under path."""
+  for root, dirs, files in os.walk(path):
+    dirs.sort()
+    rel_root = os.path.relpath(root, path)
+    for filename in sorted(files):
+      st = os.stat(os.path.join(root, filename))
+      m.update(repr((os.path.join(rel_root, filename), st.st_size,
+                     st.st_mtime)) + "\0")
+
+
+def source_hash():
+  """Hash the source of _SOURCE_MODULES.
+
+  This is only computed once per process.
+
+  Returns:
+    A hex digest.
+  """
+  global _source_hash
+  if _source_hash is None:
+    m = hashlib.sha1()
+    for module_name in _SOURCE_MODULES:
+      filename = importlib.import_module(module_name).__file__
+      if filename.endswith((".pyc", ".pyo")) and os.path.exists(filename[:-1]):
+        filename = filename[:-1]
+      m.update(module_name + "\0")
+      with open(filename, "rb") as fi:
+        m.update(fi.read())
+    _source_hash = m.hexdigest()
+  return _source_hash
+
+
+def content_hash():
+  """Hash the pytd and typeshed files, and everything else the cache depends on.
+
+  Files are identified by their size and modification time rather than their
+  contents, so that this doesn't read all of typeshed. The code that turns them
+  into the cached modules is identified by its source, see source_hash().
+
+  This is only computed once per process.
+
+  Returns:
+    A hex digest.
+  """
+  global _content_hash
+  if _content_hash is None:
+    m = hashlib.sha1()
+    m.update(repr((serialize_ast._FORMAT_VERSION,  # pylint: disable=protected-access
+                   __version__.__version__, source_hash())))
+    pytype_dir = os.path.dirname(__file__)
+    for path in _PYTD_DIRS:
+      m.update(path + "\0")
+      _hash_directory(m, os.path.join(pytype_dir, path))
+    m.update("typeshed\0")
+    _hash_directory(m, typeshed.Typeshed().typeshed_path)
+    _content_hash = m.hexdigest()
+  return _content_hash
+
+
+def from_options(options):
+  """Create the PyiCache for the given options, or None if there's no cache."""
+  if not options.cache_dir:
+    return None
+  return PyiCache(os.path.join(options.cache_dir, "pyi"),
+                  options.python_version)
+
+
+class PyiCache(object):
+  """A directory of resolved modules, in the binary format of serialize_ast.
+
+  Attributes:
+    path: The directory for the current Python version and file contents.
+  """
+
+  def __init__(self, cache_dir, python_version):
+    self.path = os.path.join(cache_dir, "%d.%d" % tuple(python_version),
+                             content_hash())
+
+  def _path(self, source, subdir, module_name):
+    return os.path.join(self.path, source, subdir, module_name + ".ast")
+
+  def get(self, subdir, module_name, sources, lazy=False):
+    """Look up a module.
+
+    Args:
+      subdir: The directory the module was loaded from, e.g. "stdlib".
+      module_name: The name of the module.
+      sources: The sources (PYTD or TYPESHED) to accept an entry from, in the
+        order in which they are tried.
+      lazy: Passed to serialize_ast.LoadAst.
+
+    Returns:
+      A serialize_ast.SerializableAst, or None.
+    """
+    for source in sources:
+      path = self._path(source, subdir, module_name)
+      if not os.path.exists(path):
+        continue
+      try:
+        loaded_ast = serialize_ast.LoadAst(path, module_name, lazy=lazy)
+      except Exception:  # pylint: disable=broad-except
+        log.warning("Ignoring corrupt pyi cache entry %s", path)
+        continue
+      _cache_hits.inc()
+      return loaded_ast
+    _cache_misses.inc()
+    return None
+
+  def put(self, subdir, module_name, source, ast):
+    path = self._path(source, subdir, module_name)
+    try:
+      directory = os.path.dirname(path)
+      if not os.path.isdir(directory):
+        try:
+          os.makedirs(directory)
+        except OSError:
+          # Another process might have created it in the meantime.
+          if not os.path.isdir(directory):
+            raise
+      serialize_ast.StoreAst(ast, path)
+    except (IOError, OSError) as e:
+      log.warning("Couldn't write pyi cache entry %s: %s", path, e)
+
+  def load_builtins(self):
+    """Make pytd_builtins.GetBuiltinsAndTyping use a snapshot from the cache.
+
+    Parsing and resolving __builtin__ and typing dominates the startup time of
+    pytype. If the snapshot doesn't exist yet, this parses them, and stores the
+    result. Does nothing if they have already been loaded in this process, e.g.
+    from --precompiled-builtins.
+    """
+    if pytd_builtins.HasBuiltinsAndTyping():
+      return
+    loaded_asts = [self.get(_SNAPSHOT_DIR, name, (PYTD,))
+                   for name in _SNAPSHOT_MODULES]
+    if all(loaded_asts):
+      module_map = {loaded.ast.name: loaded.ast for loaded in loaded_asts}
+      try:
+        asts = tuple(serialize_ast.ProcessAst(loaded, module_map)
+                     for loaded in loaded_asts)
+      except serialize_ast.UnrestorableDependencyError as e:
+        log.warning("Ignoring corrupt builtins snapshot: %s", e)
+      else:
+        # Like GetBuiltinsAndTyping, also resolve names that aren't fully
+        # qualified, e.g. "str".
+        unresolved = []
+        for loaded, ast in zip(loaded_asts, asts):
+          fill = visitors.FillInLocalPointers(dict(module_map, **{"": ast}))
+          for node in loaded.class_type_nodes:
+            if node.cls is None:
+              fill.EnterClassType(node)
+              if node.cls is None:
+                unresolved.append(node.name)
+        if not unresolved:
+          pytd_builtins.SetBuiltinsAndTyping(asts)
+          return
+        log.warning("Ignoring builtins snapshot with unresolved classes: %s",
+                    ", ".join(unresolved))
+    for name, ast in zip(_SNAPSHOT_MODULES,
+                         pytd_builtins.GetBuiltinsAndTyping()):
+      self.put(_SNAPSHOT_DIR, name, PYTD, ast)
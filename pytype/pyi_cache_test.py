@@ -0,0 +1,136 @@
+"""Tests for pyi_cache.py."""
+
+import hashlib
+import os
+
+from pytype import config
+from pytype import load_pytd
+from pytype import pyi_cache
+from pytype import utils
+from pytype.pytd import serialize_ast
+from pytype.pytd.parse import builtins as pytd_builtins
+from pytype.pytd.parse import visitors
+import unittest
+
+
+class PyiCacheTest(unittest.TestCase):
+  """Tests for caching resolved modules."""
+
+  python_version = (2, 7)
+
+  def setUp(self):
+    options = config.Options.create(python_version=self.python_version)
+    self.loader = load_pytd.Loader(None, options)
+
+  def test_path(self):
+    cache = pyi_cache.PyiCache("/nonexistent", self.python_version)
+    self.assertEqual(cache.path, os.path.join(
+        "/nonexistent", "2.7", pyi_cache.content_hash()))
+    self.assertNotEqual(
+        cache.path, pyi_cache.PyiCache("/nonexistent", (3, 6)).path)
+
+  def test_hash_directory(self):
+    def hash_directory(path):
+      m = hashlib.sha1()
+      pyi_cache._hash_directory(m, path)
+      return m.hexdigest()
+    with utils.Tempdir() as d:
+      d.create_file("stdlib/foo.pyi", "x = ...  # type: int")
+      foo = os.path.join(d.path, "stdlib", "foo.pyi")
+      os.utime(foo, (0, 0))
+      h = hash_directory(d.path)
+      self.assertEqual(h, hash_directory(d.path))
+      os.utime(foo, (0, 1))
+      self.assertNotEqual(h, hash_directory(d.path))
+      h = hash_directory(d.path)
+      d.create_file("stdlib/bar.pyi")
+      self.assertNotEqual(h, hash_directory(d.path))
+
+  def test_cache(self):
+    ast = self.loader.import_name("collections")
+    with utils.Tempdir() as d:
+      cache = pyi_cache.PyiCache(d.path, self.python_version)
+      sources = (pyi_cache.PYTD, pyi_cache.TYPESHED)
+      self.assertIsNone(cache.get("stdlib", "collections", sources))
+      cache.put("stdlib", "collections", pyi_cache.PYTD, ast)
+      self.assertIsNone(cache.get("builtins", "collections", sources))
+      loaded_ast = cache.get("stdlib", "collections", sources)
+      self.assertEqual(
+          os.listdir(os.path.join(cache.path, pyi_cache.PYTD, "stdlib")),
+          ["collections.ast"])
+    self.assertTrue(ast.ASTeq(loaded_ast.ast))
+    # Storing must leave the class pointers of the ast intact.
+    self.assertTrue(ast.Lookup("collections.OrderedDict").parents[0].base_type.cls)
+
+  def test_source_hash(self):
+    ast = self.loader.import_name("collections")
+    with utils.Tempdir() as d:
+      pyi_cache.PyiCache(d.path, self.python_version).put(
+          "stdlib", "collections", pyi_cache.PYTD, ast)
+      old_source_hash = pyi_cache.source_hash()
+      old_content_hash = pyi_cache.content_hash()
+      def restore():
+        pyi_cache._source_hash = old_source_hash
+        pyi_cache._content_hash = old_content_hash
+      self.addCleanup(restore)
+      # Pretend that the code which resolves the modules changed.
+      pyi_cache._source_hash = "edited"
+      pyi_cache._content_hash = None
+      cache = pyi_cache.PyiCache(d.path, self.python_version)
+      self.assertIsNone(cache.get("stdlib", "collections", (pyi_cache.PYTD,)))
+
+  def test_corrupt_entry(self):
+    with utils.Tempdir() as d:
+      cache = pyi_cache.PyiCache(d.path, self.python_version)
+      d.create_file(os.path.join(cache.path, pyi_cache.PYTD, "stdlib",
+                                 "foo.ast"), "garbage")
+      self.assertIsNone(cache.get("stdlib", "foo", (pyi_cache.PYTD,)))
+
+  def test_source(self):
+    ast = self.loader.import_name("collections")
+    with utils.Tempdir() as d:
+      cache = pyi_cache.PyiCache(d.path, self.python_version)
+      cache.put("stdlib", "collections", pyi_cache.TYPESHED, ast)
+      self.assertIsNone(cache.get("stdlib", "collections", (pyi_cache.PYTD,)))
+      self.assertTrue(cache.get("stdlib", "collections",
+                                (pyi_cache.PYTD, pyi_cache.TYPESHED)))
+
+  def test_no_typeshed(self):
+    with utils.Tempdir() as d:
+      ast = self.loader.import_name("collections")
+      cache = pyi_cache.PyiCache(os.path.join(d.path, "pyi"),
+                                 self.python_version)
+      # Pretend collections came from typeshed.
+      cache.put("stdlib", "foo", pyi_cache.TYPESHED,
+                ast.Visit(serialize_ast.RenameModuleVisitor("collections",
+                                                            "foo")))
+      options = config.Options.create(python_version=self.python_version,
+                                      cache_dir=d.path)
+      self.assertTrue(load_pytd.Loader(None, options).import_name("foo"))
+      options.tweak(typeshed=False)
+      self.assertIsNone(load_pytd.Loader(None, options).import_name("foo"))
+
+  def test_load_builtins(self):
+    b, t = pytd_builtins.GetBuiltinsAndTyping()
+    with utils.Tempdir() as d:
+      cache = pyi_cache.PyiCache(d.path, self.python_version)
+      cache.put(pyi_cache._SNAPSHOT_DIR, "__builtin__", pyi_cache.PYTD, b)
+      cache.put(pyi_cache._SNAPSHOT_DIR, "typing", pyi_cache.PYTD, t)
+      pytd_builtins._cached_builtins_pytd = None
+      try:
+        cache.load_builtins()
+        self.assertTrue(pytd_builtins.HasBuiltinsAndTyping())
+        loaded_b, loaded_t = pytd_builtins.GetBuiltinsAndTyping()
+      finally:
+        pytd_builtins._cached_builtins_pytd = b, t
+    self.assertIsNot(b, loaded_b)
+    self.assertTrue(b.ASTeq(loaded_b))
+    self.assertTrue(t.ASTeq(loaded_t))
+    loaded_b.Visit(visitors.VerifyLookup())
+    loaded_t.Visit(visitors.VerifyLookup())
+    self.assertIs(loaded_t.Lookup("typing.List").parents[0].base_type.cls,
+                  loaded_t.Lookup("typing.MutableSequence"))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -24,6 +24,17 @@ _variable_size_metric = metrics.Distribution("variable_size")
 # use that as the cutoff.
 MAX_VAR_SIZE = 64
 
+# The reachability index stores one bitset per CFG node, so its memory grows
+# quadratically with the number of nodes. Beyond this many nodes, we drop it
+# and fall back to walking the graph.
+MAX_REACHABILITY_NODES = 1 << 14
+
+# Upper bounds for the number of entries in the solver's state cache and in
+# the path finder's query cache. Without a bound, both can grow to millions of
+# entries on large programs.
+SOLVER_CACHE_SIZE = 1 << 17
+PATH_CACHE_SIZE = 1 << 16
+
 
 class Program(object):
   """Program instances describe program entities.
@@ -36,35 +47,70 @@ class Program(object):
     entrypoint: Entrypoint of the program, if it has one. (None otherwise)
     cfg_nodes: CFG nodes in use. Will be used for assigning node IDs.
     variables: Variables in use. Will be used for assigning variable IDs.
+    solver_cache_size: Maximum number of entries in the solver's state cache.
+    path_cache_size: Maximum number of entries in the path finder's cache.
   """
 
-  def __init__(self):
+  def __init__(self, solver_cache_size=None, path_cache_size=None):
     """Initialize a new (initially empty) program."""
     self.entrypoint = None
     self.cfg_nodes = []
     self.next_variable_id = 0
     self.solver = None
     self.default_data = None
+    self.reachability = Reachability()
+    self.solver_cache_size = solver_cache_size or SOLVER_CACHE_SIZE
+    self.path_cache_size = path_cache_size or PATH_CACHE_SIZE
+    # The path finder only depends on the shape of the CFG, so unlike the
+    # solver, it can survive most changes to the program. See _InvalidatePaths.
+    self._path_finder = None
 
   def CreateSolver(self):
     if self.solver is None:
-      self.solver = Solver(self)
+      if self._path_finder is None:
+        self._path_finder = _PathFinder(self.reachability, self.path_cache_size)
+      self.solver = Solver(self, self._path_finder)
     return self.solver
 
   def InvalidateSolver(self):
+    """Forget all cached results, e.g. after changing a node's condition."""
+    self.solver = None
+    self._path_finder = None
+
+  def _InvalidateBindings(self):
+    """Called when bindings or origins change. Keeps path finder results."""
     self.solver = None
 
+  def _InvalidatePaths(self, cfg_node):
+    """Called before an edge to cfg_node is added."""
+    self.solver = None
+    if self._path_finder is not None:
+      if cfg_node.outgoing:
+        # The new edge might be on the way back from any node after cfg_node.
+        self._path_finder = None
+      else:
+        # cfg_node is a leaf, so only walks starting at it can pass the edge.
+        self._path_finder.InvalidateStart(cfg_node)
+
   def NewCFGNode(self, name=None, condition=None):
     """Start a new CFG node."""
-    self.InvalidateSolver()
-    cfg_node = CFGNode(self, name, len(self.cfg_nodes), condition)
+    # A new node has no edges, so it can't change the outcome of any query.
+    self._InvalidateBindings()
+    cfg_node = self._CreateCFGNode(name, len(self.cfg_nodes), condition)
     self.cfg_nodes.append(cfg_node)
+    self.reachability.AddNode(cfg_node)
     return cfg_node
 
+  def _CreateCFGNode(self, name, cfgnode_id, condition):
+    return CFGNode(self, name, cfgnode_id, condition)
+
   @property
   def variables(self):
     return {b.variable for node in self.cfg_nodes for b in node.bindings}
 
+  def _CreateVariable(self, variable_id):
+    return Variable(self, variable_id)
+
   def NewVariable(self, bindings=None, source_set=None, where=None):
     """Create a new Variable.
 
@@ -84,7 +130,7 @@ class Program(object):
     Returns:
       A Variable instance.
     """
-    variable = Variable(self, self.next_variable_id)
+    variable = self._CreateVariable(self.next_variable_id)
     log.trace("New variable v%d", self.next_variable_id)
     self.next_variable_id += 1
     if bindings is not None:
@@ -167,12 +213,21 @@ class CFGNode(object):
 
   def ConnectTo(self, cfg_node):
     """Connect this node to an existing node."""
-    self.program.InvalidateSolver()
+    self.program._InvalidatePaths(cfg_node)  # pylint: disable=protected-access
     self.outgoing.add(cfg_node)
     cfg_node.incoming.add(self)
+    self.program.reachability.AddEdge(self, cfg_node)
 
   def CanHaveCombination(self, bindings):
     """Quick version of HasCombination below."""
+    reachability = self.program.reachability
+    if reachability.valid:
+      # A binding is possible if it's assigned at a node we can be reached
+      # from.
+      ancestors = reachability.Ancestors(self)
+      return all(any(ancestors >> origin.where.id & 1
+                     for origin in binding.origins)
+                 for binding in bindings)
     goals = set(bindings)
     seen = set()
     stack = [self]
@@ -182,7 +237,7 @@ class CFGNode(object):
       if node in seen:
         continue
       seen.add(node)
-      goals -= goals & node.bindings
+      goals.difference_update(node.bindings)
       stack.extend(node.incoming)
     return not goals
 
@@ -237,6 +292,62 @@ class CFGNode(object):
       return pytype.debug.ascii_tree(self, lambda node: node.incoming)
 
 
+class Reachability(object):
+  """Incrementally maintained (backwards) reachability between CFG nodes.
+
+  For every CFG node, we store the set of nodes it can be reached from, as a
+  bitset (a Python long, indexed by node id). Adding a node is O(1), adding an
+  edge propagates the ancestors of its source to all nodes downstream that
+  don't already have them.
+
+  Once the program grows beyond max_nodes nodes, the index is dropped and
+  "valid" becomes False. Users then need to fall back to walking the graph.
+
+  Attributes:
+    valid: Whether the index can be used.
+  """
+
+  def __init__(self, max_nodes=None):
+    self._max_nodes = MAX_REACHABILITY_NODES if max_nodes is None else max_nodes
+    self._ancestors = []
+    self.valid = True
+
+  def AddNode(self, node):
+    if not self.valid:
+      return
+    if node.id >= self._max_nodes:
+      self.Invalidate()
+      return
+    assert node.id == len(self._ancestors)
+    self._ancestors.append(1 << node.id)
+
+  def AddEdge(self, src, dst):
+    if not self.valid:
+      return
+    ancestors = self._ancestors
+    bits = ancestors[src.id]
+    stack = [dst]
+    while stack:
+      node = stack.pop()
+      old = ancestors[node.id]
+      new = old | bits
+      if new != old:
+        ancestors[node.id] = new
+        stack.extend(node.outgoing)
+
+  def Invalidate(self):
+    self.valid = False
+    self._ancestors = None
+
+  def Ancestors(self, node):
+    """The nodes (including node itself) we can reach node from, as a bitset."""
+    return self._ancestors[node.id]
+
+  def CanReach(self, src, dst):
+    """Is there a path (following edges forward) from src to dst?"""
+    return bool(self._ancestors[dst.id] >> src.id & 1)
+
+
 class SourceSet(frozenset):
   """A SourceSet is a combination of Bindings that was used to form a Binding.
 
@@ -261,7 +372,7 @@ class Origin(collections.namedtuple("_", "where, source_sets")):
 
   def __new__(cls, where, source_sets=None):
     return super(Origin, cls).__new__(
-        cls, where, source_sets or set())
+        cls, where, set() if source_sets is None else source_sets)
 
   def AddSourceSet(self, source_set):
     """Add a new possible source set."""
@@ -326,7 +437,7 @@ class Binding(object):
 
   def AddOrigin(self, where, source_set):
     """Add another possible origin to this binding."""
-    self.program.InvalidateSolver()
+    self.program._InvalidateBindings()  # pylint: disable=protected-access
     origin = self._FindOrAddOrigin(where)
     origin.AddSourceSet(source_set)
 
@@ -418,6 +529,29 @@ class Variable(object):
       return self.bindings
 
     num_bindings = len(self.bindings)
+    reachability = self.program.reachability
+    if reachability.valid:
+      bindings = self._cfgnode_to_bindings.get(viewpoint)
+      if bindings is not None:
+        return set(bindings)
+      ancestors = reachability.Ancestors(viewpoint)
+      candidates = [node for node in self._cfgnode_to_bindings
+                    if ancestors >> node.id & 1]
+      mask = 0
+      upstream = 0
+      for node in candidates:
+        bit = 1 << node.id
+        mask |= bit
+        upstream |= reachability.Ancestors(node) & ~bit
+      if not upstream & mask:
+        # No assignment can be overwritten by another one on the way to
+        # viewpoint, so they're all visible.
+        result = set()
+        for node in candidates:
+          result.update(self._cfgnode_to_bindings[node])
+        return result
+    else:
+      mask = None
     result = set()
     seen = set()
     stack = [viewpoint]
@@ -433,6 +567,9 @@ class Variable(object):
         # Don't expand this node - previous assignments to this variable will
         # be invisible, since they're overwritten here.
         continue
+      elif mask is not None and not reachability.Ancestors(node) & mask:
+        # There are no assignments upstream of this node.
+        continue
       else:
         stack.extend(set(node.incoming) - seen)
     return result
@@ -467,7 +604,7 @@ class Variable(object):
     try:
       binding = self._data_id_to_binding[id(data)]
     except KeyError:
-      self.program.InvalidateSolver()
+      self.program._InvalidateBindings()  # pylint: disable=protected-access
       binding = Binding(self.program, self, data)
       self.bindings.append(binding)
       self._data_id_to_binding[id(data)] = binding
@@ -677,11 +814,97 @@ class State(object):
     return not self == other
 
 
+_NOT_FOUND = object()
+
+
+class _BoundedCache(object):
+  """A mapping that holds at most max_size entries.
+
+  This approximates LRU eviction with two generations: New entries go into the
+  current generation. Once that is full, it becomes the previous generation,
+  and whatever was in the previous generation is dropped. Entries found in the
+  previous generation are moved back into the current one, so everything that
+  was used recently survives a rotation.
+
+  Attributes:
+    hits: Number of successful lookups.
+    misses: Number of failed lookups.
+    evictions: Number of entries dropped because the cache was full.
+  """
+
+  def __init__(self, max_size, metric):
+    self._generation_size = max(max_size // 2, 1)
+    self._metric = metric
+    self._current = {}
+    self._previous = {}
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def __len__(self):
+    return len(self._current) + len(self._previous)
+
+  def Get(self, key):
+    """Look up a key. Returns _NOT_FOUND if it's not in the cache."""
+    value = self._current.get(key, _NOT_FOUND)
+    if value is _NOT_FOUND:
+      value = self._previous.pop(key, _NOT_FOUND)
+      if value is _NOT_FOUND:
+        self.misses += 1
+        self._metric.inc("miss")
+        return value
+      self._Store(key, value)
+    self.hits += 1
+    self._metric.inc("hit")
+    return value
+
+  def Set(self, key, value):
+    self._previous.pop(key, None)
+    self._Store(key, value)
+
+  def _Store(self, key, value):
+    if len(self._current) >= self._generation_size:
+      if self._previous:
+        self.evictions += len(self._previous)
+        self._metric.inc("evict", len(self._previous))
+      self._previous = self._current
+      self._current = {}
+    self._current[key] = value
+
+  def DropIf(self, predicate):
+    """Remove all entries whose key satisfies the given predicate."""
+    for generation in (self._current, self._previous):
+      for key in [k for k in generation if predicate(k)]:
+        del generation[key]
+
+
 class _PathFinder(object):
   """Finds a path between two nodes and collects nodes with conditions."""
 
-  def __init__(self):
-    self._solved_find_queries = {}
+  _cache_metric = metrics.MapCounter("cfg_path_finder_cache")
+
+  def __init__(self, reachability=None, cache_size=None):
+    self._solved_find_queries = _BoundedCache(cache_size or PATH_CACHE_SIZE,
+                                              _PathFinder._cache_metric)
+    # Nodes that have been used as the start of a query. We don't bother
+    # updating this on eviction, so this is a superset.
+    self._query_starts = set()
+    self._reachability = reachability
+
+  @property
+  def cache(self):
+    return self._solved_find_queries
+
+  def InvalidateStart(self, start):
+    """Forget all cached queries starting at the given node."""
+    if start in self._query_starts:
+      self._query_starts.discard(start)
+      self._solved_find_queries.DropIf(lambda query: query[0] is start)
+
+  def _Unreachable(self, start, finish):
+    """Quick check (using the index, if available) for a missing path."""
+    return (self._reachability is not None and self._reachability.valid and
+            not self._reachability.CanReach(finish, start))
 
   def FindAnyPathToNode(self, start, finish, blocked):
     """Determine whether we can reach a node at all.
@@ -696,6 +919,8 @@ class _PathFinder(object):
     Returns:
       True if we can reach finish from start, False otherwise.
     """
+    if self._Unreachable(start, finish):
+      return False
     stack = [start]
     seen = set()
     while stack:
@@ -801,9 +1026,13 @@ class _PathFinder(object):
       they occur on said path(s).
     """
     query = (start, finish, blocked)
-    if query in self._solved_find_queries:
-      return self._solved_find_queries[query]
-    shortest_path = self.FindShortestPathToNode(start, finish, blocked)
+    result = self._solved_find_queries.Get(query)
+    if result is not _NOT_FOUND:
+      return result
+    if self._Unreachable(start, finish):
+      shortest_path = None
+    else:
+      shortest_path = self.FindShortestPathToNode(start, finish, blocked)
     if shortest_path is None:
       result = False, ()
     else:
@@ -825,8 +1054,8 @@ class _PathFinder(object):
           break
         node = self.FindHighestReachableWeight(node, blocked, weights)
       result = True, path
-    # TODO(kramm): This dict can grow pretty big. Use a MRU cache?
-    self._solved_find_queries[query] = result
+    self._solved_find_queries.Set(query, result)
+    self._query_starts.add(start)
     return result
 
 
@@ -840,15 +1069,25 @@ class Solver(object):
   _cache_metric = metrics.MapCounter("cfg_solver_cache")
   _goals_per_find_metric = metrics.Distribution("cfg_solver_goals_per_find")
 
-  def __init__(self, program):
+  def __init__(self, program, path_finder=None):
     """Initialize a solver instance. Every instance has their own cache.
 
     Arguments:
       program: The program we're in.
+      path_finder: Optionally, a _PathFinder to share with other solvers.
     """
     self.program = program
-    self._solved_states = {}
-    self._path_finder = _PathFinder()
+    self._solved_states = _BoundedCache(program.solver_cache_size,
+                                        Solver._cache_metric)
+    # States we're currently trying to solve. These are kept out of the
+    # (bounded) cache, since evicting them could cause infinite recursion.
+    self._states_in_progress = set()
+    self._path_finder = path_finder or _PathFinder(program.reachability,
+                                                   program.path_cache_size)
+
+  @property
+  def cache(self):
+    return self._solved_states
 
   def Solve(self, start_attrs, start_node):
     """Try to solve the given problem.
@@ -871,18 +1110,21 @@ class Solver(object):
 
   def _RecallOrFindSolution(self, state, seen_goals):
     """Memoized version of FindSolution()."""
-    if state in self._solved_states:
-      Solver._cache_metric.inc("hit")
-      return self._solved_states[state]
-
-    # To prevent infinite loops, we insert this state into the hashmap as a
-    # solvable state, even though we have not solved it yet. The reasoning is
-    # that if it's possible to solve this state at this level of the tree, it
-    # can also be solved in any of the children.
-    self._solved_states[state] = True
-
-    Solver._cache_metric.inc("miss")
-    result = self._solved_states[state] = self._FindSolution(state, seen_goals)
+    # To prevent infinite loops, we treat states we're in the process of
+    # solving as solvable, even though we have not solved them yet. The
+    # reasoning is that if it's possible to solve this state at this level of
+    # the tree, it can also be solved in any of the children.
+    if state in self._states_in_progress:
+      return True
+    result = self._solved_states.Get(state)
+    if result is not _NOT_FOUND:
+      return result
+    self._states_in_progress.add(state)
+    try:
+      result = self._FindSolution(state, seen_goals)
+    finally:
+      self._states_in_progress.discard(state)
+    self._solved_states.Set(state, result)
     return result
 
   def _FindSolution(self, state, seen_goals):
@@ -938,3 +1180,189 @@ class Solver(object):
             elif self._RecallOrFindSolution(new_state, seen_goals | new_goals):
               return True
     return False
+
+
+# The compact typegraph. On large programs, most of the memory of the typegraph
+# goes to the sets and dicts that every node, variable, binding and origin
+# carries, even though most of them only ever hold one or two entries. The
+# classes below are drop-in replacements (and subclasses, so isinstance checks
+# keep working) that store small tuples instead, only build lookup dicts for
+# the few objects that grow large, and share equal source sets across the
+# program.
+
+# Number of entries after which a compact variable or binding builds a dict to
+# look up its bindings or origins, instead of scanning a list.
+COMPACT_INDEX_THRESHOLD = 8
+
+
+class CompactProgram(Program):
+  """A Program that trades some speed for a much smaller typegraph.
+
+  Its nodes store their edges and bindings in tuples and lists, its variables
+  and bindings only build lookup dicts once they grow beyond
+  COMPACT_INDEX_THRESHOLD entries, its origins hold tuples of source sets, and
+  all equal source sets are interned.
+  """
+
+  def __init__(self, solver_cache_size=None, path_cache_size=None):
+    super(CompactProgram, self).__init__(solver_cache_size, path_cache_size)
+    self._source_sets = {}
+
+  def _CreateCFGNode(self, name, cfgnode_id, condition):
+    return _CompactCFGNode(self, name, cfgnode_id, condition)
+
+  def _CreateVariable(self, variable_id):
+    return _CompactVariable(self, variable_id)
+
+  def InternSourceSet(self, source_set):
+    """Return the SourceSet equal to source_set that's shared program-wide."""
+    source_set = SourceSet(source_set)
+    return self._source_sets.setdefault(source_set, source_set)
+
+
+class _CompactCFGNode(CFGNode):
+  """A CFGNode with tuples of incoming and outgoing nodes, and a binding list.
+
+  Bindings are only ever registered once per node, so unlike a set, the list
+  doesn't need to check for duplicates.
+  """
+  __slots__ = ()
+
+  # pylint: disable=super-init-not-called
+  def __init__(self, program, name, cfgnode_id, condition):
+    self.program = program
+    self.id = cfgnode_id
+    self.name = name
+    self.condition = condition
+    self.incoming = ()
+    self.outgoing = ()
+    self.bindings = []
+
+  def ConnectTo(self, cfg_node):
+    """Connect this node to an existing node."""
+    self.program._InvalidatePaths(cfg_node)  # pylint: disable=protected-access
+    if cfg_node not in self.outgoing:
+      self.outgoing += (cfg_node,)
+      cfg_node.incoming += (self,)
+    self.program.reachability.AddEdge(self, cfg_node)
+
+  def RegisterBinding(self, binding):
+    self.bindings.append(binding)
+
+
+class _CompactBinding(Binding):
+  """A Binding whose origins hold tuples of interned source sets.
+
+  Origins are immutable, so adding a source set replaces the origin. The
+  origins are looked up by scanning the list, until there are more than
+  COMPACT_INDEX_THRESHOLD of them. Then _cfgnode_to_origin maps CFG nodes to
+  their index in the list.
+  """
+  __slots__ = ()
+
+  # pylint: disable=super-init-not-called
+  def __init__(self, program, variable, data):
+    self.program = program
+    self.variable = variable
+    self.origins = []
+    self.data = data
+    self._cfgnode_to_origin = None
+
+  def _FindOriginIndex(self, cfg_node):
+    if self._cfgnode_to_origin is not None:
+      return self._cfgnode_to_origin.get(cfg_node)
+    for i, origin in enumerate(self.origins):
+      if origin.where is cfg_node:
+        return i
+    return None
+
+  def _FindOrAddOrigin(self, cfg_node):
+    """Return the index of the Origin for a CFGNode, adding it if necessary."""
+    i = self._FindOriginIndex(cfg_node)
+    if i is None:
+      i = len(self.origins)
+      self.origins.append(Origin(cfg_node, ()))
+      if self._cfgnode_to_origin is not None:
+        self._cfgnode_to_origin[cfg_node] = i
+      elif i >= COMPACT_INDEX_THRESHOLD:
+        self._cfgnode_to_origin = {
+            origin.where: j for j, origin in enumerate(self.origins)}
+      self.variable.RegisterBindingAtNode(self, cfg_node)
+      cfg_node.RegisterBinding(self)
+    return i
+
+  def FindOrigin(self, cfg_node):
+    """Return an Origin instance for a CFGNode, or None."""
+    i = self._FindOriginIndex(cfg_node)
+    return None if i is None else self.origins[i]
+
+  def AddOrigin(self, where, source_set):
+    """Add another possible origin to this binding."""
+    self.program._InvalidateBindings()  # pylint: disable=protected-access
+    source_set = self.program.InternSourceSet(source_set)
+    i = self._FindOrAddOrigin(where)
+    origin = self.origins[i]
+    if source_set not in origin.source_sets:
+      self.origins[i] = Origin(where, origin.source_sets + (source_set,))
+
+
+class _CompactVariable(Variable):
+  """A Variable that stores the bindings at each node in tuples.
+
+  Bindings are looked up by scanning the list, until there are more than
+  COMPACT_INDEX_THRESHOLD of them. Then _data_id_to_binding is built, like in
+  Variable.
+  """
+  __slots__ = ()
+
+  # pylint: disable=super-init-not-called
+  def __init__(self, program, variable_id):
+    self.program = program
+    self.id = variable_id
+    self.bindings = []
+    self._data_id_to_binding = None
+    self._cfgnode_to_bindings = {}
+    self._callbacks = ()
+
+  def _FindBinding(self, data):
+    if self._data_id_to_binding is not None:
+      return self._data_id_to_binding.get(id(data))
+    for binding in self.bindings:
+      if binding.data is data:
+        return binding
+    return None
+
+  def _FindOrAddBinding(self, data):
+    """Add a new binding if necessary, otherwise return existing binding."""
+    binding = self._FindBinding(data)
+    if binding is not None:
+      return binding
+    if len(self.bindings) >= MAX_VAR_SIZE - 1:
+      data = self.program.default_data
+      binding = self._FindBinding(data)
+      if binding is not None:
+        return binding
+    self.program._InvalidateBindings()  # pylint: disable=protected-access
+    binding = _CompactBinding(self.program, self, data)
+    self.bindings.append(binding)
+    if self._data_id_to_binding is not None:
+      self._data_id_to_binding[id(data)] = binding
+    elif len(self.bindings) > COMPACT_INDEX_THRESHOLD:
+      self._data_id_to_binding = {id(b.data): b for b in self.bindings}
+    for callback in self._callbacks:
+      callback()
+    _variable_size_metric.add(len(self.bindings))
+    return binding
+
+  def RegisterBindingAtNode(self, binding, node):
+    bindings = self._cfgnode_to_bindings.get(node, ())
+    if binding not in bindings:
+      self._cfgnode_to_bindings[node] = bindings + (binding,)
+
+  def RegisterChangeListener(self, callback):
+    self._callbacks += (callback,)
+
+  def UnregisterChangeListener(self, callback):
+    callbacks = list(self._callbacks)
+    callbacks.remove(callback)
+    self._callbacks = tuple(callbacks)
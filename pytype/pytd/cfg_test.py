@@ -1,5 +1,6 @@
 """Test for the cfg Python extension module."""
 
+import random
 import unittest
 from pytype.pytd import cfg
 import unittest
@@ -945,6 +946,54 @@ class CFGTest(unittest.TestCase):
     x = p.NewVariable(["b"], [a], n2)
     self.assertIsNone(p.solver)
 
+  def testPathFinderSurvivesNewNodes(self):
+    p = cfg.Program()
+    n1 = p.NewCFGNode("n1")
+    n2 = n1.ConnectNew("n2", condition=p.NewVariable().AddBinding("c"))
+    n3 = n2.ConnectNew("n3")
+    f = p.CreateSolver()._path_finder
+    self.assertEqual((True, [n2]), f.FindNodeBackwards(n3, n1, ()))
+    n4 = n3.ConnectNew("n4")
+    self.assertIsNone(p.solver)
+    self.assertIs(f, p.CreateSolver()._path_finder)
+    self.assertEqual(1, len(f.cache))
+    n5 = p.NewCFGNode("n5")
+    n5.ConnectTo(n3)
+    self.assertIsNot(f, p.CreateSolver()._path_finder)
+
+  def testPathFinderInvalidateLeaf(self):
+    p = cfg.Program()
+    n1 = p.NewCFGNode("n1")
+    n2 = p.NewCFGNode("n2")
+    n3 = p.NewCFGNode("n3")
+    n1.ConnectTo(n3)
+    f = p.CreateSolver()._path_finder
+    self.assertFalse(f.FindNodeBackwards(n3, n2, ())[0])
+    self.assertTrue(f.FindNodeBackwards(n1, n1, ())[0])
+    n2.ConnectTo(n3)
+    self.assertIs(f, p.CreateSolver()._path_finder)
+    self.assertEqual(1, len(f.cache))
+    self.assertTrue(f.FindNodeBackwards(n3, n2, ())[0])
+
+  def testBoundedSolverCache(self):
+    p = cfg.Program(solver_cache_size=4)
+    n1 = p.NewCFGNode("n1")
+    n2 = n1.ConnectNew("n2")
+    p.entrypoint = n1
+    x = p.NewVariable()
+    bindings = [x.AddBinding(str(i), source_set=[], where=n1)
+                for i in range(10)]
+    for b in bindings:
+      self.assertTrue(n2.HasCombination([b]))
+    cache = p.solver.cache
+    self.assertLessEqual(len(cache), 4)
+    self.assertGreater(cache.evictions, 0)
+    self.assertGreater(cache.misses, 0)
+    # Evicted states are simply solved again.
+    for b in bindings:
+      self.assertTrue(n2.HasCombination([b]))
+    self.assertLessEqual(len(cache), 4)
+
   def testHiddenConflict3(self):
     p = cfg.Program()
     n1 = p.NewCFGNode("n1")
@@ -981,5 +1030,149 @@ class CFGTest(unittest.TestCase):
     self.assertTrue(n2.HasCombination(goals))
 
 
+class ReachabilityTest(unittest.TestCase):
+  """Test the reachability index of cfg.Program."""
+
+  def testAncestors(self):
+    p = cfg.Program()
+    n1 = p.NewCFGNode("n1")
+    n2 = n1.ConnectNew("n2")
+    n3 = p.NewCFGNode("n3")
+    n4 = n3.ConnectNew("n4")
+    self.assertTrue(p.reachability.CanReach(n1, n2))
+    self.assertFalse(p.reachability.CanReach(n2, n1))
+    self.assertFalse(p.reachability.CanReach(n1, n4))
+    n2.ConnectTo(n3)
+    self.assertTrue(p.reachability.CanReach(n1, n4))
+    self.assertTrue(p.reachability.CanReach(n2, n4))
+    n4.ConnectTo(n1)  # loop
+    self.assertTrue(p.reachability.CanReach(n4, n2))
+    self.assertTrue(p.reachability.CanReach(n2, n2))
+
+  def testInvalidate(self):
+    p = cfg.Program()
+    p.reachability = cfg.Reachability(max_nodes=2)
+    n1 = p.NewCFGNode("n1")
+    n2 = n1.ConnectNew("n2")
+    self.assertTrue(p.reachability.valid)
+    n3 = n2.ConnectNew("n3")
+    self.assertFalse(p.reachability.valid)
+    x = p.NewVariable()
+    a = x.AddBinding("a", source_set=[], where=n1)
+    self.assertItemsEqual([a], x.Bindings(n3))
+    self.assertTrue(n3.CanHaveCombination([a]))
+
+  def _BuildRandomProgram(self, seed, max_nodes=None):
+    """Build a program with a random CFG and random assignments."""
+    rand = random.Random(seed)
+    p = cfg.Program()
+    p.reachability = cfg.Reachability(max_nodes)
+    nodes = [p.NewCFGNode("root")]
+    for i in range(1, 40):
+      choice = rand.random()
+      if choice < 0.7 or len(nodes) < 6:
+        nodes.append(rand.choice(nodes).ConnectNew(str(i)))
+      elif choice < 0.9:
+        join = p.NewCFGNode(str(i))
+        for n in rand.sample(nodes, 2):
+          n.ConnectTo(join)
+        nodes.append(join)
+      else:
+        rand.choice(nodes[-5:]).ConnectTo(rand.choice(nodes[:-5]))
+    variables = []
+    for _ in range(10):
+      v = p.NewVariable()
+      for i in range(rand.randint(1, 4)):
+        v.AddBinding(str(i), source_set=[], where=rand.choice(nodes))
+      variables.append(v)
+    return p, variables
+
+  def testIndexMatchesGraphWalk(self):
+    for seed in range(10):
+      p1, vars1 = self._BuildRandomProgram(seed)
+      p2, vars2 = self._BuildRandomProgram(seed, max_nodes=0)
+      self.assertTrue(p1.reachability.valid)
+      self.assertFalse(p2.reachability.valid)
+      for n1, n2 in zip(p1.cfg_nodes, p2.cfg_nodes):
+        for v1, v2 in zip(vars1, vars2):
+          self.assertEqual(sorted(b.data for b in v1.Bindings(n1)),
+                           sorted(b.data for b in v2.Bindings(n2)))
+          self.assertEqual(n1.CanHaveCombination(v1.bindings[:2]),
+                           n2.CanHaveCombination(v2.bindings[:2]))
+          self.assertEqual(
+              [n1.HasCombination([b]) for b in v1.bindings],
+              [n2.HasCombination([b]) for b in v2.bindings])
+
+
+class CompactCFGTest(CFGTest):
+  """Run the CFG tests against cfg.CompactProgram."""
+
+  def setUp(self):
+    self.original_program = cfg.Program
+    self.addCleanup(setattr, cfg, "Program", cfg.Program)
+    cfg.Program = cfg.CompactProgram
+
+  def testInternSourceSets(self):
+    p = cfg.Program()
+    n1 = p.NewCFGNode("n1")
+    n2 = n1.ConnectNew("n2")
+    x = p.NewVariable()
+    a = x.AddBinding("a", source_set=[], where=n1)
+    y = p.NewVariable()
+    b = y.AddBinding("b", source_set=[a], where=n2)
+    c = y.AddBinding("c", source_set=[a], where=n2)
+    source_set, = b.FindOrigin(n2).source_sets
+    self.assertIs(source_set, c.FindOrigin(n2).source_sets[0])
+    b.AddOrigin(n2, {a})
+    self.assertEqual(1, len(b.FindOrigin(n2).source_sets))
+
+  def testManyOrigins(self):
+    p = cfg.Program()
+    root = p.NewCFGNode("root")
+    nodes = [root.ConnectNew(str(i))
+             for i in range(2 * cfg.COMPACT_INDEX_THRESHOLD)]
+    x = p.NewVariable()
+    for node in nodes:
+      a = x.AddBinding("a", source_set=[], where=node)
+      b = x.AddBinding("b", source_set=[], where=node)
+    self.assertEqual(2, len(x.bindings))
+    self.assertEqual(len(nodes), len(a.origins))
+    for node in nodes:
+      self.assertIs(node, a.FindOrigin(node).where)
+      self.assertItemsEqual([a, b], x.Bindings(node))
+    self.assertIsNone(a.FindOrigin(root))
+
+  def testManyBindings(self):
+    p = cfg.Program()
+    n = p.NewCFGNode("n")
+    x = p.NewVariable()
+    data = [object() for _ in range(2 * cfg.COMPACT_INDEX_THRESHOLD)]
+    bindings = [x.AddBinding(d, source_set=[], where=n) for d in data]
+    self.assertEqual(bindings, [x.AddBinding(d) for d in data])
+    self.assertEqual(len(data), len(x.bindings))
+
+  def testMatchesProgram(self):
+    for seed in range(10):
+      results = []
+      for program_class in (cfg.CompactProgram, self.original_program):
+        rand = random.Random(seed)
+        p = program_class()
+        nodes = [p.NewCFGNode("root")]
+        bindings = []
+        for i in range(1, 30):
+          node = rand.choice(nodes).ConnectNew(str(i))
+          if rand.random() < 0.2:
+            node.ConnectTo(rand.choice(nodes))
+          nodes.append(node)
+          v = p.NewVariable()
+          for j in range(rand.randint(1, 3)):
+            sources = rand.sample(bindings, min(len(bindings), j))
+            bindings.append(v.AddBinding(str(j), source_set=sources,
+                                         where=rand.choice(nodes)))
+        results.append([n.HasCombination(rand.sample(bindings, 2))
+                        for n in nodes])
+      self.assertEqual(results[0], results[1])
+
+
 if __name__ == "__main__":
   unittest.main()
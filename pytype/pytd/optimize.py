@@ -26,6 +26,7 @@
 import collections
 import logging
 
+from pytype import metrics
 from pytype.pytd import abc_hierarchy
 from pytype.pytd import booleq
 from pytype.pytd import mro
@@ -134,6 +135,8 @@ class SimplifyUnions(visitors.Visitor):
     c: int or float
   """
 
+  fusable = True
+
   def VisitUnionType(self, union):
     return utils.JoinTypes(union.type_list)
 
@@ -178,6 +181,8 @@ class CombineReturnsAndExceptions(visitors.Visitor):
       raise OverflowError()
   """
 
+  fusable = True
+
   def _GroupByArguments(self, signatures):
     """Groups signatures by arguments.
 
@@ -350,6 +355,8 @@ class Factorize(visitors.Visitor):
     def f(x: int or float, y: int or float)
   """
 
+  fusable = True
+
   def _GroupByOmittedArg(self, signatures, i):
     """Group functions that are identical if you ignore one of the arguments.
 
@@ -438,6 +445,8 @@ class ApplyOptionalArguments(visitors.Visitor):
   it encompasses both declarations, hence we can omit [2].
   """
 
+  fusable = True
+
   def _HasShorterVersion(self, sig, optional_arg_sigs):
     """Find a shorter signature with optional arguments for a longer signature.
 
@@ -641,6 +650,8 @@ class CollapseLongUnions(visitors.Visitor):
       more types than this, it is shortened.
   """
 
+  fusable = True
+
   def __init__(self, max_length=7):
     assert isinstance(max_length, (int, long))
     super(CollapseLongUnions, self).__init__()
@@ -674,6 +685,8 @@ class AdjustGenericType(visitors.Visitor):
 class AdjustReturnAndConstantGenericType(visitors.Visitor):
   """Changes "object" to "Any" in return and constant types."""
 
+  fusable = True
+
   def VisitSignature(self, sig):
     return sig.Replace(return_type=sig.return_type.Visit(AdjustGenericType()))
 
@@ -1110,6 +1123,18 @@ class MergeTypeParameters(TypeParameterScope):
           visitors.ReplaceTypeParameters(substitutions)).Visit(SimplifyUnions())
 
 
+def _RunPass(node, visitor):
+  """Apply a visitor to node, in a span for tracing."""
+  if not metrics.is_tracing():
+    return node.Visit(visitor)
+  if isinstance(visitor, visitors.FusedVisitor):
+    name = "+".join(type(v).__name__ for v in visitor.visitors)
+  else:
+    name = type(visitor).__name__
+  with metrics.span("optimize_pass", visitor=name):
+    return node.Visit(visitor)
+
+
 def Optimize(node,
              builtins=None,
              lossy=False,
@@ -1139,33 +1164,38 @@ def Optimize(node,
   Returns:
     An optimized node.
   """
-  node = node.Visit(RemoveDuplicates())
-  node = node.Visit(SimplifyUnions())
-  node = node.Visit(CombineReturnsAndExceptions())
-  node = node.Visit(Factorize())
-  node = node.Visit(ApplyOptionalArguments())
-  node = node.Visit(CombineContainers())
-  node = node.Visit(SimplifyContainers())
+  node = _RunPass(node, RemoveDuplicates())
+  # Unions can't contain functions, so the function optimizations can share a
+  # traversal with SimplifyUnions.
+  node = _RunPass(node, visitors.FusedVisitor(SimplifyUnions(),
+                                              CombineReturnsAndExceptions(),
+                                              Factorize(),
+                                              ApplyOptionalArguments()))
+  node = _RunPass(node, CombineContainers())
+  node = _RunPass(node, SimplifyContainers())
   if builtins:
-    superclasses = builtins.Visit(visitors.ExtractSuperClassesByName())
-    superclasses.update(node.Visit(visitors.ExtractSuperClassesByName()))
+    superclasses = _RunPass(builtins, visitors.ExtractSuperClassesByName())
+    superclasses.update(_RunPass(node, visitors.ExtractSuperClassesByName()))
     if use_abcs:
       superclasses.update(abc_hierarchy.GetSuperClasses())
     hierarchy = SuperClassHierarchy(superclasses)
-    node = node.Visit(SimplifyUnionsWithSuperclasses(hierarchy))
+    node = _RunPass(node, SimplifyUnionsWithSuperclasses(hierarchy))
     if lossy:
-      node = node.Visit(FindCommonSuperClasses(hierarchy))
+      node = _RunPass(node, FindCommonSuperClasses(hierarchy))
   if max_union:
-    node = node.Visit(CollapseLongUnions(max_union))
-  node = node.Visit(AdjustReturnAndConstantGenericType())
+    node = _RunPass(node, visitors.FusedVisitor(
+        CollapseLongUnions(max_union), AdjustReturnAndConstantGenericType()))
+  else:
+    node = _RunPass(node, AdjustReturnAndConstantGenericType())
   if remove_mutable:
-    node = node.Visit(AbsorbMutableParameters())
-    node = node.Visit(CombineContainers())
-    node = node.Visit(MergeTypeParameters())
-    node = node.Visit(visitors.AdjustSelf(force=True))
-  node = node.Visit(SimplifyContainers())
+    node = _RunPass(node, AbsorbMutableParameters())
+    node = _RunPass(node, CombineContainers())
+    node = _RunPass(node, MergeTypeParameters())
+    node = _RunPass(node, visitors.AdjustSelf(force=True))
+  node = _RunPass(node, SimplifyContainers())
   if builtins and can_do_lookup:
-    node = visitors.LookupClasses(node, builtins)
-    node = node.Visit(RemoveInheritedMethods())
-    node = node.Visit(RemoveRedundantSignatures(hierarchy))
+    with metrics.span("optimize_pass", visitor="LookupClasses"):
+      node = visitors.LookupClasses(node, builtins)
+    node = _RunPass(node, RemoveInheritedMethods())
+    node = _RunPass(node, RemoveRedundantSignatures(hierarchy))
   return node
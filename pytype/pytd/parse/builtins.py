@@ -34,6 +34,8 @@ def _FindStdlibFile(name, extension=".pytd"):
 
 
 _cached_builtins_pytd = None  # ... => pytype.pytd.pytd.TypeDeclUnit
+# (pytd_subdir, module, python_version) => pytd.TypeDeclUnit or None
+_cached_predefined_pytd = {}
 
 
 def Precompile(filename):
@@ -44,9 +46,24 @@ def Precompile(filename):
 
 def LoadPrecompiled(filename):
   """Load precompiled builtins from the specified file."""
+  SetBuiltinsAndTyping(utils.LoadPickle(filename))
+
+
+def HasBuiltinsAndTyping():
+  """Whether GetBuiltinsAndTyping will return without parsing anything."""
+  return _cached_builtins_pytd is not None
+
+
+def SetBuiltinsAndTyping(builtins_and_typing):
+  """Set the (builtins, typing) pair returned by GetBuiltinsAndTyping.
+
+  Args:
+    builtins_and_typing: A tuple of the resolved __builtin__ and typing
+      pytd.TypeDeclUnit, e.g. loaded from a snapshot.
+  """
   global _cached_builtins_pytd
   assert _cached_builtins_pytd is None
-  _cached_builtins_pytd = utils.LoadPickle(filename)
+  _cached_builtins_pytd = builtins_and_typing
 
 
 def GetBuiltinsAndTyping():
@@ -69,10 +86,10 @@ def GetBuiltinsAndTyping():
                                           "__builtin__": b}))
     t.Visit(visitors.FillInLocalPointers({"": t, "typing": t,
                                           "__builtin__": b}))
-    b.Visit(visitors.VerifyLookup())
-    t.Visit(visitors.VerifyLookup())
-    b.Visit(visitors.VerifyContainers())
-    t.Visit(visitors.VerifyContainers())
+    b.Visit(visitors.FusedVisitor(visitors.VerifyLookup(),
+                                  visitors.VerifyContainers()))
+    t.Visit(visitors.FusedVisitor(visitors.VerifyLookup(),
+                                  visitors.VerifyContainers()))
     _cached_builtins_pytd = b, t
   return _cached_builtins_pytd
 
@@ -136,13 +153,18 @@ def ParsePredefinedPyTD(pytd_subdir, module, python_version):
   Returns:
     The AST of the module; None if the module doesn't exist in pytd_subdir.
   """
-  try:
-    src = utils.GetPredefinedFile(pytd_subdir, module)
-  except IOError:
-    return None
-  return ParsePyTD(src, filename=os.path.join(pytd_subdir, module + ".pytd"),
-                   module=module,
-                   python_version=python_version).Replace(name=module)
+  key = (pytd_subdir, module, tuple(python_version))
+  if key not in _cached_predefined_pytd:
+    try:
+      src = utils.GetPredefinedFile(pytd_subdir, module)
+    except IOError:
+      ast = None
+    else:
+      ast = ParsePyTD(src, filename=os.path.join(pytd_subdir, module + ".pytd"),
+                      module=module,
+                      python_version=python_version).Replace(name=module)
+    _cached_predefined_pytd[key] = ast
+  return _cached_predefined_pytd[key]
 
 
 # pyi for a catch-all module
@@ -228,13 +228,21 @@ _visiting = set()
 
 
 def _Visit(node, visitor, *args, **kwargs):
+  # Only pay for timing the visitor if somebody is collecting metrics.
+  if not metrics.is_enabled():
+    return _VisitNode(node, visitor, args, kwargs)
+  return _InstrumentedVisit(node, visitor, args, kwargs)
+
+
+def _InstrumentedVisit(node, visitor, args, kwargs):
+  """_VisitNode, recording the time spent in the visitor as a metric."""
   name = type(visitor).__name__
   recursive = name in _visiting
   _visiting.add(name)
 
   start = time.clock()
   try:
-    return _VisitNode(node, visitor, *args, **kwargs)
+    return _VisitNode(node, visitor, args, kwargs)
   finally:
     if not recursive:
       _visiting.remove(name)
@@ -245,7 +253,39 @@ def _Visit(node, visitor, *args, **kwargs):
             "visit_nested_" + name, metrics.Distribution).add(elapsed)
 
 
-def _VisitNode(node, visitor, *args, **kwargs):
+def _VisitChildren(node, visitor, args, kwargs):
+  """Transform the children of a node (or tuple) using a visitor.
+
+  Children that aren't tuples can't contain nodes, so they are skipped without
+  a call to _VisitNode.
+
+  Args:
+    node: A node, or a tuple found while scanning a node tree.
+    visitor: The visitor to apply.
+    args: Passed to visitor callbacks.
+    kwargs: Passed to visitor callbacks.
+
+  Returns:
+    A list of the transformed children, or None if none of them changed. In the
+    latter case, no list is allocated.
+  """
+  new_children = None
+  i = 0
+  for child in node:
+    if isinstance(child, tuple):
+      new_child = _VisitNode(child, visitor, args, kwargs)
+      if new_children is not None:
+        new_children.append(new_child)
+      elif new_child is not child:
+        new_children = list(node[:i])
+        new_children.append(new_child)
+    elif new_children is not None:
+      new_children.append(child)
+    i += 1
+  return new_children
+
+
+def _VisitNode(node, visitor, args, kwargs):
   """Transform a node and all its children using a visitor.
 
   This will iterate over all children of this node, and also process certain
@@ -272,8 +312,8 @@ def _VisitNode(node, visitor, *args, **kwargs):
           called post-order.]  A counterpart to "Enter<Name>" is "Leave<Name>",
           which is intended for any clean-up that "Enter<Name>" needs (other
           than that, it's redundant, and could be combined with "Visit<Name>").
-    *args: Passed to visitor callbacks.
-    **kwargs: Passed to visitor callbacks.
+    args: A tuple, passed to visitor callbacks as *args.
+    kwargs: A dict, passed to visitor callbacks as **kwargs.
   Returns:
     The transformed Node (which *may* be the original node but could be a new
      node, even if the contents are the same).
@@ -282,14 +322,8 @@ def _VisitNode(node, visitor, *args, **kwargs):
   if node_class is tuple:
     # Exact comparison for tuple, because classes deriving from tuple
     # (like namedtuple) have different constructor arguments.
-    changed = False
-    new_children = []
-    for child in node:
-      new_child = _VisitNode(child, visitor, *args, **kwargs)
-      if new_child is not child:
-        changed = True
-      new_children.append(new_child)
-    if changed:
+    new_children = _VisitChildren(node, visitor, args, kwargs)
+    if new_children is not None:
       # Since some of our children changed, instantiate a new node.
       return node_class(new_children)
     else:
@@ -315,14 +349,8 @@ def _VisitNode(node, visitor, *args, **kwargs):
     # Any other value returned from Enter is ignored, so check:
     assert status is None, repr((node_class_name, status))
 
-  changed = False
-  new_children = []
-  for child in node:
-    new_child = _VisitNode(child, visitor, *args, **kwargs)
-    if new_child is not child:
-      changed = True
-    new_children.append(new_child)
-  if changed:
+  new_children = _VisitChildren(node, visitor, args, kwargs)
+  if new_children is not None:
     # The constructor of namedtuple() differs from tuple(), so we have to
     # pass the current tuple using "*".
     if node_class_name in visitor.unchecked_node_names:
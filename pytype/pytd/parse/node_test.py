@@ -14,6 +14,7 @@
 
 
 import itertools
+from pytype import metrics
 from pytype.pytd.parse import node
 from pytype.pytd.parse import visitors
 import unittest
@@ -194,6 +195,30 @@ class TestNode(unittest.TestCase):
     new_v_expected = "V((Data(1, 2, -1), Data(4, 5, -1)))"
     self.assertEqual(repr(new_v), new_v_expected)
 
+  def testUnchanged(self):
+    """Test that node.Node.Visit() keeps subtrees the visitor doesn't change."""
+    x = X(Y(1, (V(2), "a")), (Data(1, 2, 3), V(4)))
+    new_x = x.Visit(DataVisitor())
+    self.assertIs(new_x.a, x.a)
+    self.assertIsNot(new_x.b, x.b)
+    self.assertIs(new_x.b[1], x.b[1])
+    self.assertEqual(repr(new_x),
+                     "X(Y(1, (V(2), 'a')), (Data(1, 2, -1), V(4)))")
+    self.assertIs(x.a.Visit(DataVisitor()), x.a)
+
+  def testVisitorMetrics(self):
+    """Test that visitors are only timed while metrics are enabled."""
+    xy = XY(V(1), Data(1, 2, 3))
+    try:
+      metrics._prepare_for_test(enabled=False)
+      xy.Visit(DataVisitor())
+      self.assertEqual("", metrics.get_report())
+      metrics._prepare_for_test(enabled=True)
+      xy.Visit(DataVisitor())
+      self.assertIn("visit_DataVisitor: total=", metrics.get_report())
+    finally:
+      metrics._prepare_for_test(enabled=False)
+
   def testOrdering(self):
     nodes = [Node1(1, 1), Node1(1, 2),
              Node2(1, 1), Node2(2, 1),
@@ -119,9 +119,14 @@ class Visitor(object):
       constructed based on the enter/visit/leave functions and precondition
       data about legal ASTs.  As an optimization, the visitor will only visit
       nodes under which some actionable node can appear.
+    fusable: Whether this visitor can share a traversal with other visitors,
+      see FusedVisitor. This requires that its Enter functions never return
+      False, that it doesn't use old_node, and that the nodes returned by its
+      Visit functions don't need to be visited again.
   """
   visits_all_node_types = False
   unchecked_node_names = set()
+  fusable = False
 
   _visitor_functions_cache = {}
 
@@ -194,6 +199,65 @@ class Visitor(object):
     self.leave_functions[node.__class__.__name__](self, node, *args, **kwargs)
 
 
+class FusedVisitor(Visitor):
+  """Applies several visitors in a single traversal.
+
+  On every node, the callbacks of the visitors are called in the order in which
+  the visitors were passed in. This is equivalent to applying the visitors one
+  after another if
+  (1) every visitor only transforms node types that can't appear below the
+      nodes visited by the visitors before it, since those would otherwise
+      already see the changes of later visitors, and
+  (2) the Enter and Leave functions of a visitor don't depend on the changes
+      made by the visitors before it, since they are called with the nodes as
+      they were before the traversal.
+  It is up to the caller to check these. All visitors must be fusable.
+  """
+
+  def __init__(self, *visitors):
+    super(FusedVisitor, self).__init__()
+    for v in visitors:
+      if not v.fusable:
+        raise ValueError("Can't fuse %s" % type(v).__name__)
+    self.visitors = visitors
+    self.visits_all_node_types = any(
+        v.visits_all_node_types for v in visitors)
+    self.unchecked_node_names = set().union(
+        *(v.unchecked_node_names for v in visitors))
+    self.enter_functions = self._Group(v.enter_functions for v in visitors)
+    self.visit_functions = self._Group(v.visit_functions for v in visitors)
+    self.leave_functions = self._Group(v.leave_functions for v in visitors)
+    if any(v.visit_class_names is ALL_NODE_NAMES for v in visitors):
+      self.visit_class_names = ALL_NODE_NAMES
+    else:
+      self.visit_class_names = set().union(
+          *(v.visit_class_names for v in visitors))
+
+  def _Group(self, functions):
+    """Map node class names to the visitors that have a function for them."""
+    groups = collections.defaultdict(list)
+    for v, fns in zip(self.visitors, functions):
+      for name in fns:
+        groups[name].append(v)
+    return dict(groups)
+
+  def Enter(self, node, *args, **kwargs):
+    for v in self.enter_functions[node.__class__.__name__]:
+      status = v.Enter(node, *args, **kwargs)
+      assert status is None, (type(v).__name__, status)
+
+  def Visit(self, node, *args, **kwargs):
+    for v in self.visitors:
+      if (v.visits_all_node_types or
+          node.__class__.__name__ in v.visit_functions):
+        node = v.Visit(node, *args, **kwargs)
+    return node
+
+  def Leave(self, node, *args, **kwargs):
+    for v in self.leave_functions[node.__class__.__name__]:
+      v.Leave(node, *args, **kwargs)
+
+
 def InventStarArgParams(existing_names):
   """Try to find names for *args, **kwargs that aren't taken already."""
   names = {x if isinstance(x, str) else x.name
@@ -865,6 +929,8 @@ def LookupClasses(target, global_module=None):
 class VerifyLookup(Visitor):
   """Utility class for testing visitors.LookupClasses."""
 
+  fusable = True
+
   def EnterNamedType(self, node):
     raise ValueError("Unreplaced NamedType: %r" % node.name)
 
@@ -876,6 +942,8 @@ class VerifyLookup(Visitor):
 class LookupBuiltins(Visitor):
   """Look up built-in NamedTypes and give them fully-qualified names."""
 
+  fusable = True
+
   def __init__(self, builtins, full_names=True):
     """Create this visitor.
 
@@ -1915,6 +1983,8 @@ class VerifyContainers(Visitor):
     ContainerError: If a problematic container definition is encountered.
   """
 
+  fusable = True
+
   def EnterGenericType(self, node):
     if not pytd.IsContainer(node.base_type.cls):
       raise ContainerError("Class %s is not a container" % node.base_type.name)
@@ -2036,6 +2106,8 @@ class ExpandCompatibleBuiltins(Visitor):
   See https://www.python.org/dev/peps/pep-0484/#the-numeric-tower
   """
 
+  fusable = True
+
   def __init__(self, builtins):
     super(ExpandCompatibleBuiltins, self).__init__()
     self.in_parameter = False
@@ -2089,6 +2161,75 @@ class ClearClassPointers(Visitor):
     node.cls = None
 
 
+class InternTypes(Visitor):
+  """Make structurally equal types share a single instance.
+
+  Types are visited bottom-up, so by the time we see a GenericType or a union,
+  its children have already been replaced by their canonical instances, and
+  the parent can be keyed on the identity of its children. Identity (rather
+  than equality) keys also keep ClassTypes pointing to different classes
+  apart, since ClassType equality ignores the class pointer.
+
+  Unresolved ClassTypes (and hence everything containing them) are left alone,
+  since visitors.FillInLocalPointers modifies those in place.
+
+  Attributes:
+    table: Maps keys to canonical nodes, and the id of each canonical node to
+      the node itself. Pass the same table to several visitors to share types
+      across trees.
+  """
+
+  def __init__(self, table=None):
+    super(InternTypes, self).__init__()
+    self.table = {} if table is None else table
+
+  def _Intern(self, node, key):
+    canonical = self.table.get(key)
+    if canonical is None:
+      canonical = self.table[key] = node
+      self.table[id(node)] = node
+    return canonical
+
+  def _ChildKey(self, children):
+    """Key a tuple of children on identity, or None if one isn't canonical."""
+    key = tuple(id(c) for c in children)
+    for c, i in zip(children, key):
+      if self.table.get(i) is not c:
+        return None
+    return key
+
+  def VisitNamedType(self, node):
+    return self._Intern(node, (pytd.NamedType, node.name))
+
+  def VisitClassType(self, node):
+    if node.cls is None:
+      return node
+    # The canonical node keeps node.cls alive, so its id can't be reused.
+    return self._Intern(node, (pytd.ClassType, node.name, id(node.cls)))
+
+  def VisitAnythingType(self, node):
+    return self._Intern(node, (pytd.AnythingType,))
+
+  def VisitNothingType(self, node):
+    return self._Intern(node, (pytd.NothingType,))
+
+  def VisitGenericType(self, node):
+    key = self._ChildKey((node.base_type,) + node.parameters)
+    if key is None:
+      return node
+    return self._Intern(node, (node.__class__,) + key)
+
+  def VisitUnionType(self, node):
+    key = self._ChildKey(node.type_list)
+    if key is None:
+      return node
+    return self._Intern(node, (node.__class__,) + key)
+
+  VisitTupleType = VisitGenericType
+  VisitCallableType = VisitGenericType
+  VisitIntersectionType = VisitUnionType
+
+
 class ReplaceWithAnyReferenceVisitor(Visitor):
   """Replace all references to modules in a list with AnythingType."""
 
@@ -1039,6 +1039,78 @@ class TestAncestorMap(unittest.TestCase):
     self.assertNotIn("AnythingType", named_type)
 
 
+class FusedVisitorTest(unittest.TestCase):
+
+  def testSingleTraversal(self):
+    class RenameX(visitors.Visitor):
+      fusable = True
+
+      def VisitNamedType(self, node):
+        return pytd.NamedType("y") if node.name == "x" else node
+
+    class CountY(visitors.Visitor):
+      fusable = True
+
+      def __init__(self):
+        super(CountY, self).__init__()
+        self.entered = 0
+        self.visited = 0
+
+      def EnterNamedType(self, _):
+        self.entered += 1
+
+      def VisitNamedType(self, node):
+        if node.name == "y":
+          self.visited += 1
+        return node
+
+    count = CountY()
+    t = pytd.GenericType(pytd.NamedType("list"), (pytd.NamedType("x"),))
+    new_t = t.Visit(visitors.FusedVisitor(RenameX(), count))
+    self.assertEqual(
+        pytd.GenericType(pytd.NamedType("list"), (pytd.NamedType("y"),)), new_t)
+    self.assertEqual(2, count.entered)
+    self.assertEqual(1, count.visited)
+
+  def testRejectUnfusable(self):
+    self.assertRaises(ValueError, visitors.FusedVisitor,
+                      visitors.VerifyLookup(), visitors.LookupLocalTypes())
+
+
+class InternTypesTest(unittest.TestCase):
+
+  def testShareEqualTypes(self):
+    cls = pytd.Class("foo", None, (), (), (), ())
+    t1 = pytd.GenericType(pytd.NamedType("list"), (pytd.ClassType("foo", cls),))
+    t2 = pytd.GenericType(pytd.NamedType("list"), (pytd.ClassType("foo", cls),))
+    table = {}
+    i1 = t1.Visit(visitors.InternTypes(table))
+    i2 = t2.Visit(visitors.InternTypes(table))
+    self.assertEqual(t1, i1)
+    self.assertIs(i1, i2)
+    self.assertIs(i1.parameters[0].cls, cls)
+
+  def testDistinguishClassPointers(self):
+    cls1 = pytd.Class("foo", None, (), (), (), ())
+    cls2 = pytd.Class("foo", None, (), (), (), ())
+    visitor = visitors.InternTypes()
+    t1 = pytd.ClassType("foo", cls1).Visit(visitor)
+    t2 = pytd.ClassType("foo", cls2).Visit(visitor)
+    self.assertIsNot(t1, t2)
+    self.assertIs(cls1, t1.cls)
+    self.assertIs(cls2, t2.cls)
+
+  def testSkipUnresolved(self):
+    visitor = visitors.InternTypes()
+    t1 = pytd.UnionType((pytd.ClassType("foo"), pytd.NamedType("bar")))
+    t2 = pytd.UnionType((pytd.ClassType("foo"), pytd.NamedType("bar")))
+    i1 = t1.Visit(visitor)
+    i2 = t2.Visit(visitor)
+    self.assertIsNot(i1, i2)
+    self.assertIsNot(i1.type_list[0], i2.type_list[0])
+    self.assertIs(i1.type_list[1], i2.type_list[1])
+
+
 class ReplaceWithAnyReferenceVisitorTest(unittest.TestCase):
 
   def testAnyReplacement(self):
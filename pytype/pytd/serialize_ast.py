@@ -1,4 +1,4 @@
-"""Converts pyi files to pickled asts and saves them to disk.
+"""Converts pyi files to serialized asts and saves them to disk.
 
 Used to speed up module importing. This is done by loading the ast and
 serializing it to disk. Further users only need to read the serialized data from
@@ -6,6 +6,10 @@ disk, which is faster to digest than a pyi file.
 """
 
 import collections
+import marshal
+import os
+import struct
+import tempfile
 
 from pytype.pytd import pytd
 from pytype.pytd import utils
@@ -20,6 +24,10 @@ class UnrestorableDependencyError(Exception):
     super(UnrestorableDependencyError, self).__init__(error_msg)
 
 
+class FormatError(Exception):
+  """If a file isn't in a binary AST format we can read."""
+
+
 class FindClassTypesVisitor(visitors.Visitor):
 
   def __init__(self):
@@ -122,12 +130,396 @@ class RenameModuleVisitor(visitors.Visitor):
   VisitNamedType = _ReplaceModuleName  # pylint: disable=invalid-name
 
 
+# The binary AST format. A file consists of
+#   _MAGIC, the format version as a little endian uint32,
+#   a sequence of marshalled (field index, item) records, one for every member
+#     of a field of the TypeDeclUnit, terminated by None,
+#   a marshalled trailer (see _BinaryAstWriter.Finish),
+#   the offset of the trailer as a little endian uint64.
+# Items are encoded as follows:
+#   str: An index into the string table.
+#   None, bool: As is.
+#   tuple: A list of the encoded elements.
+#   ClassType: (class tag, slot). All ClassTypes with the same name share a
+#     slot, and are loaded as the same object.
+#   FunctionType: (class tag, name, encoded function).
+#   Other nodes: (class tag, encoded fields...), where the class tag is an index
+#     into the class table, which stores the name and fields of every class.
+# Since records are written as they are encoded, and the tables are only
+# needed at the end, the file can be written without holding the encoded AST
+# in memory. The trailer also holds an index with the name, byte range and
+# slots of every record, so that single members can be decoded on demand (see
+# LazyTypeDeclUnit).
+_MAGIC = "PYTDAST\n"
+_FORMAT_VERSION = 2
+_HEADER = _MAGIC + struct.pack("<I", _FORMAT_VERSION)
+_TRAILER_OFFSET = struct.Struct("<Q")
+
+# The (class name, field index) pairs that RenameModuleVisitor renames.
+_RENAMED_FIELDS = {
+    "Alias": (0,),
+    "Class": (0,),
+    "Constant": (0,),
+    "ExternalFunction": (0,),
+    "Function": (0,),
+    "NamedType": (0,),
+    "TypeParameter": (3,),
+}
+
+
+def _LookupName(item):
+  """The name under which TypeDeclUnit.Lookup finds a module member."""
+  if isinstance(item, pytd.TypeParameter):
+    return item.full_name
+  return item.name
+
+
+class _BinaryAstWriter(object):
+  """Writes a pytd.TypeDeclUnit in the binary AST format."""
+
+  def __init__(self, fi):
+    self._fi = fi
+    self._strings = []
+    self._string_index = {}
+    self._classes = []
+    self._class_index = {}
+    self._slots = []
+    self._slot_index = {}
+    self._record_slots = set()
+    self._index = []
+    fi.write(_HEADER)
+
+  def _String(self, s):
+    index = self._string_index.get(s)
+    if index is None:
+      index = self._string_index[s] = len(self._strings)
+      self._strings.append(s)
+    return index
+
+  def _Class(self, cls):
+    index = self._class_index.get(cls)
+    if index is None:
+      if getattr(pytd, cls.__name__, None) is not cls:
+        raise ValueError("Can't serialize %s" % cls.__name__)
+      index = self._class_index[cls] = len(self._classes)
+      self._classes.append((cls.__name__, cls._fields))
+    return index
+
+  def _Slot(self, name):
+    index = self._slot_index.get(name)
+    if index is None:
+      index = self._slot_index[name] = len(self._slots)
+      self._slots.append(self._String(name))
+    self._record_slots.add(index)
+    return index
+
+  def _Encode(self, value):
+    if value is None or value.__class__ is bool:
+      return value
+    elif isinstance(value, basestring):
+      return self._String(value)
+    elif value.__class__ is tuple:
+      return [self._Encode(v) for v in value]
+    elif isinstance(value, pytd.ClassType):
+      return (self._Class(pytd.ClassType), self._Slot(value.name))
+    elif isinstance(value, pytd.FunctionType):
+      return (self._Class(pytd.FunctionType), self._String(value.name),
+              self._Encode(value.function))
+    elif isinstance(value, tuple):
+      return (self._Class(value.__class__),) + tuple(
+          self._Encode(v) for v in value)
+    else:
+      raise ValueError("Can't serialize %r" % (value,))
+
+  def WriteUnit(self, unit):
+    for i, field in enumerate(unit[1:]):
+      for item in field:
+        self._record_slots = set()
+        offset = self._fi.tell()
+        marshal.dump((i, self._Encode(item)), self._fi)
+        self._index.append((i, self._String(_LookupName(item)), offset,
+                            self._fi.tell() - offset,
+                            sorted(self._record_slots)))
+    marshal.dump(None, self._fi)
+
+  def Finish(self, name, dependencies):
+    offset = self._fi.tell()
+    marshal.dump((self._strings, self._classes, self._slots, name,
+                  list(dependencies), self._index), self._fi)
+    self._fi.write(_TRAILER_OFFSET.pack(offset))
+
+
+class _BinaryAstReader(object):
+  """Decodes the records of a file in the binary AST format.
+
+  Attributes:
+    name: The name of the module.
+    dependencies: The dependencies of the module.
+    class_types: The ClassType of every slot.
+    index: The (field index, name, offset, length, slots) of every record.
+  """
+
+  def __init__(self, trailer, module_name=None):
+    """Constructor.
+
+    Args:
+      trailer: The unmarshalled trailer of the file.
+      module_name: If not None, the name to load the module under. Rather than
+        running RenameModuleVisitor, the names are replaced while decoding.
+
+    Raises:
+      FormatError: If the file was written for different pytd node classes.
+    """
+    strings, class_table, slots, name, dependencies, index = trailer
+    classes = []
+    for class_name, fields in class_table:
+      cls = getattr(pytd, class_name, None)
+      if cls is None or tuple(cls._fields) != tuple(fields):
+        raise FormatError("Incompatible pytd class %s" % class_name)
+      classes.append(cls)
+    renamed_fields = {}
+    if module_name is not None and module_name != name:
+      old = name
+      renamed = [s.replace(old, module_name, 1) if s.startswith(old) else s
+                 for s in strings]
+      dependencies = [module_name if d == old else d for d in dependencies]
+      name = module_name
+      for tag, cls in enumerate(classes):
+        if cls.__name__ in _RENAMED_FIELDS:
+          renamed_fields[tag] = _RENAMED_FIELDS[cls.__name__]
+    else:
+      renamed = strings
+    tags = {cls: tag for tag, cls in enumerate(classes)}
+    class_type_tag = tags.get(pytd.ClassType)
+    function_type_tag = tags.get(pytd.FunctionType)
+    class_types = [pytd.ClassType(renamed[i]) for i in slots]
+    new = tuple.__new__
+
+    def Decode(value):
+      cls = value.__class__
+      if cls is int:
+        return strings[value]
+      elif cls is tuple:
+        tag = value[0]
+        if tag == class_type_tag:
+          return class_types[value[1]]
+        elif tag == function_type_tag:
+          return pytd.FunctionType(strings[value[1]], Decode(value[2]))
+        args = [Decode(v) for v in value[1:]]
+        if tag in renamed_fields:
+          for i in renamed_fields[tag]:
+            if value[i + 1].__class__ is int:
+              args[i] = renamed[value[i + 1]]
+        return new(classes[tag], args)
+      elif cls is list:
+        return tuple([Decode(v) for v in value])
+      else:
+        return value
+
+    self.name = name
+    self.dependencies = dependencies
+    self.class_types = class_types
+    self.index = [(field, renamed[item_name], offset, length, record_slots)
+                  for field, item_name, offset, length, record_slots in index]
+    self.Decode = Decode  # pylint: disable=invalid-name
+
+
+def _CheckVersion(header):
+  version, = struct.unpack("<I", header)
+  if version != _FORMAT_VERSION:
+    raise FormatError("Binary AST format version %d, expected %d" % (
+        version, _FORMAT_VERSION))
+
+
+def _ReadBinaryAst(fi, module_name=None):
+  """Read a SerializableAst in the binary AST format.
+
+  Args:
+    fi: A file, positioned after the magic number.
+    module_name: If not None, the name to load the module under.
+
+  Returns:
+    A SerializableAst. Its class_type_nodes contains every ClassType in the
+    ast, so ProcessAst doesn't need to walk it.
+
+  Raises:
+    FormatError: If the file was written with a different format version, or
+      for different pytd node classes.
+  """
+  _CheckVersion(fi.read(4))
+  records = []
+  record = marshal.load(fi)
+  while record is not None:
+    records.append(record)
+    record = marshal.load(fi)
+  reader = _BinaryAstReader(marshal.load(fi), module_name)
+  members = [[] for _ in pytd.TypeDeclUnit._fields[1:]]
+  for i, item in records:
+    members[i].append(reader.Decode(item))
+  ast = pytd.TypeDeclUnit(reader.name, *(tuple(m) for m in members))
+  return SerializableAst(ast, reader.dependencies, reader.class_types)
+
+
+def _MaterializedField(name):
+  return property(lambda self: getattr(self.Materialize(), name))
+
+
+class LazyTypeDeclUnit(pytd.TypeDeclUnit):
+  """A TypeDeclUnit that decodes its members from a binary AST on demand.
+
+  Lookup() only decodes the requested member (and, once ProcessAst has run,
+  the members of this module its ClassTypes point to). Accessing any of the
+  member fields, visiting or replacing the unit decodes all of it, after which
+  this object delegates to a regular TypeDeclUnit.
+  """
+
+  def __new__(cls, reader, data):
+    return tuple.__new__(cls, (reader.name, (), (), (), (), ()))
+
+  def __init__(self, reader, data):  # pylint: disable=super-init-not-called
+    """Constructor.
+
+    Args:
+      reader: A _BinaryAstReader for the trailer of the file.
+      data: The contents of the file, as a string. Dropped once the unit is
+        fully decoded.
+    """
+    self._reader = reader
+    self._data = data
+    self._record_by_name = {}
+    for i, entry in enumerate(reader.index):
+      self._record_by_name.setdefault(entry[1], i)
+    self._items = {}
+    self._class_lookup = None
+    self._unit = None
+
+  constants = _MaterializedField("constants")
+  type_params = _MaterializedField("type_params")
+  classes = _MaterializedField("classes")
+  functions = _MaterializedField("functions")
+  aliases = _MaterializedField("aliases")
+
+  def _Resolve(self, i, item):
+    """Fill in the ClassType pointers of a decoded record."""
+    lookup = self._class_lookup
+    visit = False
+    for slot in self._reader.index[i][4]:
+      node = self._reader.class_types[slot]
+      if node.cls is None:
+        try:
+          if node is not lookup.VisitClassType(node):
+            visit = True
+        except KeyError as e:
+          raise UnrestorableDependencyError("Unresolved class: %r." % e.message)
+    if visit:
+      try:
+        item = self._items[i] = item.Visit(lookup)
+      except KeyError as e:
+        raise UnrestorableDependencyError("Unresolved class: %r." % e.message)
+    return item
+
+  def _Item(self, i):
+    """Decode record i, or return it if it was already decoded."""
+    try:
+      return self._items[i]
+    except KeyError:
+      pass
+    _, _, offset, length, _ = self._reader.index[i]
+    _, encoded = marshal.loads(self._data[offset:offset + length])
+    # Store the item before resolving its ClassTypes, which might refer back to
+    # it.
+    item = self._items[i] = self._reader.Decode(encoded)
+    if self._class_lookup is not None:
+      item = self._Resolve(i, item)
+    return item
+
+  def SetClassLookup(self, class_lookup):
+    """Resolve ClassTypes using class_lookup, now and whenever decoding."""
+    self._class_lookup = class_lookup
+    for i, item in self._items.items():
+      self._Resolve(i, item)
+
+  def Lookup(self, name):
+    if self._unit is not None:
+      return self._unit.Lookup(name)
+    return self._Item(self._record_by_name[name])
+
+  def MemberMap(self):
+    """A mapping from short names to members, which decodes on access."""
+    return _LazyMemberMap(self)
+
+  def MemberNames(self):
+    return [entry[1] for entry in self._reader.index]
+
+  def Materialize(self):
+    """Decode all members.
+
+    Returns:
+      A pytd.TypeDeclUnit with all members of this module.
+    """
+    if self._unit is None:
+      members = [[] for _ in pytd.TypeDeclUnit._fields[1:]]
+      for i, entry in enumerate(self._reader.index):
+        members[entry[0]].append(self._Item(i))
+      self._unit = pytd.TypeDeclUnit(self.name, *(tuple(m) for m in members))
+      self._data = self._items = None
+    return self._unit
+
+  def Visit(self, visitor, *args, **kwargs):
+    return self.Materialize().Visit(visitor, *args, **kwargs)
+
+  def Replace(self, **kwargs):
+    return self.Materialize().Replace(**kwargs)
+
+  def __reduce__(self):
+    return pytd.TypeDeclUnit, tuple(self.Materialize())
+
+
+class _LazyMemberMap(collections.Mapping):
+  """Maps the short names of the members of a LazyTypeDeclUnit to members."""
+
+  def __init__(self, unit):
+    self._unit = unit
+    self._names = {name.rsplit(".")[-1]: name for name in unit.MemberNames()}
+
+  def __getitem__(self, short_name):
+    return self._unit.Lookup(self._names[short_name])
+
+  def __iter__(self):
+    return iter(self._names)
+
+  def __len__(self):
+    return len(self._names)
+
+
+def _LoadBinaryAstLazily(fi, module_name=None):
+  """Read a file in the binary AST format, and return a lazy SerializableAst.
+
+  The encoded records are kept in memory rather than mapped, so that a
+  LazyTypeDeclUnit doesn't hold a file descriptor until it's materialized.
+
+  Args:
+    fi: A file, positioned after the magic number.
+    module_name: If not None, the name to load the module under.
+
+  Returns:
+    A SerializableAst with a LazyTypeDeclUnit.
+  """
+  data = _MAGIC + fi.read()
+  _CheckVersion(data[len(_MAGIC):len(_HEADER)])
+  offset, = _TRAILER_OFFSET.unpack(data[-_TRAILER_OFFSET.size:])
+  reader = _BinaryAstReader(
+      marshal.loads(data[offset:-_TRAILER_OFFSET.size]), module_name)
+  return SerializableAst(LazyTypeDeclUnit(reader, data), reader.dependencies,
+                         reader.class_types)
+
+
 def StoreAst(ast, filename):
   """Loads and stores an ast to disk.
 
   Args:
     ast: The pytd.TypeDeclUnit to save to disk.
-    filename: The filename for the pickled output
+    filename: The filename for the serialized output
 
   Returns:
     True iff the save operation was successful.
@@ -140,17 +532,63 @@ def StoreAst(ast, filename):
   ast.Visit(deps)
   dependencies = deps.modules or set()
 
-  # Clean external references
-  ast.Visit(visitors.ClearClassPointers())
-  indexer = FindClassTypesVisitor()
-  ast.Visit(indexer)
-  utils.SavePickle(SerializableAst(
-      ast, list(sorted(dependencies)),
-      list(sorted(indexer.class_type_nodes))),
-                   filename)
+  # ClassTypes are stored by name only, so, unlike with pickles, the ast doesn't
+  # need its class pointers cleared, and stays usable.
+  # Write to a temporary file and move it into place, so that readers which
+  # opened an older version of the file keep seeing it intact, and processes
+  # writing the same file concurrently don't interfere. See also
+  # pytype.utils.atomic_write.
+  fd, tmp_filename = tempfile.mkstemp(
+      dir=os.path.dirname(filename) or None, prefix=".tmp")
+  renamed = False
+  try:
+    with os.fdopen(fd, "wb") as fi:
+      writer = _BinaryAstWriter(fi)
+      writer.WriteUnit(ast)
+      writer.Finish(ast.name, sorted(dependencies))
+    os.rename(tmp_filename, filename)
+    renamed = True
+  finally:
+    if not renamed:
+      os.unlink(tmp_filename)
   return True
 
 
+def LoadAst(filename, module_name=None, lazy=False):
+  """Load an ast stored by StoreAst.
+
+  Pickled asts, as written by earlier versions of StoreAst, are loaded, too.
+
+  Args:
+    filename: The file to load.
+    module_name: If not None, the name under which to load the module.
+    lazy: If True, return a LazyTypeDeclUnit,
+      which only decodes the members that are looked up. Pickles are always
+      loaded completely.
+
+  Returns:
+    A SerializableAst, to be passed to ProcessAst. If the module was renamed,
+    its dependencies are, too.
+
+  Raises:
+    FormatError: If the file is in an incompatible version of the binary
+      format.
+  """
+  with open(filename, "rb") as fi:
+    if fi.read(len(_MAGIC)) == _MAGIC:
+      if lazy:
+        return _LoadBinaryAstLazily(fi, module_name)
+      return _ReadBinaryAst(fi, module_name)
+  serializable_ast = utils.LoadPickle(filename)
+  old_name = serializable_ast.ast.name
+  if module_name is None or module_name == old_name:
+    return serializable_ast
+  serializable_ast = EnsureAstName(serializable_ast, module_name)
+  return serializable_ast.Replace(dependencies=[
+      module_name if d == old_name else d
+      for d in serializable_ast.dependencies])
+
+
 def EnsureAstName(ast, module_name):
   """Rename the serializable_ast if the name is different from module_name.
 
@@ -203,6 +641,10 @@ def ProcessAst(serializable_ast, module_map):
   # Notice that this is also resolving local ClassType references.
   class_lookup = visitors.LookupExternalTypes(module_map, full_names=True,
                                               self_name=None)
+  if isinstance(raw_ast, LazyTypeDeclUnit):
+    # The references are filled in as members are decoded.
+    raw_ast.SetClassLookup(class_lookup)
+    return raw_ast
 
   if serializable_ast.class_type_nodes:
     for node in serializable_ast.class_type_nodes:
@@ -249,8 +691,9 @@ def PrepareForExport(module_name, python_version, ast):
   ast = pytd_builtins.ParsePyTD(src=src, module=module_name,
                                 python_version=python_version)
   builtins, _ = pytd_builtins.GetBuiltinsAndTyping()
-  ast = ast.Visit(visitors.LookupBuiltins(builtins, full_names=False))
-  ast = ast.Visit(visitors.ExpandCompatibleBuiltins(builtins))
+  ast = ast.Visit(visitors.FusedVisitor(
+      visitors.LookupBuiltins(builtins, full_names=False),
+      visitors.ExpandCompatibleBuiltins(builtins)))
   ast = ast.Visit(visitors.LookupLocalTypes())
   ast = ast.Visit(visitors.AdjustTypeParameters())
   ast = ast.Visit(visitors.NamedTypeToClassType())
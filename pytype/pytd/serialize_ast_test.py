@@ -1,5 +1,4 @@
 import os
-import pickle
 
 from pytype import config
 from pytype import load_pytd
@@ -77,7 +76,7 @@ class SerializeAstTest(unittest.TestCase):
       pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
       module_map = self._StoreAst(d, module_name, pickled_ast_filename)
       del module_map[module_name]
-      serialized_ast = pytd_utils.LoadPickle(pickled_ast_filename)
+      serialized_ast = serialize_ast.LoadAst(pickled_ast_filename)
 
       # The sorted makes the testcase more deterministic.
       serialized_ast = serialized_ast.Replace(class_type_nodes=sorted(
@@ -129,7 +128,7 @@ class SerializeAstTest(unittest.TestCase):
     _, param2 = signature.params
     self.assertEqual(param2.type.scope, "other.name.SomeClass")
 
-  def testPickle(self):
+  def testStoreAndLoad(self):
     with utils.Tempdir() as d:
       ast, _ = self._GetAst(temp_dir=d, module_name="foo.bar.module1")
       pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
@@ -137,11 +136,54 @@ class SerializeAstTest(unittest.TestCase):
       result = serialize_ast.StoreAst(ast, pickled_ast_filename)
 
       self.assertTrue(result)
-      with open(pickled_ast_filename, "rb") as fi:
-        serialized_ast = pickle.load(fi)
+      serialized_ast = serialize_ast.LoadAst(pickled_ast_filename)
       self.assertTrue(serialized_ast.ast)
       self.assertEqual(serialized_ast.dependencies,
                        ["__builtin__", "foo.bar.module1", "module2"])
+      self.assertTrue(ast.ASTeq(serialized_ast.ast))
+
+  def testLoadSharesClassTypes(self):
+    with utils.Tempdir() as d:
+      pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
+      self._StoreAst(d, "module1", pickled_ast_filename)
+      serialized_ast = serialize_ast.LoadAst(pickled_ast_filename)
+    indexer = serialize_ast.FindClassTypesVisitor()
+    serialized_ast.ast.Visit(indexer)
+    self.assertItemsEqual(set(map(id, indexer.class_type_nodes)),
+                          map(id, serialized_ast.class_type_nodes))
+
+  def testLoadRenamesDependencies(self):
+    with utils.Tempdir() as d:
+      pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
+      self._StoreAst(d, "foo.bar.module1", pickled_ast_filename)
+      serialized_ast = serialize_ast.LoadAst(pickled_ast_filename, "baz")
+    self.assertEqual("baz", serialized_ast.ast.name)
+    self.assertEqual(serialized_ast.dependencies,
+                     ["__builtin__", "baz", "module2"])
+
+  def testLoadPickle(self):
+    with utils.Tempdir() as d:
+      ast, _ = self._GetAst(temp_dir=d, module_name="module1")
+      pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
+      pytd_utils.SavePickle(serialize_ast.SerializableAst(
+          ast, ["__builtin__", "module1", "module2"], None),
+                            pickled_ast_filename)
+      serialized_ast = serialize_ast.LoadAst(pickled_ast_filename, "foo")
+    self.assertEqual("foo", serialized_ast.ast.name)
+    self.assertEqual(serialized_ast.dependencies,
+                     ["__builtin__", "foo", "module2"])
+
+  def testIncompatibleVersion(self):
+    with utils.Tempdir() as d:
+      pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
+      self._StoreAst(d, "module1", pickled_ast_filename)
+      with open(pickled_ast_filename, "r+b") as fi:
+        fi.seek(len(serialize_ast._MAGIC))
+        fi.write("\xff")
+      with self.assertRaises(serialize_ast.FormatError):
+        serialize_ast.LoadAst(pickled_ast_filename)
+      with self.assertRaises(serialize_ast.FormatError):
+        serialize_ast.LoadAst(pickled_ast_filename, lazy=True)
 
   def testLoadTopLevel(self):
     """Tests that a pickled file can be read."""
@@ -152,7 +194,7 @@ class SerializeAstTest(unittest.TestCase):
       original_ast = module_map[module_name]
       del module_map[module_name]
       loaded_ast = serialize_ast.ProcessAst(
-          pytd_utils.LoadPickle(pickled_ast_filename),
+          serialize_ast.LoadAst(pickled_ast_filename),
           module_map)
 
       self.assertTrue(loaded_ast)
@@ -175,7 +217,7 @@ class SerializeAstTest(unittest.TestCase):
       del module_map[module_name]
 
       loaded_ast = serialize_ast.ProcessAst(
-          pytd_utils.LoadPickle(pickled_ast_filename),
+          serialize_ast.LoadAst(pickled_ast_filename),
           module_map)
 
       self.assertTrue(loaded_ast)
@@ -193,7 +235,7 @@ class SerializeAstTest(unittest.TestCase):
 
       with self.assertRaises(serialize_ast.UnrestorableDependencyError):
         serialize_ast.ProcessAst(
-            pytd_utils.LoadPickle(pickled_ast_filename),
+            serialize_ast.LoadAst(pickled_ast_filename),
             module_map)
 
   def testUnrestorableDependencyErrorWithoutModuleIndex(self):
@@ -203,7 +245,7 @@ class SerializeAstTest(unittest.TestCase):
       module_map = self._StoreAst(d, module_name, pickled_ast_filename)
       module_map = {}  # Remove module2
 
-      loaded_ast = pytd_utils.LoadPickle(pickled_ast_filename)
+      loaded_ast = serialize_ast.LoadAst(pickled_ast_filename)
       loaded_ast.modified_class_types = None  # Remove the index
       with self.assertRaises(serialize_ast.UnrestorableDependencyError):
         serialize_ast.ProcessAst(loaded_ast, module_map)
@@ -217,9 +259,8 @@ class SerializeAstTest(unittest.TestCase):
       del module_map[original_module_name]
 
       new_module_name = "wurstbrot.module2"
-      serializable_ast = pytd_utils.LoadPickle(pickled_ast_filename)
-      serializable_ast = serialize_ast.EnsureAstName(
-          serializable_ast, new_module_name)
+      serializable_ast = serialize_ast.LoadAst(pickled_ast_filename,
+                                               new_module_name)
       loaded_ast = serialize_ast.ProcessAst(serializable_ast, module_map)
 
       self.assertTrue(loaded_ast)
@@ -230,13 +271,79 @@ class SerializeAstTest(unittest.TestCase):
       ast_new_module, _ = self._GetAst(temp_dir=d, module_name=new_module_name)
       self.assertTrue(ast_new_module.ASTeq(loaded_ast))
 
+  def testLazyLoad(self):
+    with utils.Tempdir() as d:
+      module_name = "foo.bar.module1"
+      pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
+      module_map = self._StoreAst(d, module_name, pickled_ast_filename)
+      original_ast = module_map.pop(module_name)
+      loaded_ast = serialize_ast.ProcessAst(
+          serialize_ast.LoadAst(pickled_ast_filename, lazy=True), module_map)
+      self.assertIsInstance(loaded_ast, serialize_ast.LazyTypeDeclUnit)
+      self.assertEqual(loaded_ast.name, module_name)
+      cls = loaded_ast.Lookup("foo.bar.module1.SomeClass")
+      self.assertEqual(cls, original_ast.Lookup("foo.bar.module1.SomeClass"))
+      self.assertItemsEqual(loaded_ast._items, [
+          loaded_ast._record_by_name["foo.bar.module1.SomeClass"]])
+      init, = cls.methods
+      _, param = init.signatures[0].params
+      self.assertIs(param.type.cls, module_map["module2"].Lookup(
+          "module2.ObjectMod2"))
+      self.assertRaises(KeyError, loaded_ast.Lookup, "foo.bar.module1.x1")
+      self.assertTrue(original_ast.ASTeq(loaded_ast))
+      self.assertIs(cls, loaded_ast.Lookup("foo.bar.module1.SomeClass"))
+      loaded_ast.Visit(visitors.VerifyLookup())
+
+  def testLazyLoadDoesNotKeepFile(self):
+    with utils.Tempdir() as d:
+      pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
+      module_map = self._StoreAst(d, "module1", pickled_ast_filename)
+      original_ast = module_map.pop("module1")
+      loaded_ast = serialize_ast.ProcessAst(
+          serialize_ast.LoadAst(pickled_ast_filename, lazy=True), module_map)
+      # Members are decoded from what was read, not from the file.
+      with open(pickled_ast_filename, "wb") as fi:
+        fi.write("garbage")
+      self.assertEqual(loaded_ast.Lookup("module1.SomeClass"),
+                       original_ast.Lookup("module1.SomeClass"))
+
+  def testLazyLoadWithDifferentModuleName(self):
+    with utils.Tempdir() as d:
+      pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
+      module_map = self._StoreAst(d, "module1", pickled_ast_filename)
+      del module_map["module1"]
+      loaded_ast = serialize_ast.ProcessAst(
+          serialize_ast.LoadAst(pickled_ast_filename, "wurstbrot.module2",
+                                lazy=True), module_map)
+      self.assertEqual(loaded_ast.name, "wurstbrot.module2")
+      cls = loaded_ast.Lookup("wurstbrot.module2.SomeClass")
+      self.assertEqual(cls.name, "wurstbrot.module2.SomeClass")
+      self.assertItemsEqual(
+          loaded_ast.MemberMap(),
+          ["constant", "x", "b", "SomeClass", "ModuleFunction"])
+      ast_new_module, _ = self._GetAst(temp_dir=d,
+                                       module_name="wurstbrot.module2")
+      self.assertTrue(ast_new_module.ASTeq(loaded_ast))
+
+  def testLazyLoadUnrestorableDependency(self):
+    with utils.Tempdir() as d:
+      pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
+      module_map = self._StoreAst(d, "module1", pickled_ast_filename)
+      del module_map["module1"]
+      del module_map["module2"]
+      loaded_ast = serialize_ast.ProcessAst(
+          serialize_ast.LoadAst(pickled_ast_filename, lazy=True), module_map)
+      loaded_ast.Lookup("module1.constant")
+      with self.assertRaises(serialize_ast.UnrestorableDependencyError):
+        loaded_ast.Lookup("module1.SomeClass")
+
   def testStoreRemovesInit(self):
     with utils.Tempdir() as d:
       original_module_name = "module1.__init__"
       pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
 
       module_map = self._StoreAst(d, original_module_name, pickled_ast_filename)
-      serializable_ast = pytd_utils.LoadPickle(pickled_ast_filename)
+      serializable_ast = serialize_ast.LoadAst(pickled_ast_filename)
 
       expected_name = "module1"
       # Check that the module had the expected name before.
@@ -110,11 +110,15 @@ class Typeshed(object):
 
 
 _typeshed = None
+_parsed = {}  # (pyi_subdir, module, python_version) => TypeDeclUnit or None
 
 
 def parse_type_definition(pyi_subdir, module, python_version):
   """Load and parse a *.pyi from typeshed.
 
+  Parsed modules are cached for the lifetime of the process. This is safe
+  since the parser doesn't create any mutable nodes.
+
   Args:
     pyi_subdir: the directory where the module should be found
     module: the module name (without any file extension)
@@ -127,11 +131,17 @@ def parse_type_definition(pyi_subdir, module, python_version):
   if _typeshed is None:
     _typeshed = Typeshed()
 
-  try:
-    filename, src = _typeshed.get_module_file(pyi_subdir,
-                                              module,
-                                              python_version)
-  except IOError:
-    return None
-  return builtins.ParsePyTD(src, filename=filename, module=module,
-                            python_version=python_version).Replace(name=module)
+  key = (pyi_subdir, module, tuple(python_version))
+  if key not in _parsed:
+    try:
+      filename, src = _typeshed.get_module_file(pyi_subdir,
+                                                module,
+                                                python_version)
+    except IOError:
+      ast = None
+    else:
+      ast = builtins.ParsePyTD(src, filename=filename, module=module,
+                               python_version=python_version).Replace(
+                                   name=module)
+    _parsed[key] = ast
+  return _parsed[key]
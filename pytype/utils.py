@@ -384,6 +384,32 @@ def _makedirs(path):
       raise
 
 
+def atomic_write(path, data):
+  """Write data to a file, such that readers never see a partial file.
+
+  The data is written to a temporary file in the same directory, which is
+  then renamed to path. This makes it safe for several processes to populate
+  the same cache directory concurrently.
+
+  Args:
+    path: The destination filename.
+    data: A (binary) string.
+  """
+  directory = os.path.dirname(path)
+  if directory:
+    _makedirs(directory)
+  fd, tmp_path = tempfile.mkstemp(dir=directory or None, prefix=".tmp")
+  renamed = False
+  try:
+    with os.fdopen(fd, "wb") as fi:
+      fi.write(data)
+    os.rename(tmp_path, path)
+    renamed = True
+  finally:
+    if not renamed:
+      os.unlink(tmp_path)
+
+
 class Tempdir(object):
   """Context handler for creating temporary directories."""
 
@@ -543,11 +569,13 @@ class MonitorDict(dict):
   This dictionary takes arbitrary objects as keys and cfg.Variable objects as
   values. It increments a changestamp whenever a new value is added or more data
   is merged into a value. The changestamp is unaffected by the addition of
-  another origin for existing data.
+  another origin for existing data. Callbacks registered through watch() are
+  called (once) on the next change.
   """
 
   def __init__(self, *args, **kwargs):
     self.changestamp = 0
+    self._watchers = {}
     super(MonitorDict, self).__init__(*args, **kwargs)
     for var in self.values():
       var.RegisterChangeListener(self._changed)
@@ -561,8 +589,23 @@ class MonitorDict(dict):
     var.RegisterChangeListener(self._changed)
     self._changed()
 
+  def watch(self, key, callback):
+    """Call callback the next time this dictionary changes.
+
+    Args:
+      key: Identifies the watcher. Watching again with the same key replaces
+        the previous callback.
+      callback: A function without arguments.
+    """
+    self._watchers[key] = callback
+
   def _changed(self):
     self.changestamp += 1
+    if self._watchers:
+      watchers = self._watchers
+      self._watchers = {}
+      for callback in watchers.values():
+        callback()
 
   @property
   def data(self):
@@ -514,6 +514,16 @@ class UtilsTest(unittest.TestCase):
     self.assertEqual(d.changestamp, changestamp)
     changestamp = d.changestamp
 
+  def testMonitorDictWatch(self):
+    d = utils.MonitorDict()
+    calls = []
+    d.watch("w", lambda: calls.append("w"))
+    var = self.prog.NewVariable()
+    d["key"] = var
+    self.assertEqual(["w"], calls)
+    var.AddBinding("data")  # Watchers are only called once.
+    self.assertEqual(["w"], calls)
+
   def testAliasingDict(self):
     d = utils.AliasingDict()
     # To avoid surprising behavior, we require desired dict functionality to be
@@ -26,6 +26,7 @@ from pytype import abstract
 from pytype import annotations_util
 from pytype import attribute
 from pytype import blocks
+from pytype import bytecode_cache
 from pytype import collections_overlay
 from pytype import compare
 from pytype import convert
@@ -184,7 +185,10 @@ class VirtualMachine(object):
     self.frames = []  # The call stack of frames.
     self.functions_with_late_annotations = []
     self.frame = None  # The current frame.
-    self.program = typegraph.Program()
+    if options.compact_typegraph:
+      self.program = typegraph.CompactProgram()
+    else:
+      self.program = typegraph.Program()
     self.root_cfg_node = self.program.NewCFGNode("root")
     self.program.entrypoint = self.root_cfg_node
     self.annotations_util = annotations_util.AnnotationsUtil(self)
@@ -197,6 +201,17 @@ class VirtualMachine(object):
     self.filename = None
     self.director = None
     self.reading_builtins = False
+    self._instrument_opcodes = True
+    # Subclasses (e.g. infer.CallTracer) might override byte_* methods, so
+    # every class gets its own table.
+    cls = self.__class__
+    if "_dispatch_table" not in cls.__dict__:
+      cls._dispatch_table = cls._build_dispatch_table()
+    if options.cache_dir:
+      self.bytecode_cache = bytecode_cache.BytecodeCache(
+          os.path.join(options.cache_dir, "bytecode"))
+    else:
+      self.bytecode_cache = None
 
     # Map from builtin names to canonical objects.
     self.special_builtins = {
@@ -218,6 +233,9 @@ class VirtualMachine(object):
 
     # Memoize which overlays are loaded.
     self.loaded_overlays = {}
+    # Used by abstract.InterpreterFunction.make_function. This lives on the VM,
+    # so that functions don't outlive the VM (and program) they belong to.
+    self.function_cache = {}
 
   def lookup_builtin(self, name):
     try:
@@ -244,16 +262,17 @@ class VirtualMachine(object):
       FrameState right after this instruction that should roll over to the
       subsequent instruction.
     """
-    _opcode_counter.inc(op.name)
     self.frame.current_opcode = op
-    if log.isEnabledFor(logging.INFO):
+    if self._instrument_opcodes:
+      _opcode_counter.inc(op.name)
+      self.trace_opcode(op)
       self.log_opcode(op, state)
     try:
       # dispatch
-      bytecode_fn = getattr(self, "byte_%s" % op.name, None)
+      bytecode_fn = self._dispatch_table.get(op.__class__)
       if bytecode_fn is None:
         raise VirtualMachineError("Unknown opcode: %s" % op.name)
-      state = bytecode_fn(state, op)
+      state = bytecode_fn(self, state, op)
     except RecursionException as e:
       # This is not an error - it just means that the block we're analyzing
       # goes into a recursion, and we're already two levels deep.
@@ -269,6 +288,18 @@ class VirtualMachine(object):
     self.frame.current_opcode = None
     return state
 
+  @classmethod
+  def _build_dispatch_table(cls):
+    """Map every opcode class to the byte_* method implementing it."""
+    table = {}
+    for opcode_class in opcodes.__dict__.values():
+      if (isinstance(opcode_class, type) and
+          issubclass(opcode_class, opcodes.Opcode)):
+        method = getattr(cls, "byte_%s" % opcode_class.__name__, None)
+        if method is not None:
+          table[opcode_class] = method.__func__
+    return table
+
   def join_cfg_nodes(self, nodes):
     assert nodes
     if len(nodes) == 1:
@@ -283,6 +314,9 @@ class VirtualMachine(object):
 
   def run_frame(self, frame, node):
     """Run a frame (typically belonging to a method)."""
+    # Only pay for per-opcode metrics and logging if somebody is listening.
+    self._instrument_opcodes = (metrics.is_enabled() or
+                                log.isEnabledFor(logging.INFO))
     self.push_frame(frame)
     frame.states[frame.f_code.co_code[0]] = frame_state.FrameState.init(node,
                                                                         self)
@@ -644,11 +678,33 @@ class VirtualMachine(object):
     return node, val
 
   def compile_src(self, src, filename=None, mode="exec"):
-    code = pyc.compile_src(
-        src, python_version=self.python_version,
-        python_exe=self.options.python_exe,
-        filename=filename, mode=mode)
-    return blocks.process_code(code)
+    """Compile source code and order its bytecode into blocks.
+
+    If we have a bytecode cache, look up the result there first.
+
+    Args:
+      src: Python source code.
+      filename: The filename the sourcecode is from.
+      mode: "exec", "eval" or "single".
+
+    Returns:
+      A blocks.OrderedCode instance.
+    """
+    with metrics.span("compile", filename=filename):
+      if self.bytecode_cache:
+        key = self.bytecode_cache.key(src, filename, mode, self.python_version,
+                                      self.options.python_exe)
+        code = self.bytecode_cache.get(key)
+        if code is not None:
+          return code
+      code = pyc.compile_src(
+          src, python_version=self.python_version,
+          python_exe=self.options.python_exe,
+          filename=filename, mode=mode)
+      code = blocks.process_code(code)
+      if self.bytecode_cache:
+        self.bytecode_cache.put(key, code)
+      return code
 
   def run_bytecode(self, node, code, f_globals=None, f_locals=None):
     frame = self.make_frame(node, code, f_globals=f_globals, f_locals=f_locals)
@@ -705,7 +761,8 @@ class VirtualMachine(object):
     self.maximum_depth = sys.maxint if maximum_depth is None else maximum_depth
     node = self.root_cfg_node.ConnectNew("builtins")
     if run_builtins:
-      node, f_globals, f_locals = self.preload_builtins(node)
+      with metrics.span("preload_builtins"):
+        node, f_globals, f_locals = self.preload_builtins(node)
     else:
       node, f_globals, f_locals = node, None, None
 
@@ -887,6 +944,14 @@ class VirtualMachine(object):
   def trace_functiondef(self, *args):
     return NotImplemented
 
+  def trace_opcode(self, *args):
+    """Fired for every opcode, if opcodes are instrumented. See run_frame."""
+    return NotImplemented
+
+  def trace_call_cache_hit(self, *args):
+    """Fired whenever InterpreterFunction._call_cache answers a call."""
+    return NotImplemented
+
   def trace_namedtuple(self, *args):
     return NotImplemented
 
@@ -182,6 +182,20 @@ class BytecodeTest(test_inference.InferenceTest):
       pass  # The code we test throws an exception. Ignore it.
     self.assertItemsEqual(self.trace_vm.instructions_executed, [0, 1, 5, 6])
 
+  def test_dispatch_to_overridden_method(self):
+    stores = []
+    class StoreTracingVM(TraceVM):
+      def byte_STORE_NAME(self, state, op):
+        stores.append(op.pretty_arg)
+        return super(StoreTracingVM, self).byte_STORE_NAME(state, op)
+    v = StoreTracingVM(self.options, self.loader)
+    v.run_program("x = 1\ny = 2\n", "", maximum_depth=10, run_builtins=False)
+    self.assertEqual(["x", "y"], stores)
+    # The base class still dispatches to its own implementation.
+    self.trace_vm.run_program("z = 3\n", "", maximum_depth=10,
+                              run_builtins=False)
+    self.assertEqual(["x", "y"], stores)
+
 
 if __name__ == "__main__":
   test_inference.main()